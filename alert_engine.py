@@ -0,0 +1,406 @@
+import bisect
+import hashlib
+import hmac
+import logging
+import math
+import os
+import secrets
+import sqlite3
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from history_store import DEFAULT_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# Métricas vigilables: precio consolidado, variación % en una ventana y spread entre exchanges
+RULE_KINDS = ('price', 'change', 'spread')
+DIRECTIONS = ('above', 'below')
+# Ventana máxima de las reglas 'change' (segundos)
+MAX_WINDOW = 24 * 3600
+# Reglas activas que puede tener un mismo propietario
+MAX_RULES_PER_OWNER = 100
+# Clave para firmar los tokens de propietario; sin ella se genera una y se guarda
+# en la base de datos (compartida por todos los procesos)
+ALERT_SECRET = os.environ.get('CRIPTOVIEW_ALERT_SECRET')
+
+
+class ThresholdIndex:
+    """Umbrales ordenados de las reglas de una métrica de un símbolo.
+
+    Al pasar la métrica de `previous` a `current` solo se miran, por
+    bisección, las reglas cuyo umbral queda entre ambos valores: las que se
+    han cruzado en este tick. El coste no depende del número total de reglas.
+    """
+
+    def __init__(self):
+        # dirección -> (umbrales ordenados, ids de regla en el mismo orden)
+        self.sides: Dict[str, Tuple[List[float], List[int]]] = {direction: ([], []) for direction in DIRECTIONS}
+
+    def __len__(self):
+        return sum(len(thresholds) for thresholds, _ in self.sides.values())
+
+    def add(self, rule_id: int, direction: str, threshold: float):
+        thresholds, ids = self.sides[direction]
+        index = bisect.bisect_right(thresholds, threshold)
+        thresholds.insert(index, threshold)
+        ids.insert(index, rule_id)
+
+    def remove(self, rule_id: int, direction: str, threshold: float):
+        thresholds, ids = self.sides[direction]
+        index = bisect.bisect_left(thresholds, threshold)
+        while index < len(ids) and thresholds[index] == threshold:
+            if ids[index] == rule_id:
+                del thresholds[index]
+                del ids[index]
+                return
+            index += 1
+
+    def crossed(self, previous: float, current: float) -> List[int]:
+        """Reglas cruzadas: 'above' con umbral en (previous, current], 'below' en [current, previous)."""
+        if current > previous:
+            thresholds, ids = self.sides['above']
+            return ids[bisect.bisect_right(thresholds, previous):bisect.bisect_right(thresholds, current)]
+        if current < previous:
+            thresholds, ids = self.sides['below']
+            return ids[bisect.bisect_left(thresholds, current):bisect.bisect_left(thresholds, previous)]
+        return []
+
+
+class PriceWindow:
+    """Precios recientes de un símbolo para calcular la variación en una ventana."""
+
+    def __init__(self):
+        self.times: List[float] = []
+        self.prices: List[float] = []
+
+    def add(self, timestamp: float, price: float, keep: float):
+        if self.times and timestamp <= self.times[-1]:
+            return
+        self.times.append(timestamp)
+        self.prices.append(price)
+        # Recortar por bloques: borrar del principio de una lista es O(n)
+        cutoff = bisect.bisect_left(self.times, timestamp - keep) - 1
+        if cutoff > 64 and cutoff > len(self.times) // 2:
+            del self.times[:cutoff]
+            del self.prices[:cutoff]
+
+    def change_percent(self, window: float) -> Optional[float]:
+        """Variación % respecto al precio de hace `window` segundos (None sin historia suficiente)."""
+        if not self.times:
+            return None
+        index = bisect.bisect_right(self.times, self.times[-1] - window) - 1
+        if index < 0 or not self.prices[index]:
+            return None
+        return (self.prices[-1] - self.prices[index]) / self.prices[index] * 100
+
+
+class AlertEngine:
+    """Reglas de alerta de los usuarios evaluadas con cada snapshot publicado.
+
+    Reglas (tabla alert_rules de la base SQLite de main.py):
+    - price: el precio consolidado cruza `threshold` hacia arriba ('above') o abajo ('below');
+    - change: la variación % en `window` segundos cruza `threshold` (p. ej. 5 o -5);
+    - spread: el spread % entre exchanges cruza `threshold`.
+    Se disparan al cruzar el umbral (no mientras se mantiene) y las reglas
+    `once` se desactivan tras dispararse. Los disparos se guardan en
+    alert_events; la clave única (regla, seq, timestamp del snapshot) evita
+    duplicados cuando varios procesos evalúan el mismo feed de snapshots.
+
+    Los clientes no eligen el propietario: presentan un token firmado
+    (owner_token, p. ej. emitido por la aplicación para su usuario) o reciben
+    uno nuevo. Cada propietario puede tener `max_rules_per_owner` reglas activas.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_rules_per_owner: int = MAX_RULES_PER_OWNER,
+                 secret: Optional[str] = ALERT_SECRET):
+        self.db_path = db_path
+        self.max_rules_per_owner = max_rules_per_owner
+        self.secret = secret.encode() if secret else None
+        self.conn: Optional[sqlite3.Connection] = None
+        self.data_version = None
+        self.rules: Dict[int, Dict] = {}
+        # símbolo -> (tipo, ventana) -> índice de umbrales
+        self.indexes: Dict[str, Dict[tuple, ThresholdIndex]] = {}
+        self.last_values: Dict[Tuple[str, tuple], float] = {}
+        self.windows: Dict[str, PriceWindow] = {}
+        self.on_alert: Optional[Callable[[Dict], None]] = None
+        self.stats = {'evaluated_symbols': 0, 'checked_rules': 0, 'triggered': 0}
+
+    def connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path)
+            self.conn.row_factory = sqlite3.Row
+            with self.conn:
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS alert_rules (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        owner TEXT NOT NULL,
+                        symbol TEXT NOT NULL,
+                        kind TEXT NOT NULL,
+                        direction TEXT NOT NULL,
+                        threshold REAL NOT NULL,
+                        window INTEGER,
+                        once INTEGER NOT NULL DEFAULT 1,
+                        active INTEGER NOT NULL DEFAULT 1,
+                        created_at REAL NOT NULL
+                    )
+                """)
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS alert_events (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        rule_id INTEGER NOT NULL,
+                        owner TEXT NOT NULL,
+                        symbol TEXT NOT NULL,
+                        kind TEXT NOT NULL,
+                        direction TEXT NOT NULL,
+                        threshold REAL NOT NULL,
+                        window INTEGER,
+                        value REAL NOT NULL,
+                        price REAL NOT NULL,
+                        seq INTEGER NOT NULL,
+                        snapshot_time INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        UNIQUE (rule_id, seq, snapshot_time)
+                    )
+                """)
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS alert_settings (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL
+                    )
+                """)
+                self.conn.execute("CREATE INDEX IF NOT EXISTS alert_rules_owner ON alert_rules (owner)")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS alert_events_owner ON alert_events (owner, id)")
+        return self.conn
+
+    def signing_key(self) -> bytes:
+        """Clave de firma de los tokens: la configurada o la guardada en la base de datos."""
+        if self.secret is None:
+            conn = self.connect()
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO alert_settings (key, value) VALUES ('owner_secret', ?)",
+                             (secrets.token_hex(32),))
+            self.secret = conn.execute(
+                "SELECT value FROM alert_settings WHERE key = 'owner_secret'"
+            ).fetchone()[0].encode()
+        return self.secret
+
+    def owner_token(self, owner: str) -> str:
+        """Token que acredita a `owner` (propietario y firma HMAC separados por un punto)."""
+        signature = hmac.new(self.signing_key(), str(owner).encode(), hashlib.sha256).hexdigest()
+        return f"{owner}.{signature}"
+
+    def verify_token(self, token: str) -> Optional[str]:
+        """Propietario acreditado por `token`, o None si la firma no es válida."""
+        owner, _, signature = str(token).rpartition('.')
+        if not owner or not hmac.compare_digest(self.owner_token(owner), f"{owner}.{signature}"):
+            return None
+        return owner
+
+    def new_owner(self) -> str:
+        """Propietario anónimo nuevo (para clientes sin token)."""
+        return f"anon-{secrets.token_hex(8)}"
+
+    def metric_key(self, rule: Dict) -> tuple:
+        return (rule['kind'], rule['window'] or 0)
+
+    def index_rule(self, rule: Dict):
+        self.rules[rule['id']] = rule
+        index = self.indexes.setdefault(rule['symbol'], {}).setdefault(self.metric_key(rule), ThresholdIndex())
+        index.add(rule['id'], rule['direction'], rule['threshold'])
+
+    def unindex_rule(self, rule_id: int):
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return
+        metrics = self.indexes.get(rule['symbol'], {})
+        index = metrics.get(self.metric_key(rule))
+        if index is not None:
+            index.remove(rule_id, rule['direction'], rule['threshold'])
+            if not index:
+                del metrics[self.metric_key(rule)]
+        if not metrics:
+            self.indexes.pop(rule['symbol'], None)
+
+    def load_rules(self):
+        """Reconstruir los índices con las reglas activas de la base de datos."""
+        conn = self.connect()
+        self.rules = {}
+        self.indexes = {}
+        for row in conn.execute("SELECT * FROM alert_rules WHERE active = 1"):
+            self.index_rule(dict(row))
+        self.data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        logger.info(f"Alertas: {len(self.rules)} reglas activas cargadas")
+
+    def refresh_if_changed(self):
+        """Recargar las reglas si otro proceso modificó la base de datos."""
+        conn = self.connect()
+        if self.data_version is None or conn.execute("PRAGMA data_version").fetchone()[0] != self.data_version:
+            self.load_rules()
+
+    def add_rule(self, owner: str, symbol: str, kind: str, direction: str, threshold: float,
+                 window: Optional[int] = None, once: bool = True) -> Dict:
+        """Crear una regla; lanza ValueError si los parámetros no son válidos."""
+        if not owner:
+            raise ValueError("Falta el propietario de la regla")
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Tipo de alerta no soportado: {kind}")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Dirección no soportada: {direction}")
+        symbol = str(symbol or '').strip().upper()
+        if not symbol:
+            raise ValueError("Falta el símbolo de la regla")
+        threshold = float(threshold)
+        # NaN o infinito romperían el orden de los umbrales en ThresholdIndex
+        if not math.isfinite(threshold):
+            raise ValueError(f"Umbral no válido: {threshold}")
+        if kind == 'change':
+            window = int(window or 0)
+            if not 0 < window <= MAX_WINDOW:
+                raise ValueError(f"La ventana debe estar entre 1 y {MAX_WINDOW} segundos")
+        else:
+            window = None
+
+        conn = self.connect()
+        with conn:
+            active = conn.execute("SELECT COUNT(*) FROM alert_rules WHERE owner = ? AND active = 1",
+                                  (str(owner),)).fetchone()[0]
+            if active >= self.max_rules_per_owner:
+                raise ValueError(f"Límite de {self.max_rules_per_owner} reglas activas por propietario alcanzado")
+            cursor = conn.execute("""
+                INSERT INTO alert_rules (owner, symbol, kind, direction, threshold, window, once, active, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+            """, (str(owner), symbol, kind, direction, threshold, window, int(bool(once)), time.time()))
+        rule = dict(conn.execute("SELECT * FROM alert_rules WHERE id = ?", (cursor.lastrowid,)).fetchone())
+        self.index_rule(rule)
+        self.data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        return rule
+
+    def delete_rule(self, owner: str, rule_id: int) -> bool:
+        conn = self.connect()
+        with conn:
+            deleted = conn.execute("DELETE FROM alert_rules WHERE id = ? AND owner = ?",
+                                   (rule_id, str(owner))).rowcount
+        if deleted:
+            self.unindex_rule(rule_id)
+        return bool(deleted)
+
+    def list_rules(self, owner: str) -> List[Dict]:
+        rows = self.connect().execute("SELECT * FROM alert_rules WHERE owner = ? ORDER BY id", (str(owner),))
+        return [dict(row) for row in rows]
+
+    def list_events(self, owner: str, limit: int = 50) -> List[Dict]:
+        rows = self.connect().execute(
+            "SELECT * FROM alert_events WHERE owner = ? ORDER BY id DESC LIMIT ?", (str(owner), limit)
+        )
+        return [dict(row) for row in rows]
+
+    def metric_values(self, symbol: str, row: Dict, metrics) -> Dict[tuple, Optional[float]]:
+        values = {}
+        for metric in metrics:
+            kind, window = metric
+            if kind == 'price':
+                values[metric] = row.get('price')
+            elif kind == 'spread':
+                values[metric] = row.get('spread_percent')
+            else:
+                values[metric] = self.windows[symbol].change_percent(window)
+        return values
+
+    def evaluate(self, snapshot) -> List[Dict]:
+        """Evaluar las reglas de los símbolos del snapshot y devolver las alertas disparadas."""
+        triggered = []
+        for symbol, metrics in self.indexes.items():
+            row = snapshot.rows_by_symbol.get(symbol)
+            if row is None or row.get('price') is None:
+                continue
+            self.stats['evaluated_symbols'] += 1
+            if any(kind == 'change' for kind, _ in metrics):
+                keep = max(window for kind, window in metrics if kind == 'change')
+                self.windows.setdefault(symbol, PriceWindow()).add(row['timestamp'], row['price'], keep)
+
+            for metric, current in self.metric_values(symbol, row, list(metrics)).items():
+                if current is None:
+                    continue
+                previous = self.last_values.get((symbol, metric))
+                self.last_values[(symbol, metric)] = current
+                if previous is None:
+                    continue
+                for rule_id in metrics[metric].crossed(previous, current):
+                    self.stats['checked_rules'] += 1
+                    triggered.append(self.build_event(self.rules[rule_id], current, row, snapshot))
+        if triggered:
+            self.record_events(triggered)
+        return triggered
+
+    def build_event(self, rule: Dict, value: float, row: Dict, snapshot) -> Dict:
+        return {
+            'rule_id': rule['id'],
+            'owner': rule['owner'],
+            'symbol': rule['symbol'],
+            'kind': rule['kind'],
+            'direction': rule['direction'],
+            'threshold': rule['threshold'],
+            'window': rule['window'],
+            'value': value,
+            'price': row['price'],
+            'seq': snapshot.version,
+            'snapshot_time': snapshot.timestamp,
+            'created_at': time.time()
+        }
+
+    def record_events(self, events: List[Dict]):
+        """Guardar los disparos y desactivar las reglas de un solo uso."""
+        conn = self.connect()
+        try:
+            with conn:
+                for event in events:
+                    cursor = conn.execute("""
+                        INSERT OR IGNORE INTO alert_events (rule_id, owner, symbol, kind, direction, threshold,
+                                                            window, value, price, seq, snapshot_time, created_at)
+                        VALUES (:rule_id, :owner, :symbol, :kind, :direction, :threshold,
+                                :window, :value, :price, :seq, :snapshot_time, :created_at)
+                    """, event)
+                    # Si otro proceso ya lo registró, se comparte su id
+                    event['id'] = cursor.lastrowid if cursor.rowcount else conn.execute(
+                        "SELECT id FROM alert_events WHERE rule_id = ? AND seq = ? AND snapshot_time = ?",
+                        (event['rule_id'], event['seq'], event['snapshot_time'])
+                    ).fetchone()[0]
+                    if self.rules[event['rule_id']]['once']:
+                        conn.execute("UPDATE alert_rules SET active = 0 WHERE id = ?", (event['rule_id'],))
+            self.data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error guardando alertas: {e}")
+        for event in events:
+            if self.rules.get(event['rule_id'], {}).get('once'):
+                self.unindex_rule(event['rule_id'])
+        self.stats['triggered'] += len(events)
+
+    def on_snapshot(self, snapshot):
+        """Callback del bus de snapshots: evaluar y notificar cada alerta disparada."""
+        try:
+            self.refresh_if_changed()
+            for event in self.evaluate(snapshot):
+                logger.info(f"Alerta {event['rule_id']} ({event['symbol']} {event['kind']} "
+                            f"{event['direction']} {event['threshold']}): valor {event['value']:.4f}")
+                if self.on_alert:
+                    self.on_alert(event)
+        except Exception as e:
+            logger.error(f"Error evaluando alertas: {e}")
+
+    def start(self, bus, on_alert: Optional[Callable[[Dict], None]] = None):
+        """Cargar las reglas y evaluarlas con cada snapshot publicado en `bus`."""
+        self.on_alert = on_alert
+        self.load_rules()
+        bus.subscribe(self.on_snapshot)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# Instancia global del motor de alertas
+alert_engine = AlertEngine()
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Benchmarks del pipeline de agregación de CriptoView.
+
+Suites (todas con datos sintéticos de semilla fija, reproducibles):
+- aggregation: parseo + agregación, camino anterior (replace + búsqueda
+  lineal + bucle por símbolo) frente al índice y el motor por columnas.
+- parsing: respuesta "all tickers" completa (json.loads) frente al parser
+  incremental de ticker_stream, con tiempo y pico de memoria.
+- pipeline: aggregate_data completo contra el servidor de replay local,
+  format_data_for_frontend y serialización del snapshot.
+- broadcast: latencia desde publish_snapshot hasta el último envío con N
+  clientes WebSocket simulados (snapshot completo y delta).
+- analytics: coste por tick de las estadísticas móviles según el historial
+  acumulado (debe ser constante) y por ciclo según el número de símbolos.
+- depth: diffs de profundidad por segundo (parseo del mensaje de Binance y
+  aplicación al libro) según los niveles del libro, y coste del libro
+  consolidado top-N de tres exchanges.
+
+Con --json se guardan los resultados y con --compare se muestran las
+diferencias respecto a una ejecución anterior.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import tempfile
+import time
+import tracemalloc
+
+from crypto_aggregator import CryptoDataAggregator
+from history_store import HistoryStore
+from price_snapshot import PriceSnapshot, format_data_for_frontend
+from order_book import DEFAULT_BOOK_DEPTH, OrderBook, consolidate_books
+from rolling_analytics import RollingAnalytics
+from replay import (ReplayServer, synthetic_binance_payload, synthetic_kucoin_payload,
+                    synthetic_symbols, write_synthetic_fixtures)
+from ticker_stream import orjson, parse_tickers_bytes
+from vector_engine import np
+
+def legacy_cycle(target_symbols: list, binance_payload: list, kucoin_payload: dict) -> dict:
+    """Reproducción del ciclo anterior: replace + `in lista` + bucle por símbolo."""
+    binance_data = {}
+    for item in binance_payload:
+        symbol = item['symbol']
+        if symbol.endswith('USDT'):
+            base_symbol = symbol.replace('USDT', '')
+            if base_symbol in target_symbols:
+                binance_data[base_symbol] = {
+                    'exchange': 'binance', 'symbol': base_symbol, 'price': float(item['lastPrice']),
+                    'change_24h': float(item['priceChange']),
+                    'change_24h_percent': float(item['priceChangePercent']),
+                    'volume_24h': float(item['volume']), 'timestamp': int(time.time())
+                }
+    kucoin_data = {}
+    for item in kucoin_payload['data']['ticker']:
+        symbol_pair = item['symbol']
+        if symbol_pair.endswith('-USDT'):
+            base_symbol = symbol_pair.replace('-USDT', '')
+            if base_symbol in target_symbols:
+                kucoin_data[base_symbol] = {
+                    'exchange': 'kucoin', 'symbol': base_symbol, 'price': float(item['last']),
+                    'change_24h': float(item['changePrice']),
+                    'change_24h_percent': float(item['changeRate']) * 100,
+                    'volume_24h': float(item['vol']), 'timestamp': int(time.time())
+                }
+
+    aggregated_data = {}
+    for symbol in target_symbols:
+        symbol_data = {'symbol': symbol, 'exchanges': {}, 'average_price': 0,
+                       'price_sources': 0, 'timestamp': int(time.time())}
+        total_price = 0
+        price_count = 0
+        for exchange, data in (('binance', binance_data), ('kucoin', kucoin_data)):
+            if symbol in data:
+                symbol_data['exchanges'][exchange] = data[symbol]
+                total_price += data[symbol]['price']
+                price_count += 1
+        if price_count > 0:
+            symbol_data['average_price'] = total_price / price_count
+            symbol_data['price_sources'] = price_count
+            aggregated_data[symbol] = symbol_data
+    return aggregated_data
+
+def engine_cycle(aggregator: CryptoDataAggregator, binance_payload: list, kucoin_payload: dict) -> dict:
+    """Ciclo actual: índice de símbolos O(1) y agregación por columnas."""
+    return aggregator.engine.aggregate({
+        'binance': aggregator.parse_binance_tickers(binance_payload),
+        'kucoin': aggregator.parse_kucoin_tickers(kucoin_payload)
+    })
+
+def cpu_time_per_cycle(function, *args, repeat: int = 5) -> float:
+    """Mejor tiempo de CPU (ms) de `repeat` ejecuciones."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.process_time()
+        function(*args)
+        best = min(best, time.process_time() - started)
+    return best * 1000
+
+def benchmark_aggregation(sizes: list, repeat: int) -> dict:
+    results = {}
+    print(f"Motor por columnas: {'numpy' if np is not None else 'Python puro (numpy no instalado)'}")
+    print(f"{'símbolos':>9} {'anterior (ms)':>14} {'actual (ms)':>12} {'mejora':>8}")
+    for size in sizes:
+        symbols = synthetic_symbols(size)
+        binance_payload = synthetic_binance_payload(symbols)
+        kucoin_payload = synthetic_kucoin_payload(symbols)
+        aggregator = CryptoDataAggregator(target_symbols=symbols)
+
+        legacy_ms = cpu_time_per_cycle(legacy_cycle, symbols, binance_payload, kucoin_payload, repeat=repeat)
+        engine_ms = cpu_time_per_cycle(engine_cycle, aggregator, binance_payload, kucoin_payload, repeat=repeat)
+        print(f"{size:>9} {legacy_ms:>14.2f} {engine_ms:>12.2f} {legacy_ms / engine_ms:>7.1f}x")
+        results[f"legacy_cycle_ms/{size}"] = legacy_ms
+        results[f"engine_cycle_ms/{size}"] = engine_ms
+    return results
+
+def peak_memory(function, *args) -> tuple:
+    """Tiempo (ms) y pico de memoria asignada (KB) de una ejecución."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024
+
+def benchmark_parsing(sizes: list, repeat: int) -> dict:
+    results = {}
+    print(f"Backend JSON del parser incremental: {'orjson' if orjson is not None else 'json'}")
+    print(f"{'símbolos':>9} {'cuerpo (KB)':>12} {'json.loads (ms)':>16} {'stream (ms)':>12} "
+          f"{'pico json (KB)':>15} {'pico stream (KB)':>17}")
+    for size in sizes:
+        symbols = synthetic_symbols(size)
+        aggregator = CryptoDataAggregator(target_symbols=symbols)
+        # Respuesta real de Binance: ~2.000 pares, de los que solo se siguen `size`
+        body = json.dumps(synthetic_binance_payload(symbols)).encode()
+        accept = lambda pair: aggregator.symbol_index.base_symbol('binance', pair) is not None
+
+        full = lambda: aggregator.parse_binance_tickers(json.loads(body))
+        stream = lambda: aggregator.parse_binance_tickers(parse_tickers_bytes(body, accept)[0])
+        full_ms = cpu_time_per_cycle(full, repeat=repeat)
+        stream_ms = cpu_time_per_cycle(stream, repeat=repeat)
+        _, full_peak = peak_memory(full)
+        _, stream_peak = peak_memory(stream)
+        print(f"{size:>9} {len(body) / 1024:>12.0f} {full_ms:>16.2f} {stream_ms:>12.2f} "
+              f"{full_peak:>15.0f} {stream_peak:>17.0f}")
+        results[f"json_parse_ms/{size}"] = full_ms
+        results[f"stream_parse_ms/{size}"] = stream_ms
+        results[f"stream_parse_peak_kb/{size}"] = stream_peak
+    return results
+
+def wall_time(function, *args, repeat: int = 5) -> float:
+    """Mejor tiempo real (ms) de `repeat` ejecuciones."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+async def pipeline_case(size: int, repeat: int) -> dict:
+    """Ciclo completo contra fixtures servidos en local (sin red, sin límites de tasa)."""
+    with tempfile.TemporaryDirectory() as directory:
+        symbols = synthetic_symbols(size)
+        write_synthetic_fixtures(directory, symbols)
+        server = ReplayServer(directory)
+        await server.start()
+        aggregator = CryptoDataAggregator(target_symbols=symbols, history_store=HistoryStore(
+            f"{directory}/history", f"{directory}/app.db"
+        ))
+        # Cada repetición debe consultar de nuevo, no reutilizar el ciclo anterior
+        aggregator.min_refresh_interval = 0
+        server.point(aggregator)
+        try:
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                data = await aggregator.aggregate_data(wait_all=True)
+                best = min(best, time.perf_counter() - started)
+        finally:
+            await aggregator.close_session()
+            aggregator.history_store.close()
+            await server.stop()
+
+    snapshot = PriceSnapshot(data, 1)
+    return {
+        'aggregate_data_ms': best * 1000,
+        'format_ms': wall_time(format_data_for_frontend, data, repeat=repeat),
+        'snapshot_ms': wall_time(PriceSnapshot, data, 1, repeat=repeat),
+        'gzip_ms': wall_time(lambda: PriceSnapshot(data, 1).encoded_body('gzip'), repeat=repeat),
+        'body_kb': len(snapshot.body) / 1024
+    }
+
+def benchmark_pipeline(sizes: list, repeat: int) -> dict:
+    results = {}
+    print(f"{'símbolos':>9} {'aggregate_data (ms)':>20} {'formato (ms)':>13} {'snapshot (ms)':>14} "
+          f"{'+gzip (ms)':>11} {'cuerpo (KB)':>12}")
+    for size in sizes:
+        case = asyncio.run(pipeline_case(size, repeat))
+        print(f"{size:>9} {case['aggregate_data_ms']:>20.2f} {case['format_ms']:>13.2f} "
+              f"{case['snapshot_ms']:>14.2f} {case['gzip_ms']:>11.2f} {case['body_kb']:>12.0f}")
+        for key, value in case.items():
+            results[f"{key}/{size}"] = value
+    return results
+
+class FakeWebSocket:
+    """Conexión simulada: cuenta los mensajes y bytes enviados."""
+
+    def __init__(self, tracker: dict, subprotocol: str = None):
+        self.tracker = tracker
+        self.subprotocol = subprotocol
+
+    async def send(self, message):
+        tracker = self.tracker
+        tracker['sent'] += 1
+        tracker['bytes'] += len(message)
+
+    async def close(self, *args):
+        pass
+
+def moved_snapshot(data: dict, version: int, fraction: float, rng: random.Random) -> PriceSnapshot:
+    """Copia de `data` con una fracción de precios movidos (para medir deltas)."""
+    moved = {}
+    for symbol, row in data.items():
+        if rng.random() < fraction:
+            row = {**row, 'exchanges': {
+                exchange: {**ticker, 'price': ticker['price'] * 1.001}
+                for exchange, ticker in row['exchanges'].items()
+            }}
+        moved[symbol] = row
+    return PriceSnapshot(moved, version)
+
+async def drained(manager) -> None:
+    """Esperar a que las tareas escritoras hayan vaciado todas las colas."""
+    while any(client.queue for client in manager.clients.values()):
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+async def broadcast_case(data: dict, clients: int, encoding: str = 'json') -> dict:
+    from websocket_server import WebSocketManager
+    from wire_format import SUBPROTOCOLS
+
+    subprotocol = next(name for name, value in SUBPROTOCOLS.items() if value == encoding)
+    manager = WebSocketManager(send_queue_size=8)
+    tracker = {'sent': 0, 'bytes': 0}
+    for _ in range(clients):
+        await manager.register(FakeWebSocket(tracker, subprotocol))
+
+    rng = random.Random(7)
+    results = {}
+    for name, snapshot in (('full', PriceSnapshot(data, 1)), ('delta', moved_snapshot(data, 2, 0.1, rng))):
+        tracker.update(sent=0, bytes=0)
+        started = time.perf_counter()
+        await manager.publish_snapshot(snapshot)
+        await drained(manager)
+        results[f"broadcast_{name}_ms"] = (time.perf_counter() - started) * 1000
+        results[f"broadcast_{name}_kb"] = tracker['bytes'] / clients / 1024
+
+    for websocket in list(manager.connections):
+        manager.remove_connection(websocket)
+    return results
+
+def benchmark_broadcast(sizes: list, client_counts: list) -> dict:
+    from wire_format import available_encodings
+
+    results = {}
+    print(f"{'símbolos':>9} {'clientes':>9} {'codificación':>13} {'completo (ms)':>14} {'delta (ms)':>11} "
+          f"{'KB/cliente':>11} {'KB delta':>9}")
+    for size in sizes:
+        symbols = synthetic_symbols(size)
+        aggregator = CryptoDataAggregator(target_symbols=symbols)
+        rng = random.Random(size)
+        data = engine_cycle(aggregator, synthetic_binance_payload(symbols, rng=rng),
+                            synthetic_kucoin_payload(symbols, rng=rng))
+        for clients in client_counts:
+            for encoding in available_encodings():
+                case = asyncio.run(broadcast_case(data, clients, encoding))
+                print(f"{size:>9} {clients:>9} {encoding:>13} {case['broadcast_full_ms']:>14.2f} "
+                      f"{case['broadcast_delta_ms']:>11.2f} {case['broadcast_full_kb']:>11.1f} "
+                      f"{case['broadcast_delta_kb']:>9.1f}")
+                suffix = '' if encoding == 'json' else f"/{encoding}"
+                for key, value in case.items():
+                    results[f"{key}/{size}x{clients}{suffix}"] = value
+    return results
+
+def analytics_tick_cost(history: int, ticks: int = 20000) -> float:
+    """µs por tick de un símbolo tras acumular `history` ticks (4 ticks por segundo)."""
+    analytics = RollingAnalytics()
+    rng = random.Random(history)
+    price = 100.0
+    timestamp = 0.0
+    for _ in range(history):
+        timestamp += 0.25
+        price *= 1 + rng.gauss(0, 0.001)
+        analytics.update('BTC', price, timestamp)
+    prices = []
+    for _ in range(ticks):
+        price *= 1 + rng.gauss(0, 0.001)
+        prices.append(price)
+    started = time.process_time()
+    for price in prices:
+        timestamp += 0.25
+        analytics.update('BTC', price, timestamp)
+    return (time.process_time() - started) / ticks * 1e6
+
+def analytics_cycle_cost(size: int, cycles: int = 20) -> float:
+    """ms por ciclo de apply_all sobre `size` filas con precios nuevos cada 0,5 s."""
+    analytics = RollingAnalytics()
+    rng = random.Random(size)
+    rows = {symbol: {'symbol': symbol, 'price': rng.uniform(1, 1000)} for symbol in synthetic_symbols(size)}
+    elapsed = 0.0
+    for cycle in range(cycles):
+        for row in rows.values():
+            row['price'] *= 1 + rng.gauss(0, 0.001)
+        started = time.process_time()
+        analytics.apply_all(rows, cycle * 0.5 + 1)
+        elapsed += time.process_time() - started
+    return elapsed / cycles * 1000
+
+def benchmark_analytics(sizes: list) -> dict:
+    results = {}
+    print(f"{'historial (ticks)':>18} {'µs/tick':>9}")
+    for history in (100, 10000, 100000):
+        cost = analytics_tick_cost(history)
+        print(f"{history:>18} {cost:>9.2f}")
+        results[f"analytics_tick_us/{history}"] = cost
+    print(f"{'símbolos':>9} {'ms/ciclo':>9} {'µs/símbolo':>11}")
+    for size in sizes:
+        cost = analytics_cycle_cost(size)
+        print(f"{size:>9} {cost:>9.2f} {cost * 1000 / size:>11.2f}")
+        results[f"analytics_cycle_ms/{size}"] = cost
+    return results
+
+def synthetic_book(exchange: str, levels: int, rng: random.Random, mid: float = 1000.0) -> OrderBook:
+    book = OrderBook(exchange, 'BTC', max_levels=levels)
+    book.apply_snapshot({
+        'type': 'snapshot', 'symbol': 'BTC', 'sequence': 0,
+        'bids': [(round(mid - tick * 0.01, 2), rng.uniform(0.1, 5)) for tick in range(1, levels + 1)],
+        'asks': [(round(mid + tick * 0.01, 2), rng.uniform(0.1, 5)) for tick in range(1, levels + 1)]
+    })
+    return book
+
+def depth_messages(count: int, levels: int, rng: random.Random, mid: float = 1000.0) -> list:
+    """Mensajes depthUpdate de Binance: 1-4 cambios cerca del mejor precio, 30% borrados."""
+    messages = []
+    sequence = 0
+    for _ in range(count):
+        changes = {'b': [], 'a': []}
+        for _ in range(rng.randint(1, 4)):
+            side = rng.choice('ba')
+            tick = min(int(rng.expovariate(1 / 20)) + 1, levels)
+            price = mid - tick * 0.01 if side == 'b' else mid + tick * 0.01
+            quantity = 0.0 if rng.random() < 0.3 else rng.uniform(0.1, 5)
+            changes[side].append([f"{price:.2f}", f"{quantity:.4f}"])
+        first = sequence + 1
+        sequence += len(changes['b']) + len(changes['a'])
+        messages.append({'e': 'depthUpdate', 'E': 0, 's': 'BTCUSDT', 'U': first, 'u': sequence, **changes})
+    return messages
+
+def benchmark_depth(repeat: int) -> dict:
+    results = {}
+    aggregator = CryptoDataAggregator(target_symbols=['BTC'])
+    adapter = aggregator.adapters['binance']
+    print(f"{'niveles':>8} {'µs/diff':>8} {'diffs/s':>10} {'solo libro (µs)':>16}")
+    for levels in (100, 1000, 5000):
+        rng = random.Random(levels)
+        messages = depth_messages(20000, levels, rng)
+        events = [event for message in messages for event in adapter.parse_depth_message(message)]
+        total = apply_only = float('inf')
+        for _ in range(repeat):
+            book = synthetic_book('binance', levels, rng)
+            started = time.process_time()
+            for message in messages:
+                for event in adapter.parse_depth_message(message):
+                    book.apply_update(event)
+            total = min(total, time.process_time() - started)
+            book = synthetic_book('binance', levels, rng)
+            started = time.process_time()
+            for event in events:
+                book.apply_update(event)
+            apply_only = min(apply_only, time.process_time() - started)
+        per_update = total / len(messages) * 1e6
+        print(f"{levels:>8} {per_update:>8.2f} {1e6 / per_update:>10.0f} {apply_only / len(events) * 1e6:>16.2f}")
+        results[f"depth_update_us/{levels}"] = per_update
+        results[f"depth_apply_us/{levels}"] = apply_only / len(events) * 1e6
+
+    rng = random.Random(0)
+    books = {exchange: synthetic_book(exchange, 1000, rng) for exchange in ('binance', 'kucoin', 'coinbase')}
+    started = time.process_time()
+    for _ in range(2000):
+        consolidate_books(books, DEFAULT_BOOK_DEPTH)
+    consolidate_us = (time.process_time() - started) / 2000 * 1e6
+    print(f"Libro consolidado top-{DEFAULT_BOOK_DEPTH} de 3 exchanges: {consolidate_us:.1f} µs")
+    results['depth_consolidate_us'] = consolidate_us
+    return results
+
+def compare_results(results: dict, baseline_path: str):
+    """Mostrar la variación de cada medida respecto a una ejecución guardada."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"{'medida':<40} {'antes':>10} {'ahora':>10} {'cambio':>8}")
+    for key, value in results.items():
+        if key in baseline and baseline[key]:
+            change = (value - baseline[key]) / baseline[key] * 100
+            print(f"{key:<40} {baseline[key]:>10.2f} {value:>10.2f} {change:>+7.1f}%")
+
+SUITES = ('aggregation', 'parsing', 'pipeline', 'broadcast', 'analytics', 'depth')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks del pipeline de agregación')
+    parser.add_argument('--suite', action='append', choices=SUITES,
+                        help='Suites a ejecutar (por defecto todas); se puede repetir')
+    parser.add_argument('--sizes', default='30,500,3000', help='Tamaños del universo de símbolos')
+    parser.add_argument('--pipeline-sizes', default='30,500',
+                        help='Tamaños para la suite pipeline (Coinbase hace 2 peticiones por símbolo)')
+    parser.add_argument('--clients', default='10,100,1000', help='Clientes simulados de la suite broadcast')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='Guardar los resultados en este fichero')
+    parser.add_argument('--compare', help='Comparar con los resultados guardados en este fichero')
+    args = parser.parse_args()
+
+    # Los logs por ciclo del agregador falsean los tiempos
+    logging.getLogger().setLevel(logging.WARNING)
+    suites = args.suite or SUITES
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = {}
+
+    print("🚀 Benchmarks de CriptoView")
+    print("=" * 60)
+    if 'aggregation' in suites:
+        results.update(benchmark_aggregation(sizes, args.repeat))
+        print("-" * 60)
+    if 'parsing' in suites:
+        results.update(benchmark_parsing(sizes, args.repeat))
+        print("-" * 60)
+    if 'pipeline' in suites:
+        results.update(benchmark_pipeline([int(size) for size in args.pipeline_sizes.split(',')], args.repeat))
+        print("-" * 60)
+    if 'broadcast' in suites:
+        results.update(benchmark_broadcast(sizes, [int(count) for count in args.clients.split(',')]))
+        print("-" * 60)
+    if 'analytics' in suites:
+        results.update(benchmark_analytics(sizes))
+        print("-" * 60)
+    if 'depth' in suites:
+        results.update(benchmark_depth(args.repeat))
+        print("-" * 60)
+
+    if args.compare:
+        compare_results(results, args.compare)
+        print("-" * 60)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'recorded_at': int(time.time()), 'numpy': np is not None,
+                       'orjson': orjson is not None, 'results': results}, f, indent=2, sort_keys=True)
+        print(f"Resultados guardados en {args.json}")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,42 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from flask_cors import cross_origin
 import asyncio
 import threading
 import time
 from src.crypto_aggregator import crypto_aggregator
+from src.snapshot_bus import run_shared_aggregation
+from src.price_snapshot import brotli
+from src.history_store import AVERAGE_SERIES, RESOLUTIONS
+# El agregador y los adaptadores importan `metrics` sin prefijo: servir ese mismo
+# módulo (y su registro); `src.metrics` sería una segunda copia vacía
+from metrics import CONTENT_TYPE, render_metrics
 
 crypto_bp = Blueprint('crypto', __name__)
+# Se registra sin prefijo: Prometheus espera /metrics en la raíz
+metrics_bp = Blueprint('metrics', __name__)
 
 # Variable global para el hilo de actualización
 update_thread = None
 update_running = False
+update_lock = threading.Lock()
 
 def start_background_updates():
     """Iniciar actualizaciones en segundo plano."""
-    global update_running
-    if not update_running:
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    # Se une al bucle compartido: si el servidor WebSocket ya agrega, solo se suscribe
+    loop.run_until_complete(run_shared_aggregation(crypto_aggregator, 10))
+
+def ensure_background_updates() -> bool:
+    """Lanzar el hilo de actualizaciones si no existe; devolver si se ha lanzado ahora."""
+    global update_thread, update_running
+    with update_lock:
+        if update_running:
+            return False
         update_running = True
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(crypto_aggregator.start_periodic_update(10))
+        update_thread = threading.Thread(target=start_background_updates, daemon=True)
+        update_thread.start()
+        return True
 
 @crypto_bp.route('/health', methods=['GET'])
 @cross_origin()
@@ -27,69 +45,140 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': int(time.time()),
-        'service': 'CriptoView Backend'
+        'service': 'CriptoView Backend',
+        # Solo lo rellena el proceso que consulta los exchanges
+        'exchanges': crypto_aggregator.get_exchange_status(),
+        'scheduler': crypto_aggregator.get_scheduler_status()
     })
 
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas del proceso en formato de texto de Prometheus."""
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
 @crypto_bp.route('/crypto/prices', methods=['GET'])
 @cross_origin()
 def get_crypto_prices():
     """Obtener precios actuales de criptomonedas."""
+    # Hay clientes HTTP consultando: mantener la cadencia normal durante un minuto
+    crypto_aggregator.report_clients('http', 1, ttl=60)
     try:
-        # Si no hay datos, hacer una agregación inicial
+        # En frío no se agrega por petición: todas esperan al primer snapshot del
+        # bucle de actualizaciones (un único hilo, lanzado por la primera de ellas)
         if not crypto_aggregator.get_latest_data():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(crypto_aggregator.aggregate_data())
-            loop.close()
+            ensure_background_updates()
+            if not crypto_aggregator.bus.wait_for_snapshot(timeout=15):
+                return jsonify({
+                    'success': False,
+                    'error': 'Datos todavía no disponibles',
+                    'timestamp': int(time.time())
+                }), 503
         
-        data = crypto_aggregator.get_latest_data()
+        # El snapshot ya viene formateado y serializado por el ciclo de agregación
+        snapshot = crypto_aggregator.get_snapshot()
+        if snapshot.etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(snapshot.etag)
+            return response
         
-        # Formatear datos para el frontend
-        formatted_data = []
-        for symbol, symbol_data in data.items():
-            # Usar el precio de Binance como principal, o el promedio si no está disponible
-            primary_price = symbol_data['average_price']
-            primary_change_24h = 0
-            primary_change_24h_percent = 0
-            
-            # Priorizar Binance para datos principales
-            if 'binance' in symbol_data['exchanges']:
-                binance_data = symbol_data['exchanges']['binance']
-                primary_price = binance_data['price']
-                primary_change_24h = binance_data['change_24h']
-                primary_change_24h_percent = binance_data['change_24h_percent']
-            elif 'kucoin' in symbol_data['exchanges']:
-                kucoin_data = symbol_data['exchanges']['kucoin']
-                primary_price = kucoin_data['price']
-                primary_change_24h = kucoin_data['change_24h']
-                primary_change_24h_percent = kucoin_data['change_24h_percent']
-            elif 'coinbase' in symbol_data['exchanges']:
-                coinbase_data = symbol_data['exchanges']['coinbase']
-                primary_price = coinbase_data['price']
-                primary_change_24h = coinbase_data['change_24h']
-                primary_change_24h_percent = coinbase_data['change_24h_percent']
-            
-            formatted_data.append({
-                'symbol': symbol,
-                'name': get_crypto_name(symbol),
-                'price': primary_price,
-                'change_24h': primary_change_24h,
-                'change_24h_percent': primary_change_24h_percent,
-                'exchanges': symbol_data['exchanges'],
-                'price_sources': symbol_data['price_sources'],
-                'timestamp': symbol_data['timestamp']
-            })
+        encoding = None
+        if brotli and request.accept_encodings['br']:
+            encoding = 'br'
+        elif request.accept_encodings['gzip']:
+            encoding = 'gzip'
+        
+        body = snapshot.encoded_body(encoding) if encoding else snapshot.body
+        response = Response(body, mimetype='application/json')
+        response.set_etag(snapshot.etag)
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.content_encoding = encoding
+        return response
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': int(time.time())
+        }), 500
+
+@crypto_bp.route('/crypto/history/<symbol>', methods=['GET'])
+@cross_origin()
+def get_crypto_history(symbol):
+    """Obtener histórico de un símbolo: velas OHLCV (1m, 5m, 1h) o ticks."""
+    resolution = request.args.get('resolution', '1m')
+    exchange = request.args.get('exchange', AVERAGE_SERIES)
+    
+    if resolution != 'tick' and resolution not in RESOLUTIONS:
+        return jsonify({
+            'success': False,
+            'error': f"Resolución no soportada: {resolution}",
+            'timestamp': int(time.time())
+        }), 400
+    
+    try:
+        start = request.args.get('start', type=float)
+        end = request.args.get('end', type=float)
+        limit = min(request.args.get('limit', 1000, type=int), 100000)
         
-        # Ordenar por capitalización de mercado (aproximada por precio * volumen)
-        formatted_data.sort(key=lambda x: x['price'], reverse=True)
+        data = crypto_aggregator.history_store.query(symbol.upper(), exchange, resolution, start, end, limit)
         
         return jsonify({
             'success': True,
-            'data': formatted_data,
-            'timestamp': int(time.time()),
-            'total_symbols': len(formatted_data)
+            'symbol': symbol.upper(),
+            'exchange': exchange,
+            'resolution': resolution,
+            'data': data,
+            'timestamp': int(time.time())
         })
     
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': int(time.time())
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': int(time.time())
+        }), 500
+
+@crypto_bp.route('/crypto/analytics', methods=['GET'])
+@crypto_bp.route('/crypto/analytics/<symbol>', methods=['GET'])
+@cross_origin()
+def get_crypto_analytics(symbol=None):
+    """Estadísticas móviles por símbolo (SMA/EMA, mín/máx, volatilidad y z-score por ventana)."""
+    if symbol:
+        symbols = [symbol.upper()]
+    elif request.args.get('symbols'):
+        symbols = [part.strip().upper() for part in request.args['symbols'].split(',') if part.strip()]
+    else:
+        symbols = None
+    
+    try:
+        data = crypto_aggregator.get_analytics(symbols, request.args.get('window'))
+        if symbol and not data:
+            return jsonify({
+                'success': False,
+                'error': f"Sin estadísticas para {symbol.upper()}",
+                'timestamp': int(time.time())
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'windows': crypto_aggregator.analytics.windows,
+            'data': data,
+            'timestamp': int(time.time())
+        })
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': int(time.time())
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -101,13 +190,8 @@ def get_crypto_prices():
 @cross_origin()
 def start_updates():
     """Iniciar actualizaciones periódicas en segundo plano."""
-    global update_thread, update_running
-    
     try:
-        if not update_running:
-            update_thread = threading.Thread(target=start_background_updates, daemon=True)
-            update_thread.start()
-            
+        if ensure_background_updates():
             return jsonify({
                 'success': True,
                 'message': 'Actualizaciones periódicas iniciadas',
@@ -126,40 +210,3 @@ def start_updates():
             'error': str(e),
             'timestamp': int(time.time())
         }), 500
-
-def get_crypto_name(symbol: str) -> str:
-    """Obtener el nombre completo de la criptomoneda."""
-    names = {
-        'BTC': 'Bitcoin',
-        'ETH': 'Ethereum',
-        'BNB': 'BNB',
-        'XRP': 'XRP',
-        'ADA': 'Cardano',
-        'SOL': 'Solana',
-        'DOGE': 'Dogecoin',
-        'DOT': 'Polkadot',
-        'MATIC': 'Polygon',
-        'LTC': 'Litecoin',
-        'SHIB': 'Shiba Inu',
-        'TRX': 'TRON',
-        'AVAX': 'Avalanche',
-        'UNI': 'Uniswap',
-        'ATOM': 'Cosmos',
-        'LINK': 'Chainlink',
-        'XMR': 'Monero',
-        'ETC': 'Ethereum Classic',
-        'BCH': 'Bitcoin Cash',
-        'NEAR': 'NEAR Protocol',
-        'APT': 'Aptos',
-        'QNT': 'Quant',
-        'ICP': 'Internet Computer',
-        'FIL': 'Filecoin',
-        'VET': 'VeChain',
-        'HBAR': 'Hedera',
-        'ALGO': 'Algorand',
-        'MANA': 'Decentraland',
-        'SAND': 'The Sandbox',
-        'AXS': 'Axie Infinity'
-    }
-    return names.get(symbol, symbol)
-
@@ -1,11 +1,26 @@
 import asyncio
 import json
 import logging
+import random
 import time
+from functools import partial
 from typing import Dict, List, Optional
 import aiohttp
 import requests
 from datetime import datetime
+from snapshot_bus import SnapshotBus
+from price_snapshot import PriceSnapshot
+from history_store import HistoryStore
+from order_book import DepthManager
+from pricing_engine import PricingEngine
+from quote_cache import QuoteCache
+from rolling_analytics import RollingAnalytics
+from scheduler import AdaptiveScheduler, ExchangePoller
+from exchange_adapters import ADAPTER_TYPES
+from ticker_record import Ticker
+from metrics import (AGGREGATION_SECONDS, EXCHANGE_FETCH_ERRORS, EXCHANGE_FETCH_SECONDS, EXCHANGE_SYMBOLS,
+                     HISTORY_WRITE_ERRORS, PUBLISH_SECONDS, SNAPSHOT_AGE_SECONDS, SNAPSHOT_BYTES, SNAPSHOT_VERSION)
+from vector_engine import SymbolIndex, VectorAggregationEngine, summarize_prices
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -14,26 +29,16 @@ logger = logging.getLogger(__name__)
 class CryptoDataAggregator:
     """Agregador de datos de criptomonedas desde múltiples exchanges."""
     
-    def __init__(self):
-        self.exchanges = {
-            'binance': {
-                'name': 'Binance',
-                'base_url': 'https://api.binance.com',
-                'ticker_endpoint': '/api/v3/ticker/24hr',
-                'websocket_url': 'wss://stream.binance.com:9443/ws/!ticker@arr'
-            },
-            'coinbase': {
-                'name': 'Coinbase',
-                'base_url': 'https://api.exchange.coinbase.com',
-                'ticker_endpoint': '/products/{symbol}/ticker',
-                'stats_endpoint': '/products/{symbol}/stats'
-            },
-            'kucoin': {
-                'name': 'KuCoin',
-                'base_url': 'https://api.kucoin.com',
-                'ticker_endpoint': '/api/v1/market/allTickers'
-            }
+    def __init__(self, target_symbols: Optional[List[str]] = None, track_all_usdt: bool = False,
+                 adapters: Optional[List[str]] = None, history_store: Optional[HistoryStore] = None):
+        # Adaptadores de exchange registrados (ver exchange_adapters); `adapters`
+        # permite limitar el agregador a un subconjunto por nombre
+        self.adapters = {
+            name: adapter_type(self)
+            for name, adapter_type in ADAPTER_TYPES.items()
+            if adapters is None or name in adapters
         }
+        self.exchanges = {name: adapter.config() for name, adapter in self.adapters.items()}
         
         # Lista de las principales criptomonedas por capitalización de mercado
         self.target_symbols = [
@@ -41,14 +46,81 @@ class CryptoDataAggregator:
             'SHIB', 'TRX', 'AVAX', 'UNI', 'ATOM', 'LINK', 'XMR', 'ETC', 'BCH', 'NEAR',
             'APT', 'QNT', 'ICP', 'FIL', 'VET', 'HBAR', 'ALGO', 'MANA', 'SAND', 'AXS'
         ]
+        if target_symbols is not None:
+            self.target_symbols = list(target_symbols)
+        
+        # Índice de símbolos y motor de agregación por columnas. Con track_all_usdt
+        # se siguen todos los pares USDT de Binance/KuCoin, no solo target_symbols.
+        self.symbol_index = SymbolIndex(
+            self.target_symbols, self.normalize_symbol, track_all_usdt,
+            {name: adapter.quote_suffix for name, adapter in self.adapters.items()}
+        )
+        self.engine = VectorAggregationEngine(self.symbol_index, self.exchanges)
+        # Precio consolidado por símbolo (VWAP sin exchanges atípicos por defecto)
+        self.pricing = PricingEngine()
+        # Estadísticas móviles (SMA/EMA, mín/máx, volatilidad, z-score) sobre ese precio
+        self.analytics = RollingAnalytics()
+        # Último valor bueno por exchange/símbolo: un fallo puntual no borra la fuente
+        self.quote_cache = QuoteCache(ttl=120)
+        # Últimos datos (ya combinados con la caché) de cada exchange
+        self.exchange_data = {exchange: {} for exchange in self.exchanges}
+        self.scheduler = None
+        # Segundos máximos que un ciclo espera antes de publicar lo que haya llegado;
+        # los exchanges que respondan después se incorporan al llegar
+        self.publish_deadline = 3.0
+        self.late_fetches = set()
+        # Single-flight: las llamadas concurrentes comparten la agregación y la
+        # consulta por exchange en curso, y durante min_refresh_interval segundos
+        # tras completarse se reutiliza su resultado en lugar de repetirlas
+        self.min_refresh_interval = 1.0
+        self.inflight_aggregation: Optional[asyncio.Task] = None
+        self.last_aggregation = 0.0
+        self.inflight_fetches: Dict[str, asyncio.Task] = {}
+        self.last_fetches: Dict[str, tuple] = {}
+        # Clientes conectados por fuente: fuente -> (clientes, caducidad o None)
+        self.client_reports = {}
         
         self.latest_data = {}
         self.session = None
+        self.bus = SnapshotBus()
+        self.snapshot = PriceSnapshot({}, 0)
+        # Histórico en disco; no crea ficheros hasta la primera publicación
+        self.history_store = history_store or HistoryStore()
+        
+        # Parseo incremental de las respuestas "all tickers" (solo se decodifican
+        # los pares seguidos); parse_stats guarda las cifras del último ciclo
+        self.streaming_parse = True
+        self.parse_stats = {}
+        
+        # Estado de la ingesta por streaming (WebSocket del exchange)
+        self.stream_data = {'binance': {}}
+        self.stream_running = False
+        self.stream_connected = False
+        self.stream_last_message = 0.0
+        self.stream_stale_after = 30
+        # Los ticks del stream se publican agrupados: como mucho un snapshot
+        # cada stream_publish_interval segundos
+        self.stream_publish_interval = 0.25
+        self.stream_publish_handle: Optional[asyncio.TimerHandle] = None
+        self.last_publish = 0.0
+        
+        # Libros de órdenes por exchange y libro consolidado top-N por símbolo
+        self.depth = DepthManager(self)
     
     async def init_session(self):
         """Inicializar sesión HTTP asíncrona."""
         if not self.session:
-            self.session = aiohttp.ClientSession()
+            # Pool de conexiones por host con keep-alive para reutilizar TLS entre ciclos
+            connector = aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=20,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            # Solo el tiempo de conexión es global: cada adaptador fija el total de
+            # sus peticiones y el stream WebSocket no debe tener límite total
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=5)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
     
     async def close_session(self):
         """Cerrar sesión HTTP asíncrona."""
@@ -57,215 +129,388 @@ class CryptoDataAggregator:
     
     def normalize_symbol(self, symbol: str, exchange: str) -> str:
         """Normalizar símbolos de criptomonedas según el exchange."""
-        if exchange == 'binance':
-            return f"{symbol}USDT"
-        elif exchange == 'coinbase':
-            return f"{symbol}-USD"
-        elif exchange == 'kucoin':
-            return f"{symbol}-USDT"
-        return symbol
+        adapter = self.adapters.get(exchange)
+        return adapter.pair_for(symbol) if adapter else symbol
+    
+    def parse_binance_ticker(self, item: Dict) -> Optional[Ticker]:
+        """Normalizar un ticker de Binance (REST 24hr o evento 24hrTicker del stream)."""
+        return self.adapters['binance'].parse_ticker(item)
+    
+    def parse_binance_tickers(self, data: List[Dict]) -> Dict:
+        """Normalizar la respuesta de /api/v3/ticker/24hr de Binance."""
+        return self.adapters['binance'].parse(data)
     
     async def fetch_binance_data(self) -> Dict:
         """Obtener datos de Binance."""
-        try:
-            await self.init_session()
-            url = f"{self.exchanges['binance']['base_url']}{self.exchanges['binance']['ticker_endpoint']}"
-            
-            async with self.session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    normalized_data = {}
-                    
-                    for item in data:
-                        symbol = item['symbol']
-                        # Filtrar solo los símbolos que nos interesan (terminados en USDT)
-                        if symbol.endswith('USDT'):
-                            base_symbol = symbol.replace('USDT', '')
-                            if base_symbol in self.target_symbols:
-                                normalized_data[base_symbol] = {
-                                    'exchange': 'binance',
-                                    'symbol': base_symbol,
-                                    'price': float(item['lastPrice']),
-                                    'change_24h': float(item['priceChange']),
-                                    'change_24h_percent': float(item['priceChangePercent']),
-                                    'volume_24h': float(item['volume']),
-                                    'timestamp': int(time.time())
-                                }
-                    
-                    logger.info(f"Binance: Obtenidos datos de {len(normalized_data)} símbolos")
-                    return normalized_data
-                else:
-                    logger.error(f"Error al obtener datos de Binance: {response.status}")
-                    return {}
-        except Exception as e:
-            logger.error(f"Error al conectar con Binance: {e}")
-            return {}
+        return await self.adapters['binance'].fetch()
     
     async def fetch_coinbase_data(self) -> Dict:
         """Obtener datos de Coinbase."""
-        try:
-            await self.init_session()
-            normalized_data = {}
-            
-            # Coinbase requiere llamadas individuales por símbolo
-            for symbol in self.target_symbols[:10]:  # Limitamos a 10 para el MVP
-                coinbase_symbol = self.normalize_symbol(symbol, 'coinbase')
-                ticker_url = f"{self.exchanges['coinbase']['base_url']}/products/{coinbase_symbol}/ticker"
-                stats_url = f"{self.exchanges['coinbase']['base_url']}/products/{coinbase_symbol}/stats"
-                
-                try:
-                    async with self.session.get(ticker_url) as ticker_response:
-                        if ticker_response.status == 200:
-                            ticker_data = await ticker_response.json()
-                            
-                            async with self.session.get(stats_url) as stats_response:
-                                if stats_response.status == 200:
-                                    stats_data = await stats_response.json()
-                                    
-                                    current_price = float(ticker_data.get('price', 0))
-                                    open_price = float(stats_data.get('open', current_price))
-                                    change_24h = current_price - open_price
-                                    change_24h_percent = (change_24h / open_price * 100) if open_price > 0 else 0
-                                    
-                                    normalized_data[symbol] = {
-                                        'exchange': 'coinbase',
-                                        'symbol': symbol,
-                                        'price': current_price,
-                                        'change_24h': change_24h,
-                                        'change_24h_percent': change_24h_percent,
-                                        'volume_24h': float(stats_data.get('volume', 0)),
-                                        'timestamp': int(time.time())
-                                    }
-                except Exception as e:
-                    logger.warning(f"Error al obtener datos de {symbol} en Coinbase: {e}")
-                    continue
-            
-            logger.info(f"Coinbase: Obtenidos datos de {len(normalized_data)} símbolos")
-            return normalized_data
-        except Exception as e:
-            logger.error(f"Error al conectar con Coinbase: {e}")
-            return {}
+        return await self.adapters['coinbase'].fetch()
+    
+    def parse_kucoin_tickers(self, data: Dict) -> Dict:
+        """Normalizar la respuesta de /api/v1/market/allTickers de KuCoin."""
+        return self.adapters['kucoin'].parse(data)
     
     async def fetch_kucoin_data(self) -> Dict:
         """Obtener datos de KuCoin."""
+        return await self.adapters['kucoin'].fetch()
+    
+    async def fetch_exchange(self, exchange: str) -> Dict:
+        """Obtener los datos de un exchange, compartiendo la consulta en curso.
+        
+        Varias llamadas simultáneas hacen una sola petición al exchange, y una
+        consulta completada hace menos de min_refresh_interval se reutiliza.
+        """
+        task = self.inflight_fetches.get(exchange)
+        if task is None:
+            fetched_at, data = self.last_fetches.get(exchange, (None, None))
+            if fetched_at is not None and time.monotonic() - fetched_at < self.min_refresh_interval:
+                return data
+            task = asyncio.create_task(self.run_fetch(exchange))
+            self.inflight_fetches[exchange] = task
+            task.add_done_callback(partial(self.finish_fetch, exchange))
+        # shield: si un llamador se cancela, la consulta sigue para los demás
+        return await asyncio.shield(task)
+    
+    def finish_fetch(self, exchange: str, task: asyncio.Task):
+        if self.inflight_fetches.get(exchange) is task:
+            del self.inflight_fetches[exchange]
+        if not task.cancelled() and task.exception() is None:
+            self.last_fetches[exchange] = (time.monotonic(), task.result())
+    
+    async def run_fetch(self, exchange: str) -> Dict:
+        """Obtener los datos normalizados de un exchange dentro de su timeout.
+        
+        Un adaptador lento solo pierde su propio ciclo: no retrasa al resto.
+        """
+        adapter = self.adapters[exchange]
+        started = time.perf_counter()
         try:
-            await self.init_session()
-            url = f"{self.exchanges['kucoin']['base_url']}{self.exchanges['kucoin']['ticker_endpoint']}"
+            data = await asyncio.wait_for(adapter.poll(), adapter.timeout)
+            if not data:
+                EXCHANGE_FETCH_ERRORS.inc(exchange=exchange, reason='empty')
+            EXCHANGE_SYMBOLS.set(len(data), exchange=exchange)
+            return data
+        except asyncio.TimeoutError:
+            EXCHANGE_FETCH_ERRORS.inc(exchange=exchange, reason='timeout')
+            logger.error(f"{adapter.display_name} no respondió en {adapter.timeout} segundos")
+        except Exception as e:
+            EXCHANGE_FETCH_ERRORS.inc(exchange=exchange, reason='error')
+            logger.error(f"Error en {adapter.display_name}: {e}")
+        finally:
+            EXCHANGE_FETCH_SECONDS.observe(time.perf_counter() - started, exchange=exchange)
+        return {}
+    
+    def update_exchange(self, exchange: str, data: Dict):
+        """Guardar el resultado de una consulta completándolo con los últimos valores conocidos."""
+        self.exchange_data[exchange] = self.quote_cache.merge(exchange, data)
+    
+    def publish_aggregate(self) -> Dict:
+        """Agregar los últimos datos de cada exchange y publicar el snapshot."""
+        with PUBLISH_SECONDS.time():
+            # Combinar datos de todos los exchanges (cálculo por columnas)
+            aggregated_data = self.engine.aggregate(self.exchange_data)
+            self.pricing.apply_all(aggregated_data)
+            self.analytics.apply_all(aggregated_data)
             
-            async with self.session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    normalized_data = {}
-                    
-                    if 'data' in data and 'ticker' in data['data']:
-                        for item in data['data']['ticker']:
-                            symbol_pair = item['symbol']
-                            # Filtrar solo los símbolos que nos interesan (terminados en -USDT)
-                            if symbol_pair.endswith('-USDT'):
-                                base_symbol = symbol_pair.replace('-USDT', '')
-                                if base_symbol in self.target_symbols:
-                                    normalized_data[base_symbol] = {
-                                        'exchange': 'kucoin',
-                                        'symbol': base_symbol,
-                                        'price': float(item['last']),
-                                        'change_24h': float(item['changePrice']),
-                                        'change_24h_percent': float(item['changeRate']) * 100,
-                                        'volume_24h': float(item['vol']),
-                                        'timestamp': int(time.time())
-                                    }
-                    
-                    logger.info(f"KuCoin: Obtenidos datos de {len(normalized_data)} símbolos")
-                    return normalized_data
-                else:
-                    logger.error(f"Error al obtener datos de KuCoin: {response.status}")
-                    return {}
+            self.latest_data = aggregated_data
+            logger.info(f"Agregación completada: {len(aggregated_data)} símbolos procesados")
+            self.publish_snapshot(aggregated_data)
+            self.record_history(aggregated_data)
+        return aggregated_data
+    
+    def record_history(self, aggregated_data: Dict):
+        """Registrar la publicación en el histórico (después del snapshot: un fallo no lo retrasa)."""
+        try:
+            self.history_store.record(aggregated_data)
         except Exception as e:
-            logger.error(f"Error al conectar con KuCoin: {e}")
-            return {}
+            HISTORY_WRITE_ERRORS.inc()
+            logger.error(f"Error registrando histórico: {e}")
     
-    async def aggregate_data(self) -> Dict:
-        """Agregar datos de todos los exchanges."""
+    async def aggregate_data(self, wait_all: bool = False) -> Dict:
+        """Agregar datos de todos los exchanges, compartiendo la agregación en curso.
+        
+        Las llamadas concurrentes esperan al mismo ciclo (con el wait_all del
+        primero) y si el último terminó hace menos de min_refresh_interval se
+        devuelven sus datos sin volver a consultar los exchanges.
+        """
+        task = self.inflight_aggregation
+        if task is None:
+            if self.latest_data and time.monotonic() - self.last_aggregation < self.min_refresh_interval:
+                return self.latest_data
+            task = asyncio.create_task(self.run_aggregation(wait_all))
+            self.inflight_aggregation = task
+            task.add_done_callback(self.finish_aggregation)
+        return await asyncio.shield(task)
+    
+    def finish_aggregation(self, task: asyncio.Task):
+        if self.inflight_aggregation is task:
+            self.inflight_aggregation = None
+        self.last_aggregation = time.monotonic()
+    
+    async def run_aggregation(self, wait_all: bool = False) -> Dict:
+        """Ejecutar un ciclo de agregación.
+        
+        Se publica lo que haya llegado al vencer `publish_deadline` (los exchanges
+        que faltan conservan su último valor conocido) y cada respuesta tardía se
+        incorpora después como una actualización incremental. Con wait_all se
+        espera a todos, p. ej. en una agregación puntual fuera del bucle.
+        """
         logger.info("Iniciando agregación de datos...")
+        started = time.monotonic()
         
         # Ejecutar todas las llamadas a APIs en paralelo
-        binance_task = self.fetch_binance_data()
-        coinbase_task = self.fetch_coinbase_data()
-        kucoin_task = self.fetch_kucoin_data()
+        tasks = {
+            asyncio.create_task(self.fetch_exchange(exchange)): exchange
+            for exchange in self.adapters
+        }
+        done, pending = await asyncio.wait(tasks, timeout=None if wait_all else self.publish_deadline)
         
-        binance_data, coinbase_data, kucoin_data = await asyncio.gather(
-            binance_task, coinbase_task, kucoin_task, return_exceptions=True
-        )
+        for task in done:
+            # Completar con los últimos valores conocidos (marcados como stale)
+            self.update_exchange(tasks[task], task.result())
+        aggregated_data = self.publish_aggregate()
+        AGGREGATION_SECONDS.observe(time.monotonic() - started)
         
-        # Manejar excepciones
-        if isinstance(binance_data, Exception):
-            logger.error(f"Error en Binance: {binance_data}")
-            binance_data = {}
-        if isinstance(coinbase_data, Exception):
-            logger.error(f"Error en Coinbase: {coinbase_data}")
-            coinbase_data = {}
-        if isinstance(kucoin_data, Exception):
-            logger.error(f"Error en KuCoin: {kucoin_data}")
-            kucoin_data = {}
+        if pending:
+            late = ', '.join(self.exchanges[tasks[task]]['name'] for task in pending)
+            logger.info(f"Snapshot publicado a los {(time.monotonic() - started) * 1000:.0f} ms "
+                        f"sin esperar a: {late}")
+            for task in pending:
+                self.late_fetches.add(task)
+                task.add_done_callback(partial(self.fold_late_result, tasks[task]))
+        return aggregated_data
+    
+    def fold_late_result(self, exchange: str, task: asyncio.Task):
+        """Incorporar la respuesta de un exchange que llegó tras la publicación del ciclo."""
+        self.late_fetches.discard(task)
+        if task.cancelled():
+            return
+        logger.info(f"{self.exchanges[exchange]['name']} llegó tarde: publicando actualización")
+        self.on_exchange_data(exchange, task.result())
+    
+    def publish_snapshot(self, data: Dict, version: Optional[int] = None, timestamp: Optional[int] = None):
+        """Construir el snapshot pre-serializado del ciclo y publicarlo en el bus."""
+        if version is None:
+            version = self.snapshot.version + 1
+        self.snapshot = PriceSnapshot(data, version, timestamp)
+        self.last_publish = time.monotonic()
+        SNAPSHOT_VERSION.set(self.snapshot.version)
+        SNAPSHOT_BYTES.set(len(self.snapshot.body))
+        self.bus.publish(self.snapshot)
+    
+    def receive_snapshot(self, data: Dict, version: Optional[int] = None, timestamp: Optional[int] = None):
+        """Adoptar un snapshot agregado por otro proceso (feed compartido)."""
+        self.latest_data = data
+        self.publish_snapshot(data, version, timestamp)
+    
+    def get_snapshot(self) -> PriceSnapshot:
+        """Obtener el último snapshot pre-serializado."""
+        return self.snapshot
+    
+    async def get_binance_data(self) -> Dict:
+        """Obtener datos de Binance desde el stream si está vivo, o por REST si no."""
+        return await self.adapters['binance'].poll()
+    
+    def is_stream_fresh(self) -> bool:
+        """Indicar si el stream del exchange está conectado y recibiendo mensajes."""
+        return (
+            self.stream_connected
+            and bool(self.stream_data['binance'])
+            and time.time() - self.stream_last_message < self.stream_stale_after
+        )
+    
+    def apply_exchange_updates(self, exchange: str, updates: Dict):
+        """Aplicar actualizaciones incrementales de un exchange sobre latest_data."""
+        for symbol, ticker in updates.items():
+            symbol_data = self.latest_data.get(symbol)
+            if symbol_data is None:
+                symbol_data = {
+                    'symbol': symbol,
+                    'exchanges': {},
+                    'average_price': 0,
+                    'price_sources': 0,
+                    'timestamp': int(time.time())
+                }
+                self.latest_data[symbol] = symbol_data
+            
+            symbol_data['exchanges'][exchange] = ticker
+            symbol_data.update(summarize_prices(symbol_data['exchanges'].values()))
+            symbol_data['timestamp'] = ticker['timestamp']
+            # Solo se recalcula el precio consolidado de los símbolos actualizados
+            self.pricing.apply(symbol_data)
+            self.analytics.apply(symbol_data)
+    
+    async def start_binance_stream(self, url: Optional[str] = None, max_backoff: float = 60):
+        """Mantener una conexión persistente al stream !ticker@arr de Binance.
         
-        # Combinar datos de todos los exchanges
-        aggregated_data = {}
+        Cada mensaje trae solo los tickers que cambiaron en el último segundo;
+        se aplican de forma incremental sobre latest_data. Si la conexión se
+        pierde se reintenta con backoff exponencial (con jitter).
+        """
+        url = url or self.exchanges['binance']['websocket_url']
+        backoff = min(1, max_backoff)
+        self.stream_running = True
+        logger.info(f"Iniciando stream de Binance: {url}")
         
-        for symbol in self.target_symbols:
-            symbol_data = {
-                'symbol': symbol,
-                'exchanges': {},
-                'average_price': 0,
-                'price_sources': 0,
-                'timestamp': int(time.time())
-            }
-            
-            total_price = 0
-            price_count = 0
-            
-            # Agregar datos de Binance
-            if symbol in binance_data:
-                symbol_data['exchanges']['binance'] = binance_data[symbol]
-                total_price += binance_data[symbol]['price']
-                price_count += 1
-            
-            # Agregar datos de Coinbase
-            if symbol in coinbase_data:
-                symbol_data['exchanges']['coinbase'] = coinbase_data[symbol]
-                total_price += coinbase_data[symbol]['price']
-                price_count += 1
-            
-            # Agregar datos de KuCoin
-            if symbol in kucoin_data:
-                symbol_data['exchanges']['kucoin'] = kucoin_data[symbol]
-                total_price += kucoin_data[symbol]['price']
-                price_count += 1
+        while self.stream_running:
+            try:
+                await self.init_session()
+                async with self.session.ws_connect(url, heartbeat=30) as ws:
+                    self.stream_connected = True
+                    backoff = min(1, max_backoff)
+                    logger.info("Stream de Binance conectado")
+                    
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self.handle_binance_stream_message(json.loads(msg.data))
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+                        if not self.stream_running:
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en el stream de Binance: {e}")
+            finally:
+                self.stream_connected = False
             
-            # Calcular precio promedio si hay datos disponibles
-            if price_count > 0:
-                symbol_data['average_price'] = total_price / price_count
-                symbol_data['price_sources'] = price_count
-                aggregated_data[symbol] = symbol_data
+            if self.stream_running:
+                delay = min(backoff + random.uniform(0, backoff / 2), max_backoff)
+                logger.warning(f"Stream de Binance desconectado, reintentando en {delay:.1f} segundos")
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, max_backoff)
+    
+    def handle_binance_stream_message(self, message):
+        """Procesar un mensaje del stream !ticker@arr (lista de eventos 24hrTicker)."""
+        events = message if isinstance(message, list) else [message]
+        updates = {}
+        for event in events:
+            ticker = self.parse_binance_ticker(event)
+            if ticker:
+                updates[ticker.symbol] = ticker
         
-        self.latest_data = aggregated_data
-        logger.info(f"Agregación completada: {len(aggregated_data)} símbolos procesados")
-        return aggregated_data
+        self.stream_last_message = time.time()
+        if updates:
+            self.stream_data['binance'].update(updates)
+            # También en exchange_data: cualquier agregación posterior (p. ej. al
+            # llegar la consulta de otro exchange) parte del último tick del stream
+            if 'binance' in self.exchange_data:
+                self.exchange_data['binance'].update(updates)
+            self.apply_exchange_updates('binance', updates)
+            self.schedule_stream_publish()
+    
+    def schedule_stream_publish(self):
+        """Publicar los ticks del stream en el próximo hueco de stream_publish_interval.
+        
+        Los mensajes que llegan mientras hay una publicación programada se
+        incorporan a ella, así que una ráfaga de ticks produce un solo snapshot.
+        """
+        if self.stream_publish_handle is not None:
+            return
+        delay = self.last_publish + self.stream_publish_interval - time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or delay <= 0:
+            self.publish_aggregate()
+        else:
+            self.stream_publish_handle = loop.call_later(delay, self.flush_stream_publish)
+    
+    def flush_stream_publish(self):
+        self.stream_publish_handle = None
+        try:
+            self.publish_aggregate()
+        except Exception as e:
+            logger.error(f"Error publicando los ticks del stream: {e}")
+    
+    def stop_binance_stream(self):
+        """Detener el stream de Binance."""
+        self.stream_running = False
+        if self.stream_publish_handle is not None:
+            self.stream_publish_handle.cancel()
+            self.stream_publish_handle = None
+        logger.info("Stream de Binance detenido")
+    
+    def get_exchange_status(self) -> Dict:
+        """Estado de frescura de cada exchange según la caché de últimos valores."""
+        return self.quote_cache.get_status()
     
     def get_latest_data(self) -> Dict:
         """Obtener los últimos datos agregados."""
         return self.latest_data
     
+    def get_analytics(self, symbols: Optional[List[str]] = None, window: Optional[str] = None) -> Dict:
+        """Estadísticas móviles de los últimos datos por símbolo (todas las ventanas o solo `window`)."""
+        if window is not None and window not in self.analytics.windows:
+            raise ValueError(f"Ventana no soportada: {window}")
+        rows = self.latest_data
+        selected = rows if symbols is None else [symbol for symbol in symbols if symbol in rows]
+        result = {}
+        for symbol in selected:
+            analytics = rows[symbol].get('analytics')
+            if analytics is not None:
+                result[symbol] = analytics if window is None else {window: analytics.get(window)}
+        return result
+    
+    def report_clients(self, source: str, count: Optional[int], ttl: Optional[float] = None):
+        """Registrar cuántos clientes atiende una fuente (servidor WebSocket, API, worker).
+        
+        Con count None se olvida la fuente; con ttl el reporte caduca si no se renueva.
+        """
+        if count is None:
+            self.client_reports.pop(source, None)
+        else:
+            self.client_reports[source] = (count, time.time() + ttl if ttl else None)
+    
+    def get_client_count(self) -> Optional[int]:
+        """Clientes conectados según los reportes vigentes, o None si nadie ha reportado."""
+        now = time.time()
+        counts = [
+            count for count, expires_at in list(self.client_reports.values())
+            if expires_at is None or expires_at > now
+        ]
+        return sum(counts) if counts else None
+    
+    def build_scheduler(self, interval: int = 10) -> AdaptiveScheduler:
+        """Un temporizador por exchange con su propio intervalo y circuit breaker."""
+        pollers = {
+            exchange: ExchangePoller(
+                exchange,
+                lambda exchange=exchange: self.fetch_exchange(exchange),
+                adapter.poll_interval or interval
+            )
+            for exchange, adapter in self.adapters.items()
+        }
+        return AdaptiveScheduler(pollers, self.on_exchange_data, self.get_client_count)
+    
+    def on_exchange_data(self, exchange: str, data: Dict):
+        self.update_exchange(exchange, data)
+        self.publish_aggregate()
+    
+    def get_scheduler_status(self) -> Dict:
+        """Intervalo actual, fallos y estado del circuito de cada exchange."""
+        return self.scheduler.get_status() if self.scheduler else {}
+    
     async def start_periodic_update(self, interval: int = 10):
-        """Iniciar actualizaciones periódicas de datos."""
-        logger.info(f"Iniciando actualizaciones periódicas cada {interval} segundos")
+        """Iniciar actualizaciones periódicas de datos.
         
-        while True:
-            try:
-                await self.aggregate_data()
-                await asyncio.sleep(interval)
-            except Exception as e:
-                logger.error(f"Error en actualización periódica: {e}")
-                await asyncio.sleep(interval)
+        Tras un primer ciclo completo, cada exchange se sondea con su propio
+        temporizador adaptativo (ver scheduler.AdaptiveScheduler).
+        """
+        logger.info(f"Iniciando actualizaciones periódicas (intervalo base {interval} segundos)")
+        
+        try:
+            await self.aggregate_data()
+        except Exception as e:
+            logger.error(f"Error en actualización periódica: {e}")
+        
+        self.scheduler = self.build_scheduler(interval)
+        await self.scheduler.run(skip_first=True)
 
 # Instancia global del agregador
 crypto_aggregator = CryptoDataAggregator()
+SNAPSHOT_AGE_SECONDS.set_function(lambda: time.time() - crypto_aggregator.snapshot.timestamp)
 
@@ -0,0 +1,344 @@
+import bisect
+import fcntl
+import logging
+import mmap
+import os
+import queue
+import re
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(__file__)
+# Misma base de datos SQLite que configura main.py; aquí solo se guardan metadatos.
+# Ambas rutas se pueden cambiar por entorno (p. ej. para no escribir en el checkout)
+DEFAULT_DB_PATH = os.environ.get('CRIPTOVIEW_DB_PATH', os.path.join(BASE_DIR, 'database', 'app.db'))
+DEFAULT_HISTORY_DIR = os.environ.get('CRIPTOVIEW_HISTORY_DIR', os.path.join(BASE_DIR, 'database', 'history'))
+
+# Registros binarios de tamaño fijo: permiten bisección directa sobre el fichero mapeado
+TICK_RECORD = struct.Struct('<3d')     # time, price, volume_24h
+CANDLE_RECORD = struct.Struct('<6d')   # open_time, open, high, low, close, volume
+
+RESOLUTIONS = {'1m': 60, '5m': 300, '1h': 3600}
+
+# Ficheros abiertos a la vez como máximo (cada serie usa 4: ticks y 3 resoluciones);
+# el resto se cierra y se reabre al volver a escribir en él
+MAX_OPEN_FILES = 256
+# Ciclos pendientes de escribir como máximo (a 4 publicaciones por segundo, ~15 s)
+MAX_PENDING_BATCHES = 64
+
+# Serie con el precio consolidado del símbolo (además de una por exchange)
+AVERAGE_SERIES = 'average'
+
+SERIES_NAME = re.compile(r'^[A-Za-z0-9]+$')
+
+
+class RecordFile:
+    """Vista de solo lectura de un fichero de registros ordenados por tiempo.
+
+    El primer campo de cada registro es el tiempo, así que un rango se localiza
+    con dos bisecciones sobre el fichero mapeado, sin recorrer los registros.
+    """
+
+    def __init__(self, path: str, record: struct.Struct):
+        self.record = record
+        self.fields = record.size // 8
+        self.mm = None
+        self.values = None
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        self.count = size // record.size
+        if self.count:
+            with open(path, 'rb') as f:
+                self.mm = mmap.mmap(f.fileno(), self.count * record.size, access=mmap.ACCESS_READ)
+            self.values = memoryview(self.mm).cast('d')
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int) -> float:
+        return self.values[index * self.fields]
+
+    def range(self, start: float, end: float, limit: int) -> List[tuple]:
+        """Registros con tiempo en [start, end]; los `limit` más recientes."""
+        if not self.count:
+            return []
+        lo = bisect.bisect_left(self, start)
+        hi = bisect.bisect_right(self, end)
+        lo = max(lo, hi - limit)
+        return [tuple(self.values[i * self.fields:(i + 1) * self.fields]) for i in range(lo, hi)]
+
+    def close(self):
+        if self.values is not None:
+            self.values.release()
+            self.mm.close()
+
+
+class HistoryStore:
+    """Almacén histórico append-only de ticks y velas OHLCV por símbolo y exchange.
+
+    Cada tick agregado se añade al fichero de ticks de su serie y actualiza de
+    forma incremental las velas de 1m/5m/1h (la vela abierta se reescribe en
+    su sitio). El volumen de una vela es el negociado durante ella: la suma
+    de los aumentos del volumen 24h entre ticks consecutivos (los exchanges
+    solo publican ese acumulado móvil; las bajadas cuentan como 0).
+
+    Solo un proceso escribe: el que obtiene el lock del directorio. `record`
+    solo copia los ticks del ciclo y los encola; un hilo escritor hace la E/S
+    (agrupando los ciclos que se hayan acumulado), así que la publicación no
+    espera al disco. Se mantienen abiertos como mucho `max_open_files`
+    ficheros (LRU), así que seguir miles de símbolos no agota los
+    descriptores del proceso.
+    """
+
+    def __init__(self, base_dir: str = DEFAULT_HISTORY_DIR, db_path: str = DEFAULT_DB_PATH,
+                 metadata_interval: float = 60, max_open_files: int = MAX_OPEN_FILES):
+        self.base_dir = base_dir
+        self.db_path = db_path
+        self.metadata_interval = metadata_interval
+        self.max_open_files = max_open_files
+        self.last_metadata_update = 0.0
+        self.writable = None
+        self.lock_file = None
+        self.files: OrderedDict = OrderedDict()
+        self.last_ticks = {}
+        self.open_candles = {}
+        self.series_stats = {}
+        # Ciclos pendientes para el hilo escritor y último error de escritura
+        self.pending: queue.Queue = queue.Queue(MAX_PENDING_BATCHES)
+        self.writer: Optional[threading.Thread] = None
+        self.writer_error: Optional[Exception] = None
+
+    def path(self, symbol: str, series: str, resolution: str = 'tick') -> str:
+        if not SERIES_NAME.match(symbol) or not SERIES_NAME.match(series):
+            raise ValueError(f"Serie inválida: {symbol}/{series}")
+        return os.path.join(self.base_dir, symbol.upper(), f"{series.lower()}_{resolution}.bin")
+
+    def acquire_writer(self) -> bool:
+        """Intentar ser el único proceso escritor del histórico."""
+        if self.writable is None:
+            os.makedirs(self.base_dir, exist_ok=True)
+            self.lock_file = open(os.path.join(self.base_dir, '.writer.lock'), 'w')
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.writable = True
+            except BlockingIOError:
+                logger.info("Otro proceso ya escribe el histórico; este solo lo leerá")
+                self.writable = False
+        return self.writable
+
+    def open_file(self, path: str):
+        f = self.files.get(path)
+        if f is not None:
+            self.files.move_to_end(path)
+            return f
+        while len(self.files) >= self.max_open_files:
+            _, oldest = self.files.popitem(last=False)
+            oldest.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        self.files[path] = f
+        return f
+
+    def record(self, aggregated_data: Dict):
+        """Encolar un ciclo de agregación: un tick por símbolo y exchange.
+
+        La serie del símbolo guarda el precio consolidado (el que ven los
+        clientes). Se lanza el error de la última escritura fallida y
+        RuntimeError si el escritor va tan atrasado que la cola está llena.
+        """
+        error, self.writer_error = self.writer_error, None
+        if error is not None:
+            raise error
+        if not self.acquire_writer():
+            return
+        # Las filas se modifican en el siguiente ciclo: copiar ahora los valores
+        batch = []
+        for symbol, symbol_data in aggregated_data.items():
+            for exchange, ticker in symbol_data['exchanges'].items():
+                batch.append((symbol, exchange, ticker['timestamp'], ticker['price'], ticker.get('volume_24h', 0)))
+            batch.append((symbol, AVERAGE_SERIES, symbol_data['timestamp'],
+                          symbol_data.get('price', symbol_data['average_price']), 0))
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.run_writer, name='history-writer', daemon=True)
+            self.writer.start()
+        try:
+            self.pending.put_nowait(batch)
+        except queue.Full:
+            raise RuntimeError(f"Escritura del histórico atrasada ({MAX_PENDING_BATCHES} ciclos): ciclo descartado")
+
+    def run_writer(self):
+        """Hilo escritor: escribir los ciclos encolados hasta recibir None."""
+        while True:
+            batches = [self.pending.get()]
+            while True:
+                try:
+                    batches.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write_batches([batch for batch in batches if batch is not None])
+            except Exception as e:
+                logger.error(f"Error escribiendo histórico: {e}")
+                self.writer_error = e
+            finally:
+                for _ in batches:
+                    self.pending.task_done()
+            if None in batches:
+                return
+
+    def write_batches(self, batches: List[list]):
+        for batch in batches:
+            for symbol, series, timestamp, price, volume in batch:
+                self.append_tick(symbol, series, timestamp, price, volume)
+        for f in self.files.values():
+            f.flush()
+        if time.time() - self.last_metadata_update >= self.metadata_interval:
+            self.update_metadata()
+
+    def sync(self):
+        """Esperar a que el hilo escritor haya escrito todo lo encolado."""
+        if self.writer is not None:
+            self.pending.join()
+
+    def append_tick(self, symbol: str, series: str, timestamp: float, price: float, volume: float):
+        """Añadir un tick y actualizar las velas de todas las resoluciones."""
+        key = (symbol, series)
+        last = self.last_ticks.get(key)
+        # El stream puede repetir el mismo ticker en varios ciclos: no duplicarlo
+        if last is not None and last[:2] == (timestamp, price):
+            return
+        self.last_ticks[key] = (timestamp, price, volume)
+        # Volumen negociado desde el tick anterior (0 sin tick anterior en este proceso)
+        traded = max(volume - last[2], 0.0) if last is not None else 0.0
+
+        f = self.open_file(self.path(symbol, series))
+        f.seek(0, os.SEEK_END)
+        f.write(TICK_RECORD.pack(timestamp, price, volume))
+        self.track(symbol, series, 'tick', timestamp, appended=True)
+
+        for resolution, seconds in RESOLUTIONS.items():
+            self.update_candle(symbol, series, resolution, seconds, timestamp, price, traded)
+
+    def update_candle(self, symbol: str, series: str, resolution: str, seconds: int,
+                      timestamp: float, price: float, traded: float):
+        key = (symbol, series, resolution)
+        path = self.path(symbol, series, resolution)
+        f = self.open_file(path)
+        candle = self.open_candles.get(key)
+        if candle is None:
+            candle = self.load_last_candle(f)
+
+        open_time = timestamp - timestamp % seconds
+        if candle is not None and candle[0] == open_time:
+            candle = [open_time, candle[1], max(candle[2], price), min(candle[3], price), price,
+                      candle[5] + traded]
+            f.seek(-CANDLE_RECORD.size, os.SEEK_END)
+            appended = False
+        elif candle is not None and open_time < candle[0]:
+            # Tick atrasado respecto a la vela abierta: no se reescribe el pasado
+            return
+        else:
+            candle = [open_time, price, price, price, price, traded]
+            f.seek(0, os.SEEK_END)
+            appended = True
+        f.write(CANDLE_RECORD.pack(*candle))
+        self.open_candles[key] = candle
+        self.track(symbol, series, resolution, open_time, appended)
+
+    def load_last_candle(self, f) -> Optional[list]:
+        """Recuperar la última vela del fichero (al reanudar tras un reinicio)."""
+        size = f.seek(0, os.SEEK_END)
+        if size < CANDLE_RECORD.size:
+            return None
+        f.seek(size - size % CANDLE_RECORD.size - CANDLE_RECORD.size)
+        return list(CANDLE_RECORD.unpack(f.read(CANDLE_RECORD.size)))
+
+    def track(self, symbol: str, series: str, resolution: str, timestamp: float, appended: bool):
+        stats = self.series_stats.setdefault((symbol, series, resolution), [timestamp, timestamp, 0])
+        stats[1] = timestamp
+        if appended:
+            stats[2] += 1
+
+    def update_metadata(self):
+        """Volcar a SQLite el índice de series (rango temporal y número de registros)."""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS history_series (
+                    symbol TEXT NOT NULL,
+                    series TEXT NOT NULL,
+                    resolution TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    first_time REAL,
+                    last_time REAL,
+                    records INTEGER,
+                    PRIMARY KEY (symbol, series, resolution)
+                )
+            """)
+            for (symbol, series, resolution), (first, last, _) in self.series_stats.items():
+                path = self.path(symbol, series, resolution)
+                record = TICK_RECORD if resolution == 'tick' else CANDLE_RECORD
+                records = os.path.getsize(path) // record.size
+                conn.execute("""
+                    INSERT INTO history_series (symbol, series, resolution, path, first_time, last_time, records)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (symbol, series, resolution) DO UPDATE SET
+                        first_time = MIN(first_time, excluded.first_time),
+                        last_time = excluded.last_time,
+                        records = excluded.records
+                """, (symbol, series, resolution, path, first, last, records))
+        self.last_metadata_update = time.time()
+
+    def list_series(self, symbol: Optional[str] = None) -> List[Dict]:
+        """Series registradas según los metadatos de SQLite."""
+        if not os.path.exists(self.db_path):
+            return []
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            try:
+                query = "SELECT symbol, series, resolution, first_time, last_time, records FROM history_series"
+                if symbol:
+                    rows = conn.execute(query + " WHERE symbol = ?", (symbol.upper(),)).fetchall()
+                else:
+                    rows = conn.execute(query).fetchall()
+            except sqlite3.OperationalError:
+                return []
+        return [dict(row) for row in rows]
+
+    def query(self, symbol: str, series: str = AVERAGE_SERIES, resolution: str = '1m',
+              start: Optional[float] = None, end: Optional[float] = None, limit: int = 1000) -> List[Dict]:
+        """Consultar ticks ('tick') o velas ('1m', '5m', '1h') en un rango temporal."""
+        if resolution != 'tick' and resolution not in RESOLUTIONS:
+            raise ValueError(f"Resolución no soportada: {resolution}")
+        start = 0 if start is None else start
+        end = time.time() if end is None else end
+
+        record = TICK_RECORD if resolution == 'tick' else CANDLE_RECORD
+        view = RecordFile(self.path(symbol, series, resolution), record)
+        try:
+            rows = view.range(start, end, limit)
+        finally:
+            view.close()
+
+        if resolution == 'tick':
+            return [{'time': t, 'price': p, 'volume_24h': v} for t, p, v in rows]
+        return [
+            {'time': t, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+            for t, o, h, l, c, v in rows
+        ]
+
+    def close(self):
+        if self.writer is not None:
+            self.pending.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.writable:
+            self.update_metadata()
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
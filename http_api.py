@@ -0,0 +1,189 @@
+"""
+API REST de CriptoView servida desde el mismo runtime asyncio que el agregador.
+
+Se aloja junto al servidor WebSocket (ver start_websocket_server): las
+lecturas son consultas al último snapshot pre-serializado, sin hilos ni
+bucles de eventos por petición, y mientras no exista un primer snapshot
+todas las peticiones esperan al mismo ciclo de agregación en curso.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiohttp import web
+
+from crypto_aggregator import crypto_aggregator
+from history_store import AVERAGE_SERIES, RESOLUTIONS
+from metrics import CONTENT_TYPE, render_metrics
+from price_snapshot import brotli
+
+logger = logging.getLogger(__name__)
+
+# Segundos que una petición en frío espera al primer snapshot antes de responder 503
+COLD_START_TIMEOUT = 15
+
+
+def error_response(message: str, status: int) -> web.Response:
+    return web.json_response({
+        'success': False,
+        'error': message,
+        'timestamp': int(time.time())
+    }, status=status)
+
+
+def negotiate_encoding(request: web.Request) -> Optional[str]:
+    """Codificación precomprimida del snapshot que acepta el cliente (br, gzip o ninguna)."""
+    accepted = {part.split(';')[0].strip() for part in request.headers.get('Accept-Encoding', '').split(',')}
+    if brotli and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+@web.middleware
+async def cors_middleware(request: web.Request, handler):
+    """Equivalente a flask_cors.cross_origin: permitir cualquier origen."""
+    if request.method == 'OPTIONS':
+        response = web.Response()
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = request.headers.get(
+            'Access-Control-Request-Headers', '*')
+    else:
+        response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+async def health_check(request: web.Request) -> web.Response:
+    """Endpoint de verificación de salud."""
+    aggregator = request.app['aggregator']
+    return web.json_response({
+        'status': 'healthy',
+        'timestamp': int(time.time()),
+        'service': 'CriptoView Backend',
+        # Solo lo rellena el proceso que consulta los exchanges
+        'exchanges': aggregator.get_exchange_status(),
+        'scheduler': aggregator.get_scheduler_status()
+    })
+
+
+async def get_crypto_prices(request: web.Request) -> web.Response:
+    """Obtener precios actuales de criptomonedas (último snapshot, con ETag y compresión)."""
+    aggregator = request.app['aggregator']
+    # Hay clientes HTTP consultando: mantener la cadencia normal durante un minuto
+    aggregator.report_clients('http', 1, ttl=60)
+    try:
+        # En frío, todas las peticiones esperan al mismo ciclo del bucle de agregación
+        if not aggregator.get_latest_data():
+            if not await aggregator.bus.wait_for_snapshot_async(COLD_START_TIMEOUT):
+                return error_response('Datos todavía no disponibles', 503)
+
+        snapshot = aggregator.get_snapshot()
+        etag_header = {'ETag': f'"{snapshot.etag}"'}
+        if any(etag.value == snapshot.etag for etag in request.if_none_match or ()):
+            return web.Response(status=304, headers=etag_header)
+
+        encoding = negotiate_encoding(request)
+        headers = {**etag_header, 'Vary': 'Accept-Encoding'}
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        body = snapshot.encoded_body(encoding) if encoding else snapshot.body
+        return web.Response(body=body, content_type='application/json', headers=headers)
+
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def get_crypto_history(request: web.Request) -> web.Response:
+    """Obtener histórico de un símbolo: velas OHLCV (1m, 5m, 1h) o ticks."""
+    aggregator = request.app['aggregator']
+    symbol = request.match_info['symbol'].upper()
+    resolution = request.query.get('resolution', '1m')
+    exchange = request.query.get('exchange', AVERAGE_SERIES)
+
+    if resolution != 'tick' and resolution not in RESOLUTIONS:
+        return error_response(f"Resolución no soportada: {resolution}", 400)
+
+    try:
+        start = float(request.query['start']) if 'start' in request.query else None
+        end = float(request.query['end']) if 'end' in request.query else None
+        limit = min(int(request.query.get('limit', 1000)), 100000)
+
+        # La lectura de ficheros no debe bloquear el bucle compartido con los WebSockets
+        data = await asyncio.get_running_loop().run_in_executor(
+            None, aggregator.history_store.query, symbol, exchange, resolution, start, end, limit
+        )
+
+        return web.json_response({
+            'success': True,
+            'symbol': symbol,
+            'exchange': exchange,
+            'resolution': resolution,
+            'data': data,
+            'timestamp': int(time.time())
+        })
+
+    except ValueError as e:
+        return error_response(str(e), 400)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def get_crypto_analytics(request: web.Request) -> web.Response:
+    """Estadísticas móviles por símbolo (SMA/EMA, mín/máx, volatilidad y z-score por ventana)."""
+    aggregator = request.app['aggregator']
+    symbol = request.match_info.get('symbol')
+    if symbol:
+        symbols = [symbol.upper()]
+    elif request.query.get('symbols'):
+        symbols = [part.strip().upper() for part in request.query['symbols'].split(',') if part.strip()]
+    else:
+        symbols = None
+
+    try:
+        data = aggregator.get_analytics(symbols, request.query.get('window'))
+        if symbol and not data:
+            return error_response(f"Sin estadísticas para {symbol.upper()}", 404)
+        return web.json_response({
+            'success': True,
+            'windows': aggregator.analytics.windows,
+            'data': data,
+            'timestamp': int(time.time())
+        })
+
+    except ValueError as e:
+        return error_response(str(e), 400)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """Métricas del proceso en formato de texto de Prometheus."""
+    return web.Response(body=render_metrics(), headers={'Content-Type': CONTENT_TYPE})
+
+
+def create_app(aggregator=crypto_aggregator) -> web.Application:
+    """Aplicación aiohttp con las mismas rutas que el blueprint Flask de crypto.py."""
+    app = web.Application(middlewares=[cors_middleware])
+    app['aggregator'] = aggregator
+    app.router.add_get('/api/health', health_check)
+    app.router.add_get('/api/crypto/prices', get_crypto_prices)
+    app.router.add_get('/api/crypto/history/{symbol}', get_crypto_history)
+    app.router.add_get('/api/crypto/analytics', get_crypto_analytics)
+    app.router.add_get('/api/crypto/analytics/{symbol}', get_crypto_analytics)
+    app.router.add_get('/metrics', metrics)
+    return app
+
+
+async def start_http_api(host: str = '0.0.0.0', port: int = 8766, reuse_port: bool = False,
+                         aggregator=crypto_aggregator) -> web.AppRunner:
+    """Arrancar la API en el bucle actual; devolver el runner para detenerla con cleanup()."""
+    runner = web.AppRunner(create_app(aggregator), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None)
+    await site.start()
+    logger.info(f"API REST escuchando en {host}:{port}")
+    return runner
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga local del servidor WebSocket multiproceso de CriptoView.
+
+Publica snapshots sintéticos por el feed Unix (sin tocar los exchanges),
+lanza multiprocess_server.py con distinto número de workers y mide cuántos
+mensajes por segundo llegan a un conjunto de clientes locales. Con escalado
+casi lineal, el throughput debe crecer con los workers hasta agotar núcleos.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import websockets
+
+from price_snapshot import PriceSnapshot
+from snapshot_bus import SnapshotBus, UnixSocketFeedServer
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'multiprocess_server.py')
+SYMBOLS = ['BTC', 'ETH', 'BNB', 'XRP', 'ADA', 'SOL', 'DOGE', 'DOT', 'MATIC', 'LTC']
+
+def synthetic_data(version: int) -> dict:
+    """Datos agregados sintéticos con precios que cambian en cada versión."""
+    data = {}
+    for index, symbol in enumerate(SYMBOLS):
+        price = (index + 1) * 100 * (1 + random.uniform(-0.01, 0.01))
+        data[symbol] = {
+            'symbol': symbol,
+            'exchanges': {
+                'binance': {
+                    'exchange': 'binance', 'symbol': symbol, 'price': price,
+                    'change_24h': 0.0, 'change_24h_percent': 0.0,
+                    'volume_24h': 1000.0, 'timestamp': version
+                }
+            },
+            'average_price': price,
+            'price_sources': 1,
+            'timestamp': version
+        }
+    return data
+
+async def publish_feed(feed_path: str, rate: float, duration: float):
+    """Publicar snapshots sintéticos al ritmo indicado."""
+    bus = SnapshotBus()
+    feed_server = UnixSocketFeedServer(bus, feed_path)
+    await feed_server.start()
+    try:
+        version = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            version += 1
+            bus.publish(PriceSnapshot(synthetic_data(version), version))
+            await asyncio.sleep(1 / rate)
+    finally:
+        await feed_server.stop()
+
+def run_clients(url: str, connections: int, duration: float, results):
+    """Proceso cliente: abre conexiones y cuenta los mensajes recibidos."""
+    async def client(counter):
+        try:
+            async with websockets.connect(url) as websocket:
+                counter['connected'] += 1
+                async for _ in websocket:
+                    counter['messages'] += 1
+        except Exception:
+            counter['errors'] += 1
+
+    async def main():
+        counter = {'connected': 0, 'messages': 0, 'errors': 0}
+        tasks = [asyncio.create_task(client(counter)) for _ in range(connections)]
+        await asyncio.sleep(duration)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        results.put(counter)
+
+    asyncio.run(main())
+
+def run_scenario(workers: int, port: int, connections: int, client_processes: int,
+                 rate: float, duration: float) -> dict:
+    """Medir el throughput del servidor con un número dado de workers."""
+    feed_path = os.path.join(tempfile.mkdtemp(), 'feed.sock')
+    server = subprocess.Popen([
+        sys.executable, SERVER_SCRIPT, '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--feed-path', feed_path, '--no-aggregator'
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        time.sleep(1.5)
+        results = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(
+                target=run_clients,
+                args=(f"ws://127.0.0.1:{port}", connections // client_processes, duration, results)
+            )
+            for _ in range(client_processes)
+        ]
+        for process in clients:
+            process.start()
+
+        asyncio.run(publish_feed(feed_path, rate, duration))
+
+        totals = {'connected': 0, 'messages': 0, 'errors': 0}
+        for _ in clients:
+            for key, value in results.get().items():
+                totals[key] += value
+        for process in clients:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    totals['messages_per_second'] = totals['messages'] / duration
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga del servidor WebSocket multiproceso')
+    parser.add_argument('--workers', default='1,2,4', help='Lista de workers a probar, p. ej. 1,2,4')
+    parser.add_argument('--connections', type=int, default=2000)
+    parser.add_argument('--client-processes', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=20, help='Snapshots por segundo')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=18765)
+    args = parser.parse_args()
+
+    print("🚀 Prueba de carga del servidor WebSocket multiproceso")
+    print("=" * 60)
+    print(f"{'workers':>8} {'conexiones':>11} {'mensajes/s':>12} {'errores':>8} {'escalado':>9}")
+
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        result = run_scenario(workers, args.port, args.connections, args.client_processes,
+                              args.rate, args.duration)
+        baseline = baseline or result['messages_per_second'] or 1
+        print(f"{workers:>8} {result['connected']:>11} {result['messages_per_second']:>12.0f} "
+              f"{result['errors']:>8} {result['messages_per_second'] / baseline:>8.2f}x")
+
+    print("=" * 60)
+    print("Nota: los clientes corren en la misma máquina; usa tantos núcleos libres como workers.")
+
+if __name__ == "__main__":
+    main()
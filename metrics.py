@@ -0,0 +1,212 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Exposición en formato de texto de Prometheus (versión 0.0.4)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Buckets por defecto: de 1 ms a 30 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 10240, 102400, 512000, 1048576, 4194304, 16777216)
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Métrica con etiquetas; cada combinación de valores es una serie."""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.series: Dict[Tuple[str, ...], object] = {}
+        self.function: Optional[Callable[[], object]] = None
+        self.lock = threading.Lock()
+
+    def key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def set_function(self, function: Callable[[], object]) -> 'Metric':
+        """Calcular el valor al exportar: un número, o {valores de etiquetas: número}."""
+        self.function = function
+        return self
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        if self.function is not None:
+            value = self.function()
+            if isinstance(value, dict):
+                return [('', format_labels(self.labels, key if isinstance(key, tuple) else (key,)), v)
+                        for key, v in value.items()]
+            return [('', '', value)]
+        with self.lock:
+            return [('', format_labels(self.labels, key), value) for key, value in self.series.items()]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.series[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    """Histograma acumulado por buckets (más _sum y _count)."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels) -> 'Timer':
+        """Context manager que observa la duración del bloque en segundos."""
+        return Timer(self, labels)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        with self.lock:
+            items = [(key, (list(series[0]), series[1], series[2])) for key, series in self.series.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', format_labels(self.labels, key, f'le="{format_value(float(bound))}"'),
+                                cumulative))
+            samples.append(('_bucket', format_labels(self.labels, key, 'le="+Inf"'), count))
+            samples.append(('_sum', format_labels(self.labels, key), total))
+            samples.append(('_count', format_labels(self.labels, key), count))
+        return samples
+
+
+class Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Conjunto de métricas del proceso, exportables en formato Prometheus."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# Error exportando {metric.name}: {e}")
+        return ('\n'.join(lines) + '\n').encode()
+
+
+REGISTRY = MetricsRegistry()
+
+# Exchanges
+EXCHANGE_FETCH_SECONDS = REGISTRY.histogram(
+    'criptoview_exchange_fetch_seconds', 'Duración de cada consulta a un exchange.', ['exchange'])
+EXCHANGE_FETCH_ERRORS = REGISTRY.counter(
+    'criptoview_exchange_fetch_errors_total', 'Consultas fallidas o agotadas por exchange.', ['exchange', 'reason'])
+EXCHANGE_PAYLOAD_BYTES = REGISTRY.histogram(
+    'criptoview_exchange_payload_bytes', 'Tamaño de las respuestas REST por exchange.', ['exchange'], SIZE_BUCKETS)
+EXCHANGE_PARSE_SECONDS = REGISTRY.histogram(
+    'criptoview_exchange_parse_seconds', 'Tiempo de parseo de las respuestas por exchange.', ['exchange'])
+EXCHANGE_SYMBOLS = REGISTRY.gauge(
+    'criptoview_exchange_symbols', 'Símbolos obtenidos en la última consulta por exchange.', ['exchange'])
+
+# Agregación y snapshots
+AGGREGATION_SECONDS = REGISTRY.histogram(
+    'criptoview_aggregation_cycle_seconds', 'Duración de aggregate_data hasta la primera publicación.')
+PUBLISH_SECONDS = REGISTRY.histogram(
+    'criptoview_publish_seconds', 'Agregación, precio consolidado, histórico y snapshot de una publicación.')
+SNAPSHOT_VERSION = REGISTRY.gauge(
+    'criptoview_snapshot_version', 'Versión del último snapshot publicado o recibido.')
+SNAPSHOT_AGE_SECONDS = REGISTRY.gauge(
+    'criptoview_snapshot_age_seconds', 'Segundos desde el último snapshot.')
+SNAPSHOT_BYTES = REGISTRY.gauge(
+    'criptoview_snapshot_bytes', 'Tamaño del cuerpo JSON del último snapshot.')
+HISTORY_WRITE_ERRORS = REGISTRY.counter(
+    'criptoview_history_write_errors_total', 'Publicaciones cuyo registro en el histórico falló.')
+
+# WebSocket
+WS_CONNECTIONS = REGISTRY.gauge(
+    'criptoview_ws_connections', 'Conexiones WebSocket abiertas en este proceso.')
+BROADCAST_SECONDS = REGISTRY.histogram(
+    'criptoview_ws_broadcast_seconds', 'Tiempo de encolar un snapshot para todos los clientes afectados.')
+WS_QUEUE_DEPTH = REGISTRY.gauge(
+    'criptoview_ws_send_queue_depth', 'Profundidad de las colas de envío por cliente (máxima y total).', ['stat'])
+WS_SLOW_CONSUMER_EVENTS = REGISTRY.counter(
+    'criptoview_ws_slow_consumer_events_total', 'Mensajes descartados/fusionados y desconexiones por cliente lento.',
+    ['event'])
+WS_MESSAGES_SENT = REGISTRY.counter(
+    'criptoview_ws_messages_sent_total', 'Mensajes enviados a clientes WebSocket.')
+
+
+def render_metrics() -> bytes:
+    return REGISTRY.render()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Servidor WebSocket multiproceso para CriptoView.
+
+Un proceso agregador consulta los exchanges y publica los snapshots por el
+feed Unix; N workers comparten el puerto de escucha (SO_REUSEPORT) y cada uno
+atiende sus propias conexiones, de modo que el polling no se multiplica por N.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from crypto_aggregator import crypto_aggregator
+from snapshot_bus import DEFAULT_FEED_PATH, run_shared_aggregation
+from websocket_server import start_websocket_server
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_aggregator(feed_path: str, interval: int, exchange_stream: bool, depth_stream: bool = True):
+    """Proceso agregador: único que habla con los exchanges."""
+    asyncio.run(run_shared_aggregation(crypto_aggregator, interval, feed_path, exchange_stream=exchange_stream,
+                                       depth_stream=depth_stream))
+
+def run_worker(host: str, port: int, feed_path: str, api_port: int = None):
+    """Proceso worker: sirve WebSockets (y la API REST) alimentado por el feed del agregador."""
+    asyncio.run(start_websocket_server(host, port, reuse_port=True, follow_only=True, feed_path=feed_path,
+                                       api_port=api_port))
+
+def start_multiprocess_server(host: str = '0.0.0.0', port: int = 8765, workers: int = None,
+                              feed_path: str = DEFAULT_FEED_PATH, interval: int = 10,
+                              exchange_stream: bool = True, with_aggregator: bool = True,
+                              api_port: int = 8766, depth_stream: bool = True):
+    """Lanzar el agregador y los workers y esperar a que terminen."""
+    workers = workers or os.cpu_count() or 1
+    processes = []
+
+    if with_aggregator:
+        processes.append(multiprocessing.Process(
+            target=run_aggregator, args=(feed_path, interval, exchange_stream, depth_stream),
+            name='criptoview-aggregator', daemon=True
+        ))
+    for index in range(workers):
+        processes.append(multiprocessing.Process(
+            target=run_worker, args=(host, port, feed_path, api_port),
+            name=f'criptoview-worker-{index}', daemon=True
+        ))
+
+    for process in processes:
+        process.start()
+
+    # Con SIGTERM también hay que parar a los hijos: si no, quedarían escuchando en el puerto
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f"Servidor multiproceso iniciado en {host}:{port} con {workers} workers")
+
+    try:
+        for process in processes:
+            process.join()
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Deteniendo servidor multiproceso...")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor WebSocket multiproceso de CriptoView')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--feed-path', default=DEFAULT_FEED_PATH)
+    parser.add_argument('--interval', type=int, default=10)
+    parser.add_argument('--no-exchange-stream', action='store_true',
+                        help='Usar solo polling REST en el agregador')
+    parser.add_argument('--no-depth-stream', action='store_true',
+                        help='No ingerir los libros de órdenes de los exchanges')
+    parser.add_argument('--no-aggregator', action='store_true',
+                        help='No lanzar el agregador (el feed lo publica otro proceso)')
+    parser.add_argument('--api-port', type=int, default=8766,
+                        help='Puerto de la API REST compartido por los workers')
+    args = parser.parse_args()
+
+    start_multiprocess_server(
+        args.host, args.port, args.workers, args.feed_path, args.interval,
+        exchange_stream=not args.no_exchange_stream, with_aggregator=not args.no_aggregator,
+        api_port=args.api_port, depth_stream=not args.no_depth_stream
+    )
+
+if __name__ == "__main__":
+    main()
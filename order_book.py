@@ -0,0 +1,444 @@
+import asyncio
+import bisect
+import heapq
+import json
+import logging
+import random
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import aiohttp
+
+from snapshot_bus import SnapshotBus
+from ticker_stream import json_loads
+
+logger = logging.getLogger(__name__)
+
+# Niveles por lado en el libro consolidado que se publica
+DEFAULT_BOOK_DEPTH = 20
+# Niveles que se conservan por lado y exchange (los diffs pueden añadir más)
+MAX_BOOK_LEVELS = 1000
+# Diffs que se guardan mientras se espera el snapshot de un libro
+MAX_PENDING_UPDATES = 5000
+# Espera (segundos) antes de reintentar el snapshot de un libro tras un fallo;
+# se duplica con cada fallo seguido hasta SNAPSHOT_RETRY_MAX
+SNAPSHOT_RETRY_MIN = 1
+SNAPSHOT_RETRY_MAX = 60
+
+# Eventos normalizados que producen los adaptadores (ver ExchangeAdapter.parse_depth_*):
+#   {'type': 'snapshot', 'symbol': ..., 'bids': [(precio, cantidad)], 'asks': [...], 'sequence': n o None}
+#   {'type': 'update', 'symbol': ..., 'bids': [...], 'asks': [...], 'first': n o None, 'last': n o None}
+# Una cantidad 0 elimina el nivel.
+
+
+class BookSide:
+    """Niveles de precio de un lado del libro, del mejor al peor.
+
+    Las claves ordenadas (precio, o -precio en el lado comprador) viven en
+    una lista que se mantiene con bisect y las cantidades en un diccionario:
+    cambiar la cantidad de un nivel existente es O(1) y añadir o quitar un
+    nivel es una búsqueda binaria más un desplazamiento de memoria; nunca se
+    reordena el lado completo.
+    """
+
+    def __init__(self, descending: bool):
+        self.sign = -1.0 if descending else 1.0
+        self.keys: List[float] = []
+        self.levels: Dict[float, float] = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set(self, price: float, quantity: float):
+        levels = self.levels
+        if quantity <= 0:
+            if price in levels:
+                del levels[price]
+                keys = self.keys
+                del keys[bisect.bisect_left(keys, self.sign * price)]
+        elif price in levels:
+            levels[price] = quantity
+        else:
+            levels[price] = quantity
+            bisect.insort(self.keys, self.sign * price)
+
+    def clear(self):
+        self.keys = []
+        self.levels = {}
+
+    def trim(self, max_levels: int):
+        """Descartar los niveles más alejados del mejor precio."""
+        if len(self.keys) > max_levels:
+            for key in self.keys[max_levels:]:
+                del self.levels[self.sign * key]
+            del self.keys[max_levels:]
+
+    def top(self, count: int) -> List[Tuple[float, float]]:
+        sign = self.sign
+        levels = self.levels
+        return [(sign * key, levels[sign * key]) for key in self.keys[:count]]
+
+    def best(self) -> Optional[float]:
+        return self.sign * self.keys[0] if self.keys else None
+
+
+class OrderBook:
+    """Libro de órdenes de un símbolo en un exchange: snapshot más diffs secuenciados.
+
+    Los diffs llevan el rango de secuencia que cubren (first, last). Los que
+    llegan antes del snapshot se guardan y se aplican tras él; los que ya
+    están incluidos en el snapshot se descartan, y un hueco en la secuencia
+    deja el libro sin sincronizar hasta recibir un snapshot nuevo. Los
+    exchanges sin secuencia (first/last None) aplican los diffs en orden.
+    """
+
+    def __init__(self, exchange: str, symbol: str, max_levels: int = MAX_BOOK_LEVELS):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.max_levels = max_levels
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.sequence: Optional[int] = None
+        self.synced = False
+        self.pending: List[Dict] = []
+        self.updated_at = 0.0
+        self.stats = {'snapshots': 0, 'updates': 0, 'stale': 0, 'gaps': 0}
+
+    def reset(self):
+        """Olvidar el libro (p. ej. al perder la conexión) hasta el próximo snapshot."""
+        self.bids.clear()
+        self.asks.clear()
+        self.sequence = None
+        self.synced = False
+        self.pending = []
+
+    def apply_levels(self, bids: List[Tuple[float, float]], asks: List[Tuple[float, float]]):
+        for price, quantity in bids:
+            self.bids.set(price, quantity)
+        for price, quantity in asks:
+            self.asks.set(price, quantity)
+        # Recorte amortizado: solo cuando un lado dobla el máximo
+        if len(self.bids) > 2 * self.max_levels:
+            self.bids.trim(self.max_levels)
+        if len(self.asks) > 2 * self.max_levels:
+            self.asks.trim(self.max_levels)
+        self.updated_at = time.time()
+
+    def apply_snapshot(self, event: Dict):
+        """Sustituir el libro por un snapshot y aplicar los diffs pendientes posteriores."""
+        self.bids.clear()
+        self.asks.clear()
+        self.apply_levels(event['bids'], event['asks'])
+        self.sequence = event.get('sequence')
+        self.synced = True
+        self.stats['snapshots'] += 1
+        pending, self.pending = self.pending, []
+        for update in pending:
+            self.apply_update(update)
+
+    def apply_update(self, event: Dict) -> bool:
+        """Aplicar un diff; devuelve True si cambió el libro."""
+        if not self.synced:
+            self.pending.append(event)
+            if len(self.pending) > MAX_PENDING_UPDATES:
+                del self.pending[:len(self.pending) - MAX_PENDING_UPDATES]
+            return False
+        first, last = event.get('first'), event.get('last')
+        if last is not None and self.sequence is not None:
+            if last <= self.sequence:
+                self.stats['stale'] += 1
+                return False
+            if first > self.sequence + 1:
+                logger.warning(f"Hueco en el libro {self.exchange}/{self.symbol}: "
+                               f"esperado {self.sequence + 1}, recibido {first}")
+                self.stats['gaps'] += 1
+                self.reset()
+                self.pending.append(event)
+                return False
+        self.apply_levels(event['bids'], event['asks'])
+        if last is not None:
+            self.sequence = last
+        self.stats['updates'] += 1
+        return True
+
+    def top(self, count: int) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+        return self.bids.top(count), self.asks.top(count)
+
+
+def merge_levels(sides: Dict[str, List[Tuple[float, float]]], count: int, descending: bool) -> List[list]:
+    """Fusionar los mejores niveles de cada exchange en `count` niveles [precio, cantidad, {exchange: cantidad}]."""
+    sign = -1.0 if descending else 1.0
+    streams = [
+        [(sign * price, exchange, quantity) for price, quantity in levels]
+        for exchange, levels in sides.items()
+    ]
+    merged = []
+    for key, exchange, quantity in heapq.merge(*streams):
+        price = sign * key
+        if merged and merged[-1][0] == price:
+            level = merged[-1]
+            level[1] += quantity
+            level[2][exchange] = quantity
+            continue
+        if len(merged) == count:
+            break
+        merged.append([price, quantity, {exchange: quantity}])
+    return merged
+
+
+def consolidate_books(books: Dict[str, OrderBook], depth: int = DEFAULT_BOOK_DEPTH) -> Dict:
+    """Libro consolidado top-N de varios exchanges (solo los libros sincronizados)."""
+    bids = {}
+    asks = {}
+    for exchange, book in books.items():
+        if book.synced:
+            bids[exchange], asks[exchange] = book.top(depth)
+    merged_bids = merge_levels(bids, depth, descending=True)
+    merged_asks = merge_levels(asks, depth, descending=False)
+
+    best_bid = merged_bids[0][0] if merged_bids else None
+    best_ask = merged_asks[0][0] if merged_asks else None
+    mid = (best_bid + best_ask) / 2 if best_bid is not None and best_ask is not None else None
+    return {
+        'bids': merged_bids,
+        'asks': merged_asks,
+        'best_bid': best_bid,
+        'best_ask': best_ask,
+        'mid': mid,
+        'spread_percent': (best_ask - best_bid) / mid * 100 if mid else None,
+        'exchanges': {
+            exchange: {'synced': book.synced, 'sequence': book.sequence, 'updated_at': book.updated_at}
+            for exchange, book in books.items()
+        }
+    }
+
+
+async def send_pings(ws, adapter):
+    """Pings a nivel de aplicación en el stream de profundidad de los exchanges que los exigen."""
+    while True:
+        await asyncio.sleep(adapter.depth_ping_interval)
+        await ws.send_json(adapter.depth_ping_message())
+
+
+class DepthManager:
+    """Ingesta de profundidad de los exchanges y libros consolidados por símbolo.
+
+    Mantiene un OrderBook por exchange y símbolo a partir de los streams de
+    diffs de cada adaptador (con snapshots REST o en el propio stream) y cada
+    `publish_interval` segundos publica en `bus` el libro consolidado top-N
+    de los símbolos que cambiaron: {'version', 'timestamp', 'books': {símbolo: libro}}.
+    Los procesos que siguen el feed compartido reciben esos lotes con receive().
+    """
+
+    def __init__(self, aggregator, depth: int = DEFAULT_BOOK_DEPTH, max_levels: int = MAX_BOOK_LEVELS,
+                 publish_interval: float = 0.25):
+        self.aggregator = aggregator
+        self.depth = depth
+        self.max_levels = max_levels
+        self.publish_interval = publish_interval
+        # símbolo -> exchange -> libro
+        self.books: Dict[str, Dict[str, OrderBook]] = {}
+        self.dirty: Set[str] = set()
+        # Último libro consolidado publicado por símbolo y su mensaje WebSocket ya serializado
+        self.consolidated: Dict[str, Dict] = {}
+        self.messages: Dict[str, str] = {}
+        self.version = 0
+        self.bus = SnapshotBus()
+        self.snapshot_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        # (exchange, símbolo) -> (fallos seguidos, instante a partir del que se puede reintentar)
+        self.snapshot_retry: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self.running = False
+        self.stats = {'messages': 0, 'updates': 0, 'snapshot_requests': 0, 'snapshot_failures': 0,
+                      'published': 0}
+
+    def book(self, exchange: str, symbol: str) -> OrderBook:
+        books = self.books.setdefault(symbol, {})
+        book = books.get(exchange)
+        if book is None:
+            book = books[exchange] = OrderBook(exchange, symbol, self.max_levels)
+        return book
+
+    def handle(self, exchange: str, event: Dict):
+        """Aplicar un evento normalizado (snapshot o diff) al libro correspondiente."""
+        book = self.book(exchange, event['symbol'])
+        if event['type'] == 'snapshot':
+            book.apply_snapshot(event)
+            self.dirty.add(book.symbol)
+            return
+        self.stats['updates'] += 1
+        if book.apply_update(event):
+            self.dirty.add(book.symbol)
+        elif not book.synced:
+            self.request_snapshot(exchange, book.symbol)
+
+    def handle_message(self, exchange: str, message):
+        """Procesar un mensaje crudo del stream de profundidad de un exchange."""
+        self.stats['messages'] += 1
+        for event in self.aggregator.adapters[exchange].parse_depth_message(message):
+            self.handle(exchange, event)
+
+    def request_snapshot(self, exchange: str, symbol: str):
+        """Pedir (una sola vez a la vez) el snapshot REST de un libro sin sincronizar.
+
+        Tras un fallo no se vuelve a pedir hasta que pasa la espera del libro
+        (backoff exponencial con jitter); las peticiones de todos los libros del
+        exchange pasan además por su límite de snapshots (depth_snapshot_rate).
+        """
+        adapter = self.aggregator.adapters[exchange]
+        key = (exchange, symbol)
+        if adapter.depth_snapshot_in_stream or key in self.snapshot_tasks or not self.running:
+            return
+        retry = self.snapshot_retry.get(key)
+        if retry is not None and time.monotonic() < retry[1]:
+            return
+        self.stats['snapshot_requests'] += 1
+        task = asyncio.create_task(self.fetch_snapshot(exchange, symbol))
+        self.snapshot_tasks[key] = task
+        task.add_done_callback(lambda _: self.snapshot_tasks.pop(key, None))
+
+    async def fetch_snapshot(self, exchange: str, symbol: str):
+        adapter = self.aggregator.adapters[exchange]
+        event = None
+        try:
+            payload = await adapter.get_depth_snapshot(symbol)
+            event = adapter.parse_depth_snapshot(symbol, payload) if payload else None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error obteniendo el libro de {symbol} en {adapter.display_name}: {e}")
+        key = (exchange, symbol)
+        if event is None:
+            self.snapshot_failed(key)
+            return
+        self.snapshot_retry.pop(key, None)
+        self.handle(exchange, event)
+
+    def snapshot_failed(self, key: Tuple[str, str]):
+        failures = self.snapshot_retry.get(key, (0, 0.0))[0] + 1
+        delay = min(SNAPSHOT_RETRY_MIN * 2 ** (failures - 1), SNAPSHOT_RETRY_MAX)
+        delay += random.uniform(0, delay / 2)
+        self.snapshot_retry[key] = (failures, time.monotonic() + delay)
+        self.stats['snapshot_failures'] += 1
+        logger.warning(f"Snapshot de {key[1]} en {key[0]} no disponible: reintento en {delay:.1f} segundos")
+
+    def build_message(self, symbol: str, book: Dict) -> str:
+        return json.dumps({
+            'type': 'book',
+            'symbol': symbol,
+            'seq': self.version,
+            **book,
+            'timestamp': int(time.time())
+        })
+
+    def publish(self) -> Dict:
+        """Consolidar los símbolos que cambiaron y publicar el lote en el bus."""
+        self.version += 1
+        changed = {}
+        for symbol in self.dirty:
+            changed[symbol] = consolidate_books(self.books[symbol], self.depth)
+        self.dirty.clear()
+        return self.adopt({'version': self.version, 'timestamp': time.time(), 'books': changed})
+
+    def adopt(self, batch: Dict) -> Dict:
+        for symbol, book in batch['books'].items():
+            self.consolidated[symbol] = book
+            self.messages[symbol] = self.build_message(symbol, book)
+        self.stats['published'] += 1
+        self.bus.publish(batch)
+        return batch
+
+    def receive(self, batch: Dict):
+        """Adoptar un lote de libros publicado por otro proceso (feed compartido)."""
+        self.version = batch['version']
+        self.adopt(batch)
+
+    def book_message(self, symbol: str) -> Optional[str]:
+        return self.messages.get(symbol)
+
+    async def run_publisher(self):
+        while self.running:
+            await asyncio.sleep(self.publish_interval)
+            if self.dirty:
+                try:
+                    self.publish()
+                except Exception as e:
+                    logger.error(f"Error publicando libros consolidados: {e}")
+
+    async def run_stream(self, exchange: str, symbols: List[str], max_backoff: float = 60):
+        """Mantener el stream de diffs de un exchange, reconectando con backoff exponencial."""
+        adapter = self.aggregator.adapters[exchange]
+        backoff = min(1, max_backoff)
+        while self.running:
+            ping_task = None
+            try:
+                await self.aggregator.init_session()
+                url = await adapter.depth_stream_url(symbols)
+                async with self.aggregator.session.ws_connect(url, heartbeat=30) as ws:
+                    for message in adapter.depth_subscribe_messages(symbols):
+                        await ws.send_json(message)
+                    if adapter.depth_ping_interval:
+                        ping_task = asyncio.create_task(send_pings(ws, adapter))
+                    logger.info(f"Stream de profundidad de {adapter.display_name} conectado "
+                                f"({len(symbols)} símbolos)")
+                    backoff = min(1, max_backoff)
+                    # Los diffs ya se están recibiendo (y guardando): ahora los snapshots
+                    for symbol in symbols:
+                        self.request_snapshot(exchange, symbol)
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self.handle_message(exchange, json_loads(msg.data))
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+                        if not self.running:
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en el stream de profundidad de {adapter.display_name}: {e}")
+            finally:
+                if ping_task:
+                    ping_task.cancel()
+                # Sin conexión los diffs se pierden: los libros del exchange ya no son fiables
+                for symbol in symbols:
+                    books = self.books.get(symbol, {})
+                    if exchange in books:
+                        books[exchange].reset()
+                        self.dirty.add(symbol)
+
+            if self.running:
+                delay = min(backoff + random.uniform(0, backoff / 2), max_backoff)
+                logger.warning(f"Stream de profundidad de {adapter.display_name} desconectado, "
+                               f"reintentando en {delay:.1f} segundos")
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, max_backoff)
+
+    async def start(self, symbols: Optional[List[str]] = None):
+        """Ingerir la profundidad de todos los adaptadores que la soportan y publicar los libros."""
+        symbols = list(symbols or self.aggregator.target_symbols)
+        self.running = True
+        tasks = [asyncio.create_task(self.run_publisher())]
+        for name, adapter in self.aggregator.adapters.items():
+            if adapter.depth_websocket_url:
+                for start in range(0, len(symbols), adapter.depth_max_symbols):
+                    chunk = symbols[start:start + adapter.depth_max_symbols]
+                    tasks.append(asyncio.create_task(self.run_stream(name, chunk)))
+        logger.info(f"Ingesta de profundidad iniciada para {len(symbols)} símbolos")
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self.running = False
+            for task in tasks + list(self.snapshot_tasks.values()):
+                task.cancel()
+
+    def stop(self):
+        self.running = False
+        logger.info("Ingesta de profundidad detenida")
+
+    def get_status(self) -> Dict:
+        """Libros sincronizados por exchange y contadores de la ingesta."""
+        synced = {}
+        for books in self.books.values():
+            for exchange, book in books.items():
+                synced.setdefault(exchange, 0)
+                synced[exchange] += book.synced
+        return {'version': self.version, 'symbols': len(self.books), 'synced': synced, **self.stats}
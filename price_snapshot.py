@@ -0,0 +1,273 @@
+import gzip
+import hashlib
+import time
+from typing import Dict, List, Optional, Set
+
+from ticker_record import dumps
+from wire_format import pack_msgpack, pack_rows
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se sirve gzip
+    brotli = None
+
+CRYPTO_NAMES = {
+    'BTC': 'Bitcoin',
+    'ETH': 'Ethereum',
+    'BNB': 'BNB',
+    'XRP': 'XRP',
+    'ADA': 'Cardano',
+    'SOL': 'Solana',
+    'DOGE': 'Dogecoin',
+    'DOT': 'Polkadot',
+    'MATIC': 'Polygon',
+    'LTC': 'Litecoin',
+    'SHIB': 'Shiba Inu',
+    'TRX': 'TRON',
+    'AVAX': 'Avalanche',
+    'UNI': 'Uniswap',
+    'ATOM': 'Cosmos',
+    'LINK': 'Chainlink',
+    'XMR': 'Monero',
+    'ETC': 'Ethereum Classic',
+    'BCH': 'Bitcoin Cash',
+    'NEAR': 'NEAR Protocol',
+    'APT': 'Aptos',
+    'QNT': 'Quant',
+    'ICP': 'Internet Computer',
+    'FIL': 'Filecoin',
+    'VET': 'VeChain',
+    'HBAR': 'Hedera',
+    'ALGO': 'Algorand',
+    'MANA': 'Decentraland',
+    'SAND': 'The Sandbox',
+    'AXS': 'Axie Infinity'
+}
+
+# Orden de prioridad del exchange que aporta la variación 24h (y el precio si
+# la fila no trae precio consolidado)
+PRIMARY_EXCHANGES = ('binance', 'kucoin', 'coinbase')
+
+# Campos que cambian en cada ciclo y por sí solos no justifican enviar un delta
+DELTA_IGNORED_FIELDS = ('timestamp',)
+
+
+def get_crypto_name(symbol: str) -> str:
+    """Obtener el nombre completo de la criptomoneda."""
+    return CRYPTO_NAMES.get(symbol, symbol)
+
+
+def format_data_for_frontend(crypto_data: Dict) -> List[Dict]:
+    """Formatear datos de criptomonedas para el frontend."""
+    formatted_data = []
+
+    for symbol, symbol_data in crypto_data.items():
+        # Precio consolidado del motor de precios; sin él, el del exchange prioritario
+        primary_price = symbol_data['average_price']
+        primary_change_24h = 0
+        primary_change_24h_percent = 0
+
+        for exchange in PRIMARY_EXCHANGES:
+            if exchange in symbol_data['exchanges']:
+                exchange_data = symbol_data['exchanges'][exchange]
+                primary_price = exchange_data['price']
+                primary_change_24h = exchange_data['change_24h']
+                primary_change_24h_percent = exchange_data['change_24h_percent']
+                break
+
+        formatted_data.append({
+            'symbol': symbol,
+            'name': get_crypto_name(symbol),
+            'price': symbol_data.get('price', primary_price),
+            'price_method': symbol_data.get('price_method'),
+            'spread_percent': symbol_data.get('spread_percent', 0.0),
+            'outliers': symbol_data.get('outliers', []),
+            'price_flags': symbol_data.get('price_flags', []),
+            'change_24h': primary_change_24h,
+            'change_24h_percent': primary_change_24h_percent,
+            # Copia superficial: el stream modifica latest_data entre ciclos
+            'exchanges': dict(symbol_data['exchanges']),
+            'price_sources': symbol_data['price_sources'],
+            'timestamp': symbol_data['timestamp']
+        })
+
+    # Ordenar por precio (aproximación de capitalización de mercado)
+    formatted_data.sort(key=lambda x: x['price'], reverse=True)
+    return formatted_data
+
+
+def diff_fields(old: Dict, new: Dict) -> Dict:
+    """Campos de `new` que difieren de `old` (sin contar los ignorados)."""
+    return {
+        key: value for key, value in new.items()
+        if key not in DELTA_IGNORED_FIELDS and old.get(key) != value
+    }
+
+
+def diff_symbol(old: Dict, new: Dict) -> Dict:
+    """Cambios de una fila formateada: campos de primer nivel y por exchange.
+
+    Los exchanges que desaparecen se envían como None.
+    """
+    changes = diff_fields(old, new)
+    changes.pop('exchanges', None)
+
+    old_exchanges = old.get('exchanges', {})
+    new_exchanges = new.get('exchanges', {})
+    exchange_changes = {}
+    for exchange, row in new_exchanges.items():
+        if exchange not in old_exchanges:
+            exchange_changes[exchange] = row
+            continue
+        row_changes = diff_fields(old_exchanges[exchange], row)
+        if row_changes:
+            row_changes['timestamp'] = row['timestamp']
+            exchange_changes[exchange] = row_changes
+    for exchange in old_exchanges:
+        if exchange not in new_exchanges:
+            exchange_changes[exchange] = None
+
+    if exchange_changes:
+        changes['exchanges'] = exchange_changes
+    if changes:
+        changes['symbol'] = new['symbol']
+        if 'timestamp' in new:
+            changes['timestamp'] = new['timestamp']
+    return changes
+
+
+class PriceSnapshot:
+    """Snapshot versionado y pre-serializado de un ciclo de agregación.
+
+    Se construye una sola vez por ciclo; la API HTTP y el WebSocket sirven sus
+    bytes directamente, sin volver a formatear ni serializar por petición.
+    """
+
+    def __init__(self, raw: Dict, version: int, timestamp: Optional[int] = None):
+        self.raw = raw
+        self.version = version
+        self.timestamp = timestamp or int(time.time())
+        self.data = format_data_for_frontend(raw)
+        self.body = dumps({
+            'success': True,
+            'data': self.data,
+            'timestamp': self.timestamp,
+            'total_symbols': len(self.data)
+        })
+        self.etag = f"{self.version}-{hashlib.blake2b(self.body, digest_size=8).hexdigest()}"
+        self.rows_by_symbol = {row['symbol']: row for row in self.data}
+        self._encoded_bodies = {}
+        self._messages = {}
+        self._deltas = {}
+        self._filtered_rows = {}
+
+    def encoded_body(self, encoding: str) -> bytes:
+        """Cuerpo HTTP comprimido ('gzip' o 'br'), calculado una vez y cacheado."""
+        if encoding not in self._encoded_bodies:
+            if encoding == 'br':
+                self._encoded_bodies[encoding] = brotli.compress(self.body)
+            else:
+                self._encoded_bodies[encoding] = gzip.compress(self.body)
+        return self._encoded_bodies[encoding]
+
+    def rows_for(self, subscription=None) -> List[Dict]:
+        """Filas formateadas visibles para una suscripción (todas si es None)."""
+        if subscription is None or subscription.is_wildcard:
+            return self.data
+        if subscription.key not in self._filtered_rows:
+            if subscription.symbols is None:
+                rows = self.data
+            else:
+                rows = [self.rows_by_symbol[s] for s in subscription.symbols if s in self.rows_by_symbol]
+                rows.sort(key=lambda x: x['price'], reverse=True)
+            self._filtered_rows[subscription.key] = [subscription.project(row) for row in rows]
+        return self._filtered_rows[subscription.key]
+
+    def message(self, message_type: str, subscription=None, encoding: str = 'json'):
+        """Mensaje WebSocket ya serializado para este snapshot ('price_update', etc.).
+
+        Se serializa una vez por tipo, filtro de suscripción y codificación
+        (str para 'json', bytes para 'msgpack' y 'packed'; ver wire_format).
+        """
+        key = (message_type, subscription.key if subscription and not subscription.is_wildcard else None, encoding)
+        if key not in self._messages:
+            rows = self.rows_for(subscription)
+            if encoding == 'packed':
+                self._messages[key] = pack_rows(message_type, self.version, 0, self.timestamp, rows)
+            else:
+                payload = {
+                    'type': message_type,
+                    'data': rows,
+                    'timestamp': self.timestamp,
+                    'seq': self.version
+                }
+                self._messages[key] = pack_msgpack(payload) if encoding == 'msgpack' else dumps(payload).decode()
+        return self._messages[key]
+
+    def _delta(self, previous: 'PriceSnapshot', subscription=None, encoding: str = 'json'):
+        key = (previous.version, subscription.key if subscription and not subscription.is_wildcard else None)
+        if encoding != 'json':
+            return self._encoded_delta(previous, subscription, key, encoding)
+        if key not in self._deltas:
+            old_rows = {row['symbol']: row for row in previous.rows_for(subscription)}
+            changed = []
+            for row in self.rows_for(subscription):
+                if row['symbol'] in old_rows:
+                    changes = diff_symbol(old_rows.pop(row['symbol']), row)
+                    if changes:
+                        changed.append(changes)
+                else:
+                    changed.append(row)
+            removed = list(old_rows)
+
+            message = None
+            if changed or removed:
+                message = dumps({
+                    'type': 'price_delta',
+                    'seq': self.version,
+                    'prev_seq': previous.version,
+                    'changed': changed,
+                    'removed': removed,
+                    'timestamp': self.timestamp
+                }).decode()
+            self._deltas[key] = (changed, removed, message)
+        return self._deltas[key]
+
+    def _encoded_delta(self, previous: 'PriceSnapshot', subscription, key: tuple, encoding: str):
+        """Delta en una codificación binaria, a partir de los cambios ya calculados."""
+        encoded_key = key + (encoding,)
+        if encoded_key not in self._deltas:
+            changed, removed, _ = self._delta(previous, subscription)
+            message = None
+            if changed or removed:
+                if encoding == 'packed':
+                    # Las tramas 'packed' llevan la fila completa de cada símbolo cambiado
+                    rows = self.rows_by_symbol if subscription is None or subscription.is_wildcard else {
+                        row['symbol']: row for row in self.rows_for(subscription)
+                    }
+                    message = pack_rows('price_delta', self.version, previous.version, self.timestamp,
+                                        [rows[row['symbol']] for row in changed], removed)
+                else:
+                    message = pack_msgpack({
+                        'type': 'price_delta',
+                        'seq': self.version,
+                        'prev_seq': previous.version,
+                        'changed': changed,
+                        'removed': removed,
+                        'timestamp': self.timestamp
+                    })
+            self._deltas[encoded_key] = (changed, removed, message)
+        return self._deltas[encoded_key]
+
+    def delta_message(self, previous: 'PriceSnapshot', subscription=None, encoding: str = 'json'):
+        """Mensaje 'price_delta' con solo los símbolos/campos cambiados desde `previous`.
+
+        Devuelve None si no hay cambios relevantes. El cliente aplica el delta si
+        su último seq coincide con `prev_seq`; si no, debe pedir 'resync'.
+        """
+        return self._delta(previous, subscription, encoding)[2]
+
+    def changed_symbols(self, previous: 'PriceSnapshot') -> Set[str]:
+        """Símbolos con cambios (o eliminados) respecto a `previous`."""
+        changed, removed, _ = self._delta(previous)
+        return {row['symbol'] for row in changed} | set(removed)
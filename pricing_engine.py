@@ -0,0 +1,151 @@
+import logging
+import statistics
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cotización de un exchange tal como la usan los métodos: (precio, volumen_24h, antigüedad en s)
+Quote = Tuple[float, float, float]
+
+
+def mean_price(quotes: List[Quote], **options) -> float:
+    return sum(price for price, _, _ in quotes) / len(quotes)
+
+
+def vwap_price(quotes: List[Quote], **options) -> float:
+    """Precio ponderado por volumen_24h (promedio simple si no hay volumen)."""
+    volume_total = sum(volume for _, volume, _ in quotes)
+    if volume_total <= 0:
+        return mean_price(quotes)
+    return sum(price * volume for price, volume, _ in quotes) / volume_total
+
+
+def median_price(quotes: List[Quote], **options) -> float:
+    return statistics.median(price for price, _, _ in quotes)
+
+
+def trimmed_mean_price(quotes: List[Quote], trim: float = 0.2, **options) -> float:
+    """Promedio descartando la fracción `trim` de precios por cada extremo."""
+    prices = sorted(price for price, _, _ in quotes)
+    cut = int(len(prices) * trim)
+    if cut and len(prices) - 2 * cut > 0:
+        prices = prices[cut:-cut]
+    return sum(prices) / len(prices)
+
+
+def staleness_weighted_price(quotes: List[Quote], half_life: float = 30, **options) -> float:
+    """Promedio con peso que se reduce a la mitad cada `half_life` segundos de antigüedad."""
+    weights = [0.5 ** (age / half_life) for _, _, age in quotes]
+    return sum(price * weight for (price, _, _), weight in zip(quotes, weights)) / sum(weights)
+
+
+PRICING_METHODS: Dict[str, Callable[..., float]] = {
+    'mean': mean_price,
+    'vwap': vwap_price,
+    'median': median_price,
+    'trimmed_mean': trimmed_mean_price,
+    'staleness_weighted': staleness_weighted_price
+}
+
+
+class PricingEngine:
+    """Precio consolidado por símbolo a partir de las cotizaciones de cada exchange.
+
+    Los exchanges cuyo precio se aleja más de `deviation_threshold` % de la
+    mediana se marcan como atípicos y, si quedan al menos dos fuentes, no
+    entran en el cálculo. El resultado se guarda por símbolo y solo se recalcula
+    cuando cambia alguna de sus cotizaciones, de modo que los updates del stream
+    cuestan lo mismo que un símbolo y no que un ciclo completo.
+    """
+
+    def __init__(self, method: str = 'vwap', deviation_threshold: float = 2.0,
+                 spread_threshold: float = 1.0, **options):
+        self.set_method(method, **options)
+        self.deviation_threshold = deviation_threshold
+        self.spread_threshold = spread_threshold
+        self.cache: Dict[str, tuple] = {}
+        self.stats = {'computed': 0, 'reused': 0}
+
+    def set_method(self, method: str, **options):
+        """Cambiar el método de consolidación (invalida los precios guardados)."""
+        if method not in PRICING_METHODS:
+            raise ValueError(f"Método de precio no soportado: {method}")
+        self.method = method
+        self.options = options
+        self.cache = {}
+
+    def price_symbol(self, symbol: str, exchanges: Dict[str, Dict]) -> Optional[Dict]:
+        """Precio consolidado de un símbolo (reutiliza el último si nada cambió)."""
+        if not exchanges:
+            return None
+        key = tuple(
+            (exchange, ticker['price'], ticker.get('volume_24h', 0), ticker['timestamp'],
+             ticker.get('stale', False))
+            for exchange, ticker in sorted(exchanges.items())
+        )
+        cached = self.cache.get(symbol)
+        if cached is not None and cached[0] == key:
+            self.stats['reused'] += 1
+            return cached[1]
+
+        result = self.consolidate(key)
+        self.cache[symbol] = (key, result)
+        self.stats['computed'] += 1
+        return result
+
+    def consolidate(self, key: tuple) -> Dict:
+        newest = max(timestamp for _, _, _, timestamp, _ in key)
+        prices = [price for _, price, _, _, _ in key]
+        reference = statistics.median(prices)
+
+        deviations = {}
+        outliers = []
+        for exchange, price, _, _, _ in key:
+            deviation = (price - reference) / reference * 100 if reference else 0.0
+            deviations[exchange] = deviation
+            if abs(deviation) > self.deviation_threshold:
+                outliers.append(exchange)
+
+        quotes = [
+            (price, volume, newest - timestamp)
+            for exchange, price, volume, timestamp, _ in key if exchange not in outliers
+        ]
+        if len(quotes) < 2:
+            # Con dos fuentes que discrepan no se sabe cuál es la buena: se usan todas
+            quotes = [(price, volume, newest - timestamp) for _, price, volume, timestamp, _ in key]
+
+        low, high = min(prices), max(prices)
+        spread = (high - low) / reference * 100 if reference else 0.0
+        flags = []
+        if spread > self.spread_threshold:
+            flags.append('wide_spread')
+        if outliers:
+            flags.append('outlier')
+        if len(key) == 1:
+            flags.append('single_source')
+        if all(stale for *_, stale in key):
+            flags.append('stale')
+
+        return {
+            'price': PRICING_METHODS[self.method](quotes, **self.options),
+            'price_method': self.method,
+            'spread_percent': spread,
+            'deviations': deviations,
+            'outliers': outliers,
+            'price_flags': flags
+        }
+
+    def apply(self, symbol_data: Dict) -> Dict:
+        """Añadir el precio consolidado y sus indicadores a una fila agregada."""
+        result = self.price_symbol(symbol_data['symbol'], symbol_data['exchanges'])
+        if result is not None:
+            symbol_data.update(result)
+        return symbol_data
+
+    def apply_all(self, aggregated_data: Dict) -> Dict:
+        for symbol_data in aggregated_data.values():
+            self.apply(symbol_data)
+        return aggregated_data
+
+    def forget(self, symbol: str):
+        self.cache.pop(symbol, None)
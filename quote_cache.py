@@ -0,0 +1,67 @@
+import time
+from typing import Dict, Optional
+
+
+class QuoteCache:
+    """Último valor bueno de cada exchange y símbolo, con caducidad (TTL).
+
+    Si un exchange falla o deja de devolver un símbolo, su último ticker se
+    sigue publicando marcado con `stale: True` hasta que pasan `ttl` segundos
+    desde que se recibió. La copia marcada se reutiliza entre ciclos, así que
+    no genera deltas ni re-renderizados mientras el valor no cambie.
+    """
+
+    def __init__(self, ttl: float = 120):
+        self.ttl = ttl
+        # exchange -> símbolo -> (ticker, recibido_en, copia marcada como stale)
+        self.entries: Dict[str, Dict[str, list]] = {}
+        self.status: Dict[str, Dict] = {}
+
+    def merge(self, exchange: str, fresh: Dict, now: Optional[float] = None) -> Dict:
+        """Combinar los tickers recibidos en este ciclo con los últimos conocidos."""
+        now = now or time.time()
+        entries = self.entries.setdefault(exchange, {})
+        status = self.status.setdefault(exchange, {
+            'last_success': None, 'consecutive_failures': 0, 'stale_symbols': 0
+        })
+        if fresh:
+            status['last_success'] = now
+            status['consecutive_failures'] = 0
+        else:
+            status['consecutive_failures'] += 1
+
+        for symbol, ticker in fresh.items():
+            ticker.stale = False
+            entries[symbol] = [ticker, now, None]
+
+        merged = dict(fresh)
+        for symbol in list(entries):
+            if symbol in fresh:
+                continue
+            entry = entries[symbol]
+            if now - entry[1] > self.ttl:
+                del entries[symbol]
+                continue
+            if entry[2] is None:
+                entry[2] = entry[0].stale_copy()
+            merged[symbol] = entry[2]
+
+        status['stale_symbols'] = len(merged) - len(fresh)
+        return merged
+
+    def is_stale(self, exchange: str, now: Optional[float] = None) -> bool:
+        """Indicar si el exchange lleva más de `ttl` segundos sin datos nuevos."""
+        last_success = self.status.get(exchange, {}).get('last_success')
+        return last_success is None or (now or time.time()) - last_success > self.ttl
+
+    def get_status(self) -> Dict[str, Dict]:
+        """Estado por exchange: último éxito, fallos seguidos y símbolos servidos de caché."""
+        now = time.time()
+        return {
+            exchange: {
+                **status,
+                'age': now - status['last_success'] if status['last_success'] else None,
+                'stale': self.is_stale(exchange, now)
+            }
+            for exchange, status in self.status.items()
+        }
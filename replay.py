@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Grabación y reproducción de respuestas de exchanges para CriptoView.
+
+`record` guarda las respuestas REST crudas de cada adaptador en un directorio
+de fixtures (más un manifest.json); `ReplayServer` las sirve desde un servidor
+aiohttp local y redirige los adaptadores del agregador hacia él, de modo que
+todo el pipeline (parseo, agregación, snapshot) se ejecuta sin red y de forma
+determinista. `synthetic` genera fixtures sintéticos con una semilla fija.
+
+Los streams de profundidad se graban aparte (`record-depth`) en un fichero
+NDJSON con los mensajes crudos de cada exchange y los snapshots REST en el
+orden en que llegaron; `replay-depth` los pasa por el DepthManager sin red.
+`synthetic-depth` genera un feed determinista de los tres exchanges (con
+diffs anteriores al snapshot y diffs que se solapan con él) que incluye los
+libros esperados, así que la reproducción se comprueba sola.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'exchanges')
+DEFAULT_DEPTH_FEED = os.path.join(os.path.dirname(__file__), 'fixtures', 'depth.ndjson')
+MANIFEST = 'manifest.json'
+
+
+def fixture_name(path: str) -> str:
+    """Nombre de fichero para la ruta de una petición (/api/v3/ticker/24hr -> api_v3_ticker_24hr.json)."""
+    return path.strip('/').replace('/', '_') + '.json'
+
+
+def write_fixture(directory: str, exchange: str, path: str, body: bytes) -> str:
+    filename = os.path.join(exchange, fixture_name(path))
+    os.makedirs(os.path.join(directory, exchange), exist_ok=True)
+    with open(os.path.join(directory, filename), 'wb') as f:
+        f.write(body)
+    return filename
+
+
+def write_manifest(directory: str, manifest: Dict):
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def load_manifest(directory: str = DEFAULT_FIXTURES_DIR) -> Dict:
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return json.load(f)
+
+
+async def record_exchanges(aggregator, directory: str = DEFAULT_FIXTURES_DIR) -> Dict:
+    """Grabar las respuestas crudas de todas las peticiones REST de un ciclo."""
+    await aggregator.init_session()
+    manifest = {'recorded_at': int(time.time()), 'symbols': aggregator.target_symbols, 'exchanges': {}}
+
+    for name, adapter in aggregator.adapters.items():
+        files = {}
+        for path in adapter.request_paths():
+            url = f"{adapter.base_url}{path}"
+            try:
+                async with aggregator.session.get(url, timeout=adapter.client_timeout()) as response:
+                    body = await response.read()
+                    if response.status != 200:
+                        logger.warning(f"{adapter.display_name} respondió {response.status} para {url}")
+                        continue
+            except Exception as e:
+                logger.error(f"Error grabando {url}: {e}")
+                continue
+            files[path] = write_fixture(directory, name, path, body)
+        manifest['exchanges'][name] = files
+        logger.info(f"{adapter.display_name}: {len(files)} respuestas grabadas")
+
+    write_manifest(directory, manifest)
+    return manifest
+
+
+def synthetic_symbols(count: int) -> List[str]:
+    """Símbolos base sintéticos (S0, S1, ...)."""
+    return [f"S{index}" for index in range(count)]
+
+
+def synthetic_binance_payload(symbols: List[str], extra: int = 2000, rng: Optional[random.Random] = None) -> List[Dict]:
+    """Respuesta tipo /api/v3/ticker/24hr: los símbolos seguidos más pares que se descartan."""
+    rng = rng or random.Random(0)
+    payload = []
+    for symbol in symbols:
+        price = rng.uniform(0.01, 50000)
+        payload.append({
+            'symbol': f"{symbol}USDT", 'lastPrice': str(price), 'priceChange': '1.5',
+            'priceChangePercent': '0.8', 'volume': str(rng.uniform(1, 1e6))
+        })
+    for index in range(extra):
+        payload.append({
+            'symbol': f"X{index}BTC", 'lastPrice': '0.001', 'priceChange': '0',
+            'priceChangePercent': '0', 'volume': '1'
+        })
+    rng.shuffle(payload)
+    return payload
+
+
+def synthetic_kucoin_payload(symbols: List[str], extra: int = 1000, rng: Optional[random.Random] = None) -> Dict:
+    """Respuesta tipo /api/v1/market/allTickers."""
+    rng = rng or random.Random(0)
+    tickers = []
+    for symbol in symbols:
+        price = rng.uniform(0.01, 50000)
+        tickers.append({
+            'symbol': f"{symbol}-USDT", 'last': str(price), 'changePrice': '1.2',
+            'changeRate': '0.008', 'vol': str(rng.uniform(1, 1e6))
+        })
+    for index in range(extra):
+        tickers.append({'symbol': f"X{index}-BTC", 'last': '0.001', 'changePrice': '0', 'changeRate': '0', 'vol': '1'})
+    rng.shuffle(tickers)
+    return {'code': '200000', 'data': {'time': 0, 'ticker': tickers}}
+
+
+def write_synthetic_fixtures(directory: str, symbols: List[str], seed: int = 42) -> Dict:
+    """Generar fixtures deterministas con el mismo formato que los grabados."""
+    from exchange_adapters import BinanceAdapter, CoinbaseAdapter, KuCoinAdapter
+
+    rng = random.Random(seed)
+    manifest = {'recorded_at': 0, 'symbols': symbols, 'seed': seed, 'exchanges': {}}
+    manifest['exchanges']['binance'] = {
+        BinanceAdapter.ticker_endpoint: write_fixture(
+            directory, 'binance', BinanceAdapter.ticker_endpoint,
+            json.dumps(synthetic_binance_payload(symbols, rng=rng)).encode()
+        )
+    }
+    manifest['exchanges']['kucoin'] = {
+        KuCoinAdapter.ticker_endpoint: write_fixture(
+            directory, 'kucoin', KuCoinAdapter.ticker_endpoint,
+            json.dumps(synthetic_kucoin_payload(symbols, rng=rng)).encode()
+        )
+    }
+    coinbase = {}
+    for symbol in symbols:
+        price = rng.uniform(0.01, 50000)
+        pair = f"{symbol}{CoinbaseAdapter.quote_suffix}"
+        ticker_path = CoinbaseAdapter.ticker_endpoint.format(symbol=pair)
+        stats_path = CoinbaseAdapter.stats_endpoint.format(symbol=pair)
+        coinbase[ticker_path] = write_fixture(directory, 'coinbase', ticker_path,
+                                              json.dumps({'price': str(price)}).encode())
+        coinbase[stats_path] = write_fixture(directory, 'coinbase', stats_path, json.dumps({
+            'open': str(price * 0.99), 'volume': str(rng.uniform(1, 1e5))
+        }).encode())
+    manifest['exchanges']['coinbase'] = coinbase
+
+    write_manifest(directory, manifest)
+    return manifest
+
+
+class ReplayServer:
+    """Servidor aiohttp local que sirve las respuestas grabadas.
+
+    Las rutas son /<exchange><ruta original>; `latency` permite simular un
+    exchange lento (segundos de espera por petición).
+    """
+
+    def __init__(self, directory: str = DEFAULT_FIXTURES_DIR, latency: Optional[Dict[str, float]] = None):
+        self.directory = directory
+        self.latency = latency or {}
+        self.manifest = load_manifest(directory)
+        self.bodies = {}
+        for exchange, files in self.manifest['exchanges'].items():
+            for path, filename in files.items():
+                with open(os.path.join(directory, filename), 'rb') as f:
+                    self.bodies[(exchange, path)] = f.read()
+        self.requests = 0
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        exchange = request.match_info['exchange']
+        path = '/' + request.match_info['path']
+        body = self.bodies.get((exchange, path))
+        self.requests += 1
+        if exchange in self.latency:
+            await asyncio.sleep(self.latency[exchange])
+        if body is None:
+            return web.Response(status=404)
+        return web.Response(body=body, content_type='application/json')
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get('/{exchange}/{path:.*}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    def point(self, aggregator, unthrottled: bool = True):
+        """Redirigir los adaptadores del agregador a este servidor.
+
+        Con `unthrottled` se quitan los límites de tasa pensados para el exchange real.
+        """
+        for name, adapter in aggregator.adapters.items():
+            adapter.base_url = f"{self.url}/{name}"
+            if unthrottled:
+                adapter.rate_limit = None
+                adapter.limiter = None
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+def write_depth_feed(path: str, lines: List[Dict]):
+    """Guardar un feed de profundidad: una línea JSON por mensaje o snapshot."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write(json.dumps(line) + '\n')
+
+
+async def record_depth(aggregator, path: str = DEFAULT_DEPTH_FEED, duration: float = 30,
+                       symbols: Optional[List[str]] = None) -> List[Dict]:
+    """Grabar `duration` segundos de los streams de profundidad y sus snapshots REST.
+
+    Líneas: {'kind': 'header', 'symbols': [...]}, {'kind': 'message',
+    'exchange': ..., 'payload': mensaje} y {'kind': 'snapshot', 'exchange': ...,
+    'symbol': ..., 'payload': respuesta REST}.
+    """
+    from order_book import send_pings
+
+    await aggregator.init_session()
+    symbols = list(symbols or aggregator.target_symbols)
+    lines = [{'kind': 'header', 'symbols': symbols, 'recorded_at': int(time.time())}]
+    tasks = []
+
+    async def snapshot(name, adapter, symbol):
+        payload = await adapter.get_depth_snapshot(symbol)
+        if payload:
+            lines.append({'kind': 'snapshot', 'exchange': name, 'symbol': symbol, 'payload': payload})
+
+    async def stream(name, adapter):
+        chunk = symbols[:adapter.depth_max_symbols]
+        async with aggregator.session.ws_connect(await adapter.depth_stream_url(chunk), heartbeat=30) as ws:
+            for message in adapter.depth_subscribe_messages(chunk):
+                await ws.send_json(message)
+            if adapter.depth_ping_interval:
+                tasks.append(asyncio.create_task(send_pings(ws, adapter)))
+            if not adapter.depth_snapshot_in_stream:
+                tasks.extend(asyncio.create_task(snapshot(name, adapter, symbol)) for symbol in chunk)
+            async for msg in ws:
+                if msg.type.name == 'TEXT':
+                    lines.append({'kind': 'message', 'exchange': name, 'payload': json.loads(msg.data)})
+
+    streams = [
+        asyncio.create_task(stream(name, adapter))
+        for name, adapter in aggregator.adapters.items() if adapter.depth_websocket_url
+    ]
+    done, _ = await asyncio.wait(streams, timeout=duration)
+    for task in streams + tasks:
+        task.cancel()
+    for task in done:
+        if task.exception():
+            logger.error(f"Error grabando profundidad: {task.exception()}")
+
+    write_depth_feed(path, lines)
+    return lines
+
+
+def synthetic_depth_feed(symbols: List[str], updates: int = 200, depth: int = 20, seed: int = 7) -> List[Dict]:
+    """Feed de profundidad determinista de Binance, KuCoin y Coinbase, con los libros esperados.
+
+    Por exchange y símbolo se simula un libro real y se emiten sus diffs en el
+    formato de cada exchange. En Binance y KuCoin el snapshot REST se toma tras
+    el diff 10 pero llega tras el 15: los diffs 1-10 ya están en él y deben
+    descartarse y los 11-15 se guardan y se aplican después.
+    """
+    rng = random.Random(seed)
+    lines = [{'kind': 'header', 'symbols': symbols, 'recorded_at': 0}]
+    expected = {}
+    # Precio medio por símbolo, común a los exchanges salvo una pequeña diferencia
+    mids = {symbol: rng.uniform(10, 1000) for symbol in symbols}
+
+    def levels(book):
+        return [[f"{price:.2f}", f"{quantity:.4f}"] for price, quantity in book.items()]
+
+    def top(book, descending):
+        return [[price, quantity] for price, quantity in sorted(book.items(), reverse=descending)[:depth]]
+
+    for exchange in ('binance', 'kucoin', 'coinbase'):
+        expected[exchange] = {}
+        for symbol in symbols:
+            mid = round(mids[symbol] * (1 + rng.uniform(-0.0002, 0.0002)), 2)
+            bids = {round(mid - tick * 0.01, 2): round(rng.uniform(0.1, 5), 4) for tick in range(1, 60)}
+            asks = {round(mid + tick * 0.01, 2): round(rng.uniform(0.1, 5), 4) for tick in range(1, 60)}
+            sequence = 1000
+            messages = []
+            snapshot = None
+            if exchange == 'coinbase':
+                messages.append({'type': 'snapshot', 'product_id': f"{symbol}-USD",
+                                 'bids': levels(bids), 'asks': levels(asks)})
+            for index in range(updates):
+                changes = []
+                for _ in range(rng.randint(1, 4)):
+                    side = rng.choice(('buy', 'sell'))
+                    tick = rng.randint(1, 80)
+                    price = round(mid - tick * 0.01 if side == 'buy' else mid + tick * 0.01, 2)
+                    quantity = 0.0 if rng.random() < 0.3 else round(rng.uniform(0.1, 5), 4)
+                    book = bids if side == 'buy' else asks
+                    if quantity:
+                        book[price] = quantity
+                    else:
+                        book.pop(price, None)
+                    changes.append((side, price, quantity))
+                first = sequence + 1
+                sequence += len(changes)
+                if exchange == 'binance':
+                    messages.append({'stream': f"{symbol.lower()}usdt@depth@100ms", 'data': {
+                        'e': 'depthUpdate', 'E': index, 's': f"{symbol}USDT", 'U': first, 'u': sequence,
+                        'b': [[f"{p:.2f}", f"{q:.4f}"] for side, p, q in changes if side == 'buy'],
+                        'a': [[f"{p:.2f}", f"{q:.4f}"] for side, p, q in changes if side == 'sell']
+                    }})
+                elif exchange == 'kucoin':
+                    entries = [(side, f"{p:.2f}", f"{q:.4f}", str(first + offset))
+                               for offset, (side, p, q) in enumerate(changes)]
+                    messages.append({'type': 'message', 'topic': f"/market/level2:{symbol}-USDT",
+                                     'subject': 'trade.l2update', 'data': {
+                                         'symbol': f"{symbol}-USDT", 'sequenceStart': first, 'sequenceEnd': sequence,
+                                         'changes': {
+                                             'bids': [[p, q, s] for side, p, q, s in entries if side == 'buy'],
+                                             'asks': [[p, q, s] for side, p, q, s in entries if side == 'sell']
+                                         }}})
+                else:
+                    messages.append({'type': 'l2update', 'product_id': f"{symbol}-USD",
+                                     'changes': [[side, f"{p:.2f}", f"{q:.4f}"] for side, p, q in changes]})
+                if index == 9 and exchange != 'coinbase':
+                    if exchange == 'binance':
+                        snapshot = {'lastUpdateId': sequence, 'bids': levels(bids), 'asks': levels(asks)}
+                    else:
+                        snapshot = {'code': '200000', 'data': {'sequence': str(sequence),
+                                                               'bids': levels(bids), 'asks': levels(asks)}}
+            for index, message in enumerate(messages):
+                lines.append({'kind': 'message', 'exchange': exchange, 'payload': message})
+                if snapshot is not None and index == 14:
+                    lines.append({'kind': 'snapshot', 'exchange': exchange, 'symbol': symbol, 'payload': snapshot})
+            expected[exchange][symbol] = {'bids': top(bids, True), 'asks': top(asks, False)}
+
+    lines.append({'kind': 'expected', 'depth': depth, 'books': expected})
+    return lines
+
+
+def replay_depth(path: str = DEFAULT_DEPTH_FEED, aggregator=None) -> Dict:
+    """Reproducir un feed de profundidad grabado y devolver el DepthManager y las discrepancias.
+
+    Si el feed incluye los libros esperados (feeds sintéticos), `mismatches`
+    lista los libros (exchange, símbolo) cuyo top-N no coincide.
+    """
+    from crypto_aggregator import CryptoDataAggregator
+
+    with open(path) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if aggregator is None:
+        aggregator = CryptoDataAggregator(target_symbols=lines[0]['symbols'])
+        aggregator.history_store.writable = False
+    depth = aggregator.depth
+    mismatches = []
+    for line in lines[1:]:
+        if line['kind'] == 'message':
+            depth.handle_message(line['exchange'], line['payload'])
+        elif line['kind'] == 'snapshot':
+            adapter = aggregator.adapters[line['exchange']]
+            depth.handle(line['exchange'], adapter.parse_depth_snapshot(line['symbol'], line['payload']))
+        elif line['kind'] == 'expected':
+            for exchange, books in line['books'].items():
+                for symbol, book in books.items():
+                    bids, asks = depth.book(exchange, symbol).top(line['depth'])
+                    if [list(level) for level in bids] != book['bids'] or \
+                            [list(level) for level in asks] != book['asks']:
+                        mismatches.append((exchange, symbol))
+    if depth.dirty:
+        depth.publish()
+    return {'manager': depth, 'mismatches': mismatches}
+
+
+async def replay_cycle(directory: str = DEFAULT_FIXTURES_DIR) -> Dict:
+    """Ejecutar un ciclo de agregación completo contra los fixtures grabados."""
+    from crypto_aggregator import CryptoDataAggregator
+
+    manifest = load_manifest(directory)
+    aggregator = CryptoDataAggregator(target_symbols=manifest['symbols'])
+    # La reproducción no debe escribir en el histórico real
+    aggregator.history_store.writable = False
+    server = ReplayServer(directory)
+    await server.start()
+    server.point(aggregator)
+    try:
+        return await aggregator.aggregate_data(wait_all=True)
+    finally:
+        await aggregator.close_session()
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grabar o reproducir respuestas de exchanges')
+    parser.add_argument('command', choices=('record', 'replay', 'synthetic',
+                                            'record-depth', 'replay-depth', 'synthetic-depth'))
+    parser.add_argument('--dir', default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument('--depth-feed', default=DEFAULT_DEPTH_FEED, help='Fichero del feed de profundidad')
+    parser.add_argument('--duration', type=float, default=30, help='Segundos a grabar (record-depth)')
+    parser.add_argument('--symbols', type=int, default=30, help='Símbolos sintéticos (comando synthetic)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        from crypto_aggregator import CryptoDataAggregator
+
+        async def record():
+            aggregator = CryptoDataAggregator()
+            try:
+                return await record_exchanges(aggregator, args.dir)
+            finally:
+                await aggregator.close_session()
+
+        manifest = asyncio.run(record())
+        print(f"✅ Grabadas {sum(len(files) for files in manifest['exchanges'].values())} respuestas en {args.dir}")
+    elif args.command == 'record-depth':
+        from crypto_aggregator import CryptoDataAggregator
+
+        async def record():
+            aggregator = CryptoDataAggregator()
+            try:
+                return await record_depth(aggregator, args.depth_feed, args.duration)
+            finally:
+                await aggregator.close_session()
+
+        lines = asyncio.run(record())
+        print(f"✅ Grabados {len(lines) - 1} mensajes de profundidad en {args.depth_feed}")
+    elif args.command == 'synthetic-depth':
+        write_depth_feed(args.depth_feed, synthetic_depth_feed(synthetic_symbols(args.symbols), seed=args.seed))
+        print(f"✅ Feed de profundidad sintético de {args.symbols} símbolos en {args.depth_feed}")
+    elif args.command == 'replay-depth':
+        result = replay_depth(args.depth_feed)
+        manager = result['manager']
+        print(f"✅ Feed reproducido: {manager.get_status()}")
+        for symbol, book in sorted(manager.consolidated.items())[:5]:
+            print(f"   {symbol}: bid {book['best_bid']} / ask {book['best_ask']} "
+                  f"({len(book['bids'])}x{len(book['asks'])} niveles)")
+        if result['mismatches']:
+            print(f"❌ Libros distintos de los esperados: {result['mismatches']}")
+    elif args.command == 'synthetic':
+        manifest = write_synthetic_fixtures(args.dir, synthetic_symbols(args.symbols), args.seed)
+        print(f"✅ Fixtures sintéticos de {len(manifest['symbols'])} símbolos en {args.dir}")
+    else:
+        data = asyncio.run(replay_cycle(args.dir))
+        print(f"✅ Ciclo reproducido: {len(data)} símbolos agregados")
+
+
+if __name__ == "__main__":
+    main()
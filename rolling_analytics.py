@@ -0,0 +1,235 @@
+import math
+import time
+from array import array
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+# Ventanas por defecto: nombre -> duración en segundos
+ANALYTICS_WINDOWS = {'1m': 60, '15m': 900, '1h': 3600}
+# Cubetas por ventana: la resolución de cada ventana es duración / capacidad
+DEFAULT_CAPACITY = 240
+# Cada cuántas cubetas se recalculan las sumas desde cero (error de redondeo acumulado)
+REBUILD_EVERY = 4096
+
+
+class RollingWindow:
+    """Estadísticas de una ventana deslizante de precios con coste O(1) por tick.
+
+    Los ticks se agrupan en cubetas de `span / capacity` segundos guardadas en
+    un buffer circular (arrays de float) con cierre, máximo, mínimo y retorno
+    logarítmico respecto a la cubeta anterior. La media, la desviación y la
+    volatilidad realizada salen de sumas que se actualizan al entrar y salir
+    cubetas; el mínimo y el máximo, de dos colas monótonas. La EMA se actualiza
+    con cada tick con un decaimiento por tiempo de constante `span`.
+    """
+
+    __slots__ = ('span', 'capacity', 'resolution', 'times', 'closes', 'highs', 'lows', 'returns',
+                 'start', 'end', 'anchor', 'total', 'total_sq', 'return_sq', 'minimums', 'maximums',
+                 'ema', 'ema_time', 'last_price', 'pushed')
+
+    def __init__(self, span: float, capacity: int = DEFAULT_CAPACITY):
+        self.span = span
+        self.capacity = capacity
+        self.resolution = span / capacity
+        # Buffer circular: la cubeta de número de secuencia n ocupa la posición n % capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.closes = array('d', bytes(8 * capacity))
+        self.highs = array('d', bytes(8 * capacity))
+        self.lows = array('d', bytes(8 * capacity))
+        self.returns = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.end = 0
+        # Las sumas se toman respecto a un precio de referencia para no perder
+        # precisión al restar cuadrados grandes
+        self.anchor = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.return_sq = 0.0
+        # Números de secuencia con mínimos crecientes / máximos decrecientes
+        self.minimums = deque()
+        self.maximums = deque()
+        self.ema = None
+        self.ema_time = 0.0
+        self.last_price = None
+        self.pushed = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def push(self, timestamp: float, price: float):
+        """Añadir un tick (los timestamps deben ser crecientes)."""
+        if self.ema is None:
+            self.ema = price
+        elif timestamp > self.ema_time:
+            self.ema += (1 - math.exp((self.ema_time - timestamp) / self.span)) * (price - self.ema)
+        self.ema_time = max(timestamp, self.ema_time)
+        self.last_price = price
+        self.evict(timestamp)
+
+        capacity = self.capacity
+        if self.end > self.start:
+            last = (self.end - 1) % capacity
+            if timestamp - self.times[last] < self.resolution:
+                self.update_last(last, price)
+                return
+            if self.end - self.start == capacity:
+                self.pop_oldest()
+            previous = self.closes[(self.end - 1) % capacity]
+            log_return = math.log(price / previous) if previous > 0 and price > 0 else 0.0
+        else:
+            log_return = 0.0
+
+        if self.anchor is None:
+            self.anchor = price
+        slot = self.end % capacity
+        self.times[slot] = timestamp
+        self.closes[slot] = price
+        self.highs[slot] = price
+        self.lows[slot] = price
+        self.returns[slot] = log_return
+        offset = price - self.anchor
+        self.total += offset
+        self.total_sq += offset * offset
+        self.return_sq += log_return * log_return
+        self.push_extremes(self.end, price, price)
+        self.end += 1
+
+        self.pushed += 1
+        if self.pushed % REBUILD_EVERY == 0:
+            self.rebuild()
+
+    def update_last(self, slot: int, price: float):
+        """Tick dentro de la última cubeta: nuevo cierre y extremos ampliados."""
+        old_offset = self.closes[slot] - self.anchor
+        offset = price - self.anchor
+        self.total += offset - old_offset
+        self.total_sq += offset * offset - old_offset * old_offset
+        self.closes[slot] = price
+        if self.end - self.start > 1:
+            previous = self.closes[(self.end - 2) % self.capacity]
+            old_return = self.returns[slot]
+            log_return = math.log(price / previous) if previous > 0 and price > 0 else 0.0
+            self.returns[slot] = log_return
+            self.return_sq += log_return * log_return - old_return * old_return
+        if price > self.highs[slot]:
+            self.highs[slot] = price
+        if price < self.lows[slot]:
+            self.lows[slot] = price
+        # La cubeta es la última de las dos colas: solo puede desplazar a las anteriores
+        self.maximums.pop()
+        self.minimums.pop()
+        self.push_extremes(self.end - 1, self.highs[slot], self.lows[slot])
+
+    def push_extremes(self, seq: int, high: float, low: float):
+        capacity = self.capacity
+        maximums = self.maximums
+        while maximums and self.highs[maximums[-1] % capacity] <= high:
+            maximums.pop()
+        maximums.append(seq)
+        minimums = self.minimums
+        while minimums and self.lows[minimums[-1] % capacity] >= low:
+            minimums.pop()
+        minimums.append(seq)
+
+    def evict(self, timestamp: float):
+        """Sacar las cubetas que han quedado fuera de la ventana."""
+        cutoff = timestamp - self.span
+        while self.end > self.start and self.times[self.start % self.capacity] <= cutoff:
+            self.pop_oldest()
+
+    def pop_oldest(self):
+        slot = self.start % self.capacity
+        offset = self.closes[slot] - self.anchor
+        self.total -= offset
+        self.total_sq -= offset * offset
+        self.return_sq -= self.returns[slot] * self.returns[slot]
+        if self.minimums[0] == self.start:
+            self.minimums.popleft()
+        if self.maximums[0] == self.start:
+            self.maximums.popleft()
+        self.start += 1
+        if self.start == self.end:
+            self.total = self.total_sq = self.return_sq = 0.0
+
+    def rebuild(self):
+        """Recalcular las sumas con la media actual como referencia (O(capacidad), amortizado)."""
+        slots = [seq % self.capacity for seq in range(self.start, self.end)]
+        if not slots:
+            return
+        self.anchor = sum(self.closes[slot] for slot in slots) / len(slots)
+        self.total = sum(self.closes[slot] - self.anchor for slot in slots)
+        self.total_sq = sum((self.closes[slot] - self.anchor) ** 2 for slot in slots)
+        self.return_sq = sum(self.returns[slot] ** 2 for slot in slots)
+
+    def stats(self) -> Optional[Dict]:
+        """Media (sma), EMA, mínimo, máximo, volatilidad realizada (%) y z-score del último precio."""
+        count = self.end - self.start
+        if not count:
+            return None
+        mean_offset = self.total / count
+        variance = self.total_sq / count - mean_offset * mean_offset
+        stddev = math.sqrt(variance) if variance > 0 else 0.0
+        sma = self.anchor + mean_offset
+        capacity = self.capacity
+        return {
+            'sma': sma,
+            'ema': self.ema,
+            'min': self.lows[self.minimums[0] % capacity],
+            'max': self.highs[self.maximums[0] % capacity],
+            'volatility': math.sqrt(max(self.return_sq, 0.0)) * 100,
+            'zscore': (self.last_price - sma) / stddev if stddev > 1e-12 * abs(sma) else 0.0,
+            'samples': count
+        }
+
+
+class RollingAnalytics:
+    """Estadísticas móviles por símbolo (1m, 15m y 1h por defecto) sobre el precio consolidado.
+
+    Se alimenta con las filas agregadas de cada ciclo y con las actualizaciones
+    del stream; cada fila recibe un diccionario `analytics` nuevo (no se
+    modifica el anterior, que puede seguir en un snapshot publicado). Como
+    cambian en cada publicación, no se incluyen en las filas formateadas ni
+    en los deltas del snapshot: se consultan en /api/crypto/analytics.
+    """
+
+    def __init__(self, windows: Optional[Dict[str, float]] = None, capacity: int = DEFAULT_CAPACITY):
+        self.windows = dict(windows or ANALYTICS_WINDOWS)
+        self.capacity = capacity
+        self.series: Dict[str, Dict[str, RollingWindow]] = {}
+
+    def update(self, symbol: str, price: float, timestamp: Optional[float] = None) -> Dict:
+        """Añadir un precio al símbolo y devolver sus estadísticas por ventana."""
+        timestamp = timestamp or time.time()
+        windows = self.series.get(symbol)
+        if windows is None:
+            windows = self.series[symbol] = {
+                name: RollingWindow(span, self.capacity) for name, span in self.windows.items()
+            }
+        result = {}
+        for name, window in windows.items():
+            window.push(timestamp, price)
+            result[name] = window.stats()
+        return result
+
+    def apply(self, symbol_data: Dict, timestamp: Optional[float] = None) -> Dict:
+        """Añadir `analytics` a una fila agregada a partir de su precio consolidado."""
+        price = symbol_data.get('price', symbol_data.get('average_price'))
+        if price:
+            symbol_data['analytics'] = self.update(symbol_data['symbol'], price, timestamp)
+        return symbol_data
+
+    def apply_all(self, aggregated_data: Dict, timestamp: Optional[float] = None) -> Dict:
+        timestamp = timestamp or time.time()
+        for symbol_data in aggregated_data.values():
+            self.apply(symbol_data, timestamp)
+        return aggregated_data
+
+    def get(self, symbol: str) -> Optional[Dict]:
+        windows = self.series.get(symbol)
+        if windows is None:
+            return None
+        return {name: window.stats() for name, window in windows.items()}
+
+    def forget(self, symbols: Iterable[str]):
+        for symbol in symbols:
+            self.series.pop(symbol, None)
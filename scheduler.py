@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Corta las llamadas a un exchange que falla de forma repetida.
+
+    Tras `failure_threshold` fallos seguidos pasa a abierto y no deja llamar
+    durante `reset_timeout` segundos; después permite una llamada de prueba
+    (semiabierto) que lo cierra si va bien o lo vuelve a abrir si falla.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        """Indicar si se puede llamar al exchange ahora."""
+        if self.state == self.OPEN:
+            if (now or time.monotonic()) - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        return True
+
+    def retry_in(self, now: Optional[float] = None) -> float:
+        """Segundos que faltan para la llamada de prueba (0 si no está abierto)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - ((now or time.monotonic()) - self.opened_at))
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self, now: Optional[float] = None):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuito abierto tras {self.failures} fallos seguidos")
+            self.state = self.OPEN
+            self.opened_at = now or time.monotonic()
+
+
+class ExchangePoller:
+    """Cadencia de sondeo de un exchange.
+
+    El intervalo parte de `base_interval` y se adapta entre `min_interval` y
+    `max_interval`: baja cuando los precios se mueven más de `fast_above` %
+    entre dos consultas, sube cuando se mueven menos de `quiet_below` % y
+    salta al máximo si no hay clientes conectados.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[], Awaitable[Dict]], base_interval: float,
+                 min_interval: Optional[float] = None, max_interval: Optional[float] = None,
+                 max_backoff: float = 300, fast_above: float = 0.5, quiet_below: float = 0.05,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.fetch = fetch
+        self.base_interval = base_interval
+        self.min_interval = min_interval or max(1.0, base_interval / 4)
+        self.max_interval = max_interval or base_interval * 6
+        self.max_backoff = max_backoff
+        self.fast_above = fast_above
+        self.quiet_below = quiet_below
+        self.breaker = breaker or CircuitBreaker()
+        self.interval = base_interval
+        self.failures = 0
+        self.last_prices: Dict[str, float] = {}
+        self.stats = {'requests': 0, 'failures': 0, 'skipped': 0, 'volatility': 0.0}
+
+    def volatility(self, data: Dict) -> float:
+        """Mayor variación porcentual de precio respecto a la consulta anterior."""
+        moves = []
+        for symbol, ticker in data.items():
+            previous = self.last_prices.get(symbol)
+            if previous:
+                moves.append(abs(ticker['price'] - previous) / previous * 100)
+            self.last_prices[symbol] = ticker['price']
+        return max(moves, default=0.0)
+
+    def next_interval(self, volatility: float, clients: Optional[int]) -> float:
+        """Intervalo de la próxima consulta tras un ciclo correcto."""
+        if clients == 0:
+            self.interval = self.max_interval
+        elif volatility > self.fast_above:
+            self.interval = max(self.min_interval, self.interval / 2)
+        elif volatility < self.quiet_below:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        elif self.interval > self.base_interval:
+            # Actividad normal: volver gradualmente al intervalo base
+            self.interval = max(self.base_interval, self.interval / 1.5)
+        else:
+            self.interval = min(self.base_interval, self.interval * 1.5)
+        return self.interval
+
+    def backoff_interval(self) -> float:
+        """Intervalo tras un fallo: backoff exponencial sobre el intervalo base."""
+        return min(self.max_backoff, self.base_interval * 2 ** self.failures)
+
+    def describe(self) -> Dict:
+        return {
+            **self.stats,
+            'interval': self.interval,
+            'consecutive_failures': self.failures,
+            'circuit': self.breaker.state
+        }
+
+
+class AdaptiveScheduler:
+    """Sondea cada exchange con su propio temporizador y publica al recibir datos.
+
+    `on_data(exchange, data)` recibe el resultado de cada consulta ({} si falló
+    o el circuito está abierto) y `client_count()` devuelve los clientes
+    conectados, o None si no se sabe (en ese caso no se ralentiza por inactividad).
+    """
+
+    def __init__(self, pollers: Dict[str, ExchangePoller], on_data: Callable[[str, Dict], None],
+                 client_count: Optional[Callable[[], Optional[int]]] = None, jitter: float = 0.1):
+        self.pollers = pollers
+        self.on_data = on_data
+        self.client_count = client_count or (lambda: None)
+        self.jitter = jitter
+        self.tasks = []
+
+    def jittered(self, delay: float) -> float:
+        # Desincroniza los temporizadores para no lanzar todas las peticiones a la vez
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def poll_once(self, poller: ExchangePoller) -> float:
+        """Consultar un exchange (si el circuito lo permite) y devolver la espera siguiente."""
+        if not poller.breaker.allow():
+            poller.stats['skipped'] += 1
+            self.on_data(poller.name, {})
+            return poller.breaker.retry_in()
+
+        poller.stats['requests'] += 1
+        try:
+            data = await poller.fetch()
+        except Exception as e:
+            logger.error(f"Error consultando {poller.name}: {e}")
+            data = {}
+
+        self.on_data(poller.name, data)
+        if not data:
+            poller.failures += 1
+            poller.stats['failures'] += 1
+            poller.breaker.record_failure()
+            return max(poller.backoff_interval(), poller.breaker.retry_in())
+
+        poller.failures = 0
+        poller.breaker.record_success()
+        poller.stats['volatility'] = poller.volatility(data)
+        return poller.next_interval(poller.stats['volatility'], self.client_count())
+
+    async def run_poller(self, poller: ExchangePoller, initial_delay: float = 0):
+        await asyncio.sleep(self.jittered(initial_delay))
+        while True:
+            try:
+                delay = await self.poll_once(poller)
+            except Exception as e:
+                logger.error(f"Error en el temporizador de {poller.name}: {e}")
+                delay = poller.base_interval
+            await asyncio.sleep(self.jittered(delay))
+
+    async def run(self, skip_first: bool = False):
+        """Ejecutar los temporizadores de todos los exchanges hasta ser cancelado.
+
+        Con `skip_first` la primera consulta espera un intervalo (el llamador ya
+        ha hecho un ciclo completo).
+        """
+        self.tasks = [
+            asyncio.create_task(self.run_poller(poller, poller.interval if skip_first else 0))
+            for poller in self.pollers.values()
+        ]
+        try:
+            await asyncio.gather(*self.tasks)
+        finally:
+            for task in self.tasks:
+                task.cancel()
+
+    def get_status(self) -> Dict[str, Dict]:
+        return {name: poller.describe() for name, poller in self.pollers.items()}
@@ -0,0 +1,297 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+from typing import Callable, List, Optional
+
+from ticker_record import dumps
+
+logger = logging.getLogger(__name__)
+
+# Socket Unix por defecto para compartir snapshots entre procesos (Flask y WebSocket)
+DEFAULT_FEED_PATH = os.environ.get('CRIPTOVIEW_FEED_SOCKET', '/tmp/criptoview_feed.sock')
+# Bytes pendientes de envío a partir de los cuales un suscriptor del feed se
+# considera atascado y se desconecta (al reconectar recibe el estado completo)
+MAX_FEED_BUFFER = 16 * 1024 * 1024
+
+
+class SnapshotBus:
+    """Pub/sub en proceso para los snapshots publicados por el agregador."""
+
+    def __init__(self):
+        self.subscribers: List[Callable] = []
+        self.first_snapshot = threading.Event()
+
+    def subscribe(self, callback: Callable) -> Callable:
+        """Registrar un callback que recibe cada snapshot publicado."""
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback: Callable):
+        """Eliminar un callback registrado."""
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def subscribe_queue(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> asyncio.Queue:
+        """Suscribirse mediante una cola asyncio que solo conserva el último snapshot.
+
+        Es seguro publicar desde otro hilo: la entrega se hace en el loop del suscriptor.
+        """
+        loop = loop or asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=1)
+
+        def put_latest(snapshot):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(snapshot)
+
+        def callback(snapshot):
+            loop.call_soon_threadsafe(put_latest, snapshot)
+
+        queue.callback = self.subscribe(callback)
+        return queue
+
+    def publish(self, snapshot):
+        """Entregar un snapshot a todos los suscriptores."""
+        self.first_snapshot.set()
+        for callback in list(self.subscribers):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Error notificando a un suscriptor del bus: {e}")
+
+    def wait_for_snapshot(self, timeout: float) -> bool:
+        """Bloquear (desde un hilo síncrono) hasta que exista un primer snapshot."""
+        return self.first_snapshot.wait(timeout)
+
+    async def wait_for_snapshot_async(self, timeout: float) -> bool:
+        """Esperar sin bloquear el loop a que exista un primer snapshot."""
+        if self.first_snapshot.is_set():
+            return True
+        queue = self.subscribe_queue()
+        try:
+            # Comprobar de nuevo ya suscritos: pudo publicarse entre medias
+            if self.first_snapshot.is_set():
+                return True
+            await asyncio.wait_for(queue.get(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self.first_snapshot.is_set()
+        finally:
+            self.unsubscribe(queue.callback)
+
+
+class UnixSocketFeedServer:
+    """Reenvía los snapshots del bus a otros procesos por un socket Unix.
+
+    Protocolo: una línea JSON por snapshot,
+    {'type': 'snapshot', 'data': ..., 'version': ..., 'timestamp': ...}, y
+    con `depth_bus` una por lote de libros consolidados,
+    {'type': 'books', 'books': {símbolo: libro}, 'version': ..., 'timestamp': ...}
+    (al conectarse, el suscriptor recibe todos los libros conocidos).
+    Los suscriptores pueden enviar {'type': 'clients', 'count': N} con los
+    clientes que atienden; se entregan a `on_report(suscriptor, N)` y al
+    desconectarse se notifica `on_report(suscriptor, None)`.
+
+    Un suscriptor que deja de leer acumularía en memoria todas las líneas
+    pendientes: si supera `max_buffer` bytes sin enviar se desconecta. Al
+    volver a conectarse recibe el último snapshot y todos los libros.
+    """
+
+    def __init__(self, bus: SnapshotBus, path: str = DEFAULT_FEED_PATH,
+                 on_report: Optional[Callable[[int, Optional[int]], None]] = None,
+                 depth_bus: Optional[SnapshotBus] = None, max_buffer: int = MAX_FEED_BUFFER):
+        self.bus = bus
+        self.path = path
+        self.on_report = on_report
+        self.depth_bus = depth_bus
+        self.max_buffer = max_buffer
+        self.slow_disconnects = 0
+        self.latest_books = {}
+        self.books_version = 0
+        self.writers = set()
+        self.handlers = set()
+        self.server = None
+        self.latest_line = None
+
+    async def start(self):
+        """Abrir el socket y empezar a reenviar snapshots."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.handle_client, path=self.path)
+        self.bus.subscribe(self.on_snapshot)
+        if self.depth_bus:
+            self.depth_bus.subscribe(self.on_books)
+        logger.info(f"Feed de snapshots disponible en {self.path}")
+
+    async def handle_client(self, reader, writer):
+        self.writers.add(writer)
+        self.handlers.add(asyncio.current_task())
+        logger.info(f"Nuevo suscriptor del feed. Total: {len(self.writers)}")
+        if self.latest_line:
+            writer.write(self.latest_line)
+        if self.latest_books:
+            writer.write(dumps({
+                'type': 'books', 'books': self.latest_books, 'version': self.books_version, 'timestamp': 0
+            }) + b'\n')
+        try:
+            # El cliente solo envía reportes de clientes: leerlos hasta que cierre
+            async for line in reader:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if message.get('type') == 'clients' and self.on_report:
+                    self.on_report(id(writer), int(message['count']))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            if self.on_report:
+                self.on_report(id(writer), None)
+            self.writers.discard(writer)
+            self.handlers.discard(asyncio.current_task())
+            writer.close()
+
+    def on_snapshot(self, snapshot):
+        self.latest_line = dumps({
+            'type': 'snapshot',
+            'data': snapshot.raw,
+            'version': snapshot.version,
+            'timestamp': snapshot.timestamp
+        }) + b'\n'
+        self.broadcast(self.latest_line)
+
+    def on_books(self, batch):
+        self.latest_books.update(batch['books'])
+        self.books_version = batch['version']
+        self.broadcast(dumps({'type': 'books', **batch}) + b'\n')
+
+    def broadcast(self, line: bytes):
+        """Escribir una línea a cada suscriptor, desconectando a los atascados."""
+        for writer in list(self.writers):
+            if writer.is_closing():
+                self.writers.discard(writer)
+                continue
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.slow_disconnects += 1
+                logger.warning(f"Suscriptor del feed atascado (más de {self.max_buffer} bytes sin enviar): "
+                               f"desconectando")
+                self.writers.discard(writer)
+                # abort descarta lo pendiente; close esperaría a enviarlo
+                writer.transport.abort()
+                continue
+            writer.write(line)
+
+    async def stop(self):
+        self.bus.unsubscribe(self.on_snapshot)
+        if self.depth_bus:
+            self.depth_bus.unsubscribe(self.on_books)
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in list(self.writers):
+            writer.close()
+        # Esperar a que los manejadores vean el cierre y terminen limpiamente
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+async def report_clients_to_feed(aggregator, writer, interval: float = 5):
+    """Enviar al líder los clientes que atiende este proceso (para su cadencia adaptativa)."""
+    last_count = None
+    while True:
+        count = aggregator.get_client_count()
+        if count is not None and count != last_count:
+            writer.write(json.dumps({'type': 'clients', 'count': count}).encode() + b'\n')
+            last_count = count
+        await asyncio.sleep(interval)
+
+
+async def consume_feed(aggregator, path: str = DEFAULT_FEED_PATH) -> bool:
+    """Leer snapshots de un feed existente y aplicarlos al agregador local.
+
+    Devuelve False si no hay feed disponible y True cuando el feed se cierra.
+    """
+    try:
+        reader, writer = await asyncio.open_unix_connection(path, limit=64 * 1024 * 1024)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return False
+
+    logger.info(f"Suscrito al feed de snapshots en {path}")
+    reporter = asyncio.create_task(report_clients_to_feed(aggregator, writer))
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if message.get('type') == 'snapshot':
+                aggregator.receive_snapshot(message['data'], message.get('version'), message.get('timestamp'))
+            elif message.get('type') == 'books':
+                aggregator.depth.receive(message)
+    finally:
+        reporter.cancel()
+        writer.close()
+    logger.warning("Feed de snapshots cerrado")
+    return True
+
+
+async def run_shared_aggregation(aggregator, interval: int = 10, path: str = DEFAULT_FEED_PATH,
+                                 exchange_stream: bool = False, depth_stream: bool = False):
+    """Garantizar un único bucle de agregación por máquina.
+
+    El primer proceso que obtiene el lock del feed ejecuta el bucle contra los
+    exchanges y publica los snapshots por el socket Unix; el resto se suscribe
+    a ese feed. Si el líder desaparece, un seguidor toma su lugar. Con
+    depth_stream el líder también ingiere los libros de órdenes y los reenvía.
+    """
+    lock_file = open(f"{path}.lock", 'w')
+    try:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Otro proceso es el líder: consumir su feed
+                if not await consume_feed(aggregator, path):
+                    await asyncio.sleep(1)
+                continue
+
+            logger.info("Este proceso ejecuta el bucle de agregación compartido")
+            feed_server = UnixSocketFeedServer(
+                aggregator.bus, path,
+                on_report=lambda follower, count: aggregator.report_clients(f"feed:{follower}", count),
+                depth_bus=aggregator.depth.bus
+            )
+            await feed_server.start()
+            stream_task = None
+            if exchange_stream:
+                stream_task = asyncio.create_task(aggregator.start_binance_stream())
+            depth_task = None
+            if depth_stream:
+                depth_task = asyncio.create_task(aggregator.depth.start())
+            try:
+                await aggregator.start_periodic_update(interval)
+            finally:
+                if stream_task:
+                    aggregator.stop_binance_stream()
+                    stream_task.cancel()
+                if depth_task:
+                    aggregator.depth.stop()
+                    depth_task.cancel()
+                await feed_server.stop()
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    finally:
+        lock_file.close()
+
+
+async def follow_shared_aggregation(aggregator, path: str = DEFAULT_FEED_PATH, retry_interval: float = 1):
+    """Seguir el feed de otro proceso sin llegar nunca a consultar los exchanges.
+
+    Lo usan los workers del servidor multiproceso: el agregador es un proceso aparte.
+    """
+    while True:
+        if not await consume_feed(aggregator, path):
+            await asyncio.sleep(retry_interval)
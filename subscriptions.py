@@ -0,0 +1,70 @@
+from typing import Dict, Iterable, Optional
+
+
+class Subscription:
+    """Filtro de un cliente WebSocket: símbolos, exchanges, campos y ritmo máximo.
+
+    Un valor None significa "todos". Dos clientes con el mismo `key` reciben
+    exactamente los mismos bytes, de modo que el mensaje se serializa una vez.
+    """
+
+    def __init__(self, symbols: Optional[Iterable[str]] = None,
+                 exchanges: Optional[Iterable[str]] = None,
+                 fields: Optional[Iterable[str]] = None,
+                 max_rate: Optional[float] = None):
+        self.symbols = frozenset(s.upper() for s in symbols) if symbols is not None else None
+        self.exchanges = frozenset(e.lower() for e in exchanges) if exchanges else None
+        self.fields = tuple(sorted(set(fields) | {'symbol'})) if fields else None
+        self.max_rate = float(max_rate) if max_rate else None
+        self.key = (self.symbols, self.exchanges, self.fields)
+
+    @classmethod
+    def from_message(cls, message: Dict) -> 'Subscription':
+        """Construir una suscripción a partir de un mensaje 'subscribe'."""
+        return cls(
+            symbols=message.get('symbols'),
+            exchanges=message.get('exchanges'),
+            fields=message.get('fields'),
+            max_rate=message.get('max_rate')
+        )
+
+    @property
+    def is_wildcard(self) -> bool:
+        """Indica si la suscripción no filtra nada (equivale a no tener suscripción)."""
+        return self.symbols is None and self.exchanges is None and self.fields is None
+
+    @property
+    def min_interval(self) -> float:
+        """Segundos mínimos entre dos actualizaciones a este cliente."""
+        return 1 / self.max_rate if self.max_rate else 0
+
+    def without_symbols(self, symbols: Iterable[str]) -> 'Subscription':
+        """Nueva suscripción sin los símbolos indicados (para 'unsubscribe').
+
+        Sobre una suscripción a todos los símbolos no tiene efecto.
+        """
+        if self.symbols is None:
+            return self
+        remaining = self.symbols - {s.upper() for s in symbols}
+        return Subscription(remaining, self.exchanges, self.fields, self.max_rate)
+
+    def project(self, row: Dict) -> Dict:
+        """Aplicar los filtros de exchanges y campos a una fila formateada."""
+        if self.fields is not None:
+            row = {key: row[key] for key in self.fields if key in row}
+        if self.exchanges is not None and 'exchanges' in row:
+            row = dict(row)
+            row['exchanges'] = {
+                exchange: data for exchange, data in row['exchanges'].items()
+                if exchange in self.exchanges
+            }
+        return row
+
+    def describe(self) -> Dict:
+        """Representación JSON de la suscripción para los acuses de recibo."""
+        return {
+            'symbols': sorted(self.symbols) if self.symbols is not None else None,
+            'exchanges': sorted(self.exchanges) if self.exchanges is not None else None,
+            'fields': list(self.fields) if self.fields is not None else None,
+            'max_rate': self.max_rate
+        }
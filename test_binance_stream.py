@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para la ingesta por streaming de Binance contra un feed local.
+
+Levanta un servidor WebSocket falso que reproduce frames grabados del stream
+!ticker@arr y verifica que CryptoDataAggregator los aplica sobre latest_data
+y que se reconecta cuando el feed cierra la conexión.
+"""
+
+import asyncio
+import os
+import tempfile
+import websockets
+
+from crypto_aggregator import CryptoDataAggregator
+from history_store import HistoryStore
+
+FRAMES_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'binance_ticker_frames.jsonl')
+
+def load_frames(path: str = FRAMES_PATH) -> list:
+    """Cargar frames grabados (uno por línea, tal como llegan del exchange)."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+async def start_fake_feed(frames: list, host: str = 'localhost', port: int = 0, interval: float = 0.05):
+    """Iniciar un feed falso que reproduce los frames y cierra la conexión."""
+    stats = {'connections': 0}
+
+    async def replay(websocket, path=None):
+        stats['connections'] += 1
+        for frame in frames:
+            await websocket.send(frame)
+            await asyncio.sleep(interval)
+
+    server = await websockets.serve(replay, host, port)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"ws://{host}:{port}", stats
+
+async def test_binance_stream_replay():
+    """Probar la aplicación incremental de frames y la reconexión."""
+    frames = load_frames()
+    server, url, stats = await start_fake_feed(frames)
+    # El histórico va a un directorio temporal, no al del repositorio
+    directory = tempfile.TemporaryDirectory()
+    aggregator = CryptoDataAggregator(
+        history_store=HistoryStore(f"{directory.name}/history", f"{directory.name}/app.db")
+    )
+
+    print(f"Reproduciendo {len(frames)} frames desde {url}...")
+    stream_task = asyncio.create_task(aggregator.start_binance_stream(url, max_backoff=0.5))
+
+    try:
+        # Esperar a que el feed cierre y el agregador se reconecte
+        for _ in range(100):
+            if stats['connections'] >= 2:
+                break
+            await asyncio.sleep(0.05)
+
+        data = aggregator.get_latest_data()
+        assert 'BTC' in data and 'ETH' in data and 'SOL' in data, data.keys()
+        assert 'PEPE' not in data, "Los símbolos fuera de target_symbols deben ignorarse"
+        assert data['BTC']['exchanges']['binance']['price'] >= 67250.12
+        assert data['BTC']['price_sources'] == 1
+        print(f"✅ latest_data actualizado: {sorted(data.keys())}")
+
+        assert stats['connections'] >= 2, "El agregador no se reconectó al feed"
+        print(f"✅ Reconexiones observadas: {stats['connections'] - 1}")
+    finally:
+        aggregator.stop_binance_stream()
+        stream_task.cancel()
+        await aggregator.close_session()
+        aggregator.history_store.close()
+        directory.cleanup()
+        server.close()
+        await server.wait_closed()
+
+    return True
+
+async def main():
+    """Función principal de prueba."""
+    print("🚀 Iniciando prueba del stream de Binance contra feed local")
+    print("=" * 60)
+
+    try:
+        success = await test_binance_stream_replay()
+    except AssertionError as e:
+        print(f"❌ Prueba fallida: {e}")
+        success = False
+
+    print("=" * 60)
+    print("✅ Prueba de streaming completada" if success else "❌ Algunas pruebas fallaron")
+    return success
+
+if __name__ == "__main__":
+    result = asyncio.run(main())
+    exit(0 if result else 1)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Script de prueba del endpoint /metrics de Flask con la estructura src/ de main.py.
+
+Monta el repositorio como paquete `src` (como lo despliega main.py), publica
+un snapshot con el agregador y verifica que el valor registrado aparece en
+la respuesta de /metrics: el blueprint debe servir el mismo registro que
+actualizan el agregador y los adaptadores.
+"""
+
+import os
+import sys
+import tempfile
+
+from flask import Flask
+
+def load_crypto_routes(directory: str):
+    """Importar crypto.py como src.routes.crypto, con el repositorio enlazado como `src`."""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    os.symlink(repo, os.path.join(directory, 'src'))
+    sys.path.insert(0, directory)
+    import src.crypto as routes
+    return routes
+
+def test_flask_metrics_include_aggregator_values():
+    """Un snapshot publicado por el agregador se refleja en /metrics."""
+    with tempfile.TemporaryDirectory() as directory:
+        routes = load_crypto_routes(directory)
+        app = Flask(__name__)
+        app.register_blueprint(routes.metrics_bp)
+
+        aggregator = routes.crypto_aggregator
+        aggregator.publish_snapshot({}, version=4242)
+        response = app.test_client().get('/metrics')
+
+    body = response.get_data(as_text=True)
+    assert response.status_code == 200, response.status_code
+    assert 'criptoview_snapshot_version 4242' in body, "/metrics no muestra la versión publicada por el agregador"
+    print("✅ /metrics de Flask muestra los valores registrados por el agregador")
+
+def main():
+    """Función principal de prueba."""
+    print("🚀 Iniciando prueba del endpoint /metrics de Flask")
+    print("=" * 60)
+
+    success = True
+    try:
+        test_flask_metrics_include_aggregator_values()
+    except AssertionError as e:
+        print(f"❌ Prueba fallida: {e}")
+        success = False
+
+    print("=" * 60)
+    print("✅ Prueba de métricas completada" if success else "❌ Algunas pruebas fallaron")
+    return success
+
+if __name__ == "__main__":
+    exit(0 if main() else 1)
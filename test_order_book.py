@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Script de prueba de los libros de órdenes contra un feed de profundidad local.
+
+Genera un feed sintético de Binance, KuCoin y Coinbase (el mismo formato que
+graba `replay.py record-depth`), lo reproduce con DepthManager y verifica que
+los libros coinciden con los esperados, que los diffs ya incluidos en el
+snapshot se descartan y que un hueco en la secuencia deja el libro fuera del
+consolidado hasta el siguiente snapshot.
+"""
+
+import os
+import tempfile
+
+from replay import replay_depth, synthetic_depth_feed, synthetic_symbols, write_depth_feed
+
+def replay_lines(lines: list) -> dict:
+    """Reproducir un feed en memoria a través de un fichero temporal."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'depth.ndjson')
+        write_depth_feed(path, lines)
+        return replay_depth(path)
+
+def test_depth_replay():
+    """Libros por exchange y libro consolidado a partir del feed completo."""
+    lines = synthetic_depth_feed(synthetic_symbols(3), updates=120)
+    result = replay_lines(lines)
+    manager = result['manager']
+
+    assert not result['mismatches'], f"Libros distintos de los esperados: {result['mismatches']}"
+    for exchange in ('binance', 'kucoin', 'coinbase'):
+        book = manager.books['S0'][exchange]
+        assert book.synced, f"{exchange} no está sincronizado"
+        if exchange != 'coinbase':
+            assert book.stats['stale'] > 0, f"{exchange}: no se descartaron diffs anteriores al snapshot"
+    print(f"✅ {len(manager.books)} símbolos x 3 exchanges iguales a los libros esperados")
+
+    consolidated = manager.consolidated['S0']
+    bids = [level[0] for level in consolidated['bids']]
+    asks = [level[0] for level in consolidated['asks']]
+    assert bids == sorted(bids, reverse=True) and asks == sorted(asks), "Niveles consolidados desordenados"
+    for price, quantity, sources in consolidated['bids'] + consolidated['asks']:
+        assert abs(quantity - sum(sources.values())) < 1e-9, f"Cantidad consolidada incorrecta en {price}"
+    print(f"✅ Libro consolidado S0: bid {consolidated['best_bid']} / ask {consolidated['best_ask']}")
+
+def test_depth_gap():
+    """Un diff perdido en Binance invalida su libro hasta un nuevo snapshot."""
+    lines = synthetic_depth_feed(synthetic_symbols(1), updates=120)
+    binance = [index for index, line in enumerate(lines)
+               if line['kind'] == 'message' and line['exchange'] == 'binance']
+    del lines[binance[40]]
+    result = replay_lines(lines)
+    manager = result['manager']
+
+    book = manager.books['S0']['binance']
+    assert book.stats['gaps'] == 1 and not book.synced, book.stats
+    consolidated = manager.consolidated['S0']
+    assert not consolidated['exchanges']['binance']['synced']
+    assert all('binance' not in sources for _, _, sources in consolidated['bids'] + consolidated['asks'])
+    print(f"✅ Hueco detectado: libro de Binance fuera del consolidado ({len(book.pending)} diffs en espera)")
+
+def main():
+    """Función principal de prueba."""
+    print("🚀 Iniciando prueba de los libros de órdenes contra un feed local")
+    print("=" * 60)
+
+    success = True
+    for test in (test_depth_replay, test_depth_gap):
+        try:
+            test()
+        except AssertionError as e:
+            print(f"❌ Prueba fallida: {e}")
+            success = False
+
+    print("=" * 60)
+    print("✅ Prueba de libros completada" if success else "❌ Algunas pruebas fallaron")
+    return success
+
+if __name__ == "__main__":
+    exit(0 if main() else 1)
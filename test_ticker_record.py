@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Script de prueba de la lectura tipo diccionario de ticker_record.Ticker.
+
+El ticker sustituye al diccionario que se creaba por exchange y símbolo: los
+llamadores que capturan KeyError o usan `in` y get deben comportarse igual
+que con el diccionario.
+"""
+
+from ticker_record import Ticker
+
+def make_ticker() -> Ticker:
+    return Ticker('binance', 'BTC', 67250.12, 1200.5, 1.82, 15234.7, 1700000000)
+
+def test_ticker_reads_like_dict():
+    """Campos existentes, claves inexistentes y equivalencia con el diccionario."""
+    ticker = make_ticker()
+    row = ticker.to_dict()
+
+    assert ticker['price'] == row['price'] == 67250.12
+    assert ticker.get('volume_24h') == row.get('volume_24h')
+    assert ('price' in ticker) and ('bid' not in ticker)
+    assert ticker == row and dict(ticker.items()) == row
+    print("✅ Campos leídos igual que en el diccionario")
+
+    for key in ('bid', 'items', 'to_dict', '__class__'):
+        assert key not in ticker
+        assert ticker.get(key) is None and ticker.get(key, 0) == 0
+        try:
+            ticker[key]
+        except KeyError as e:
+            assert e.args == (key,)
+        else:
+            raise AssertionError(f"ticker[{key!r}] debería lanzar KeyError")
+    print("✅ Claves inexistentes: KeyError y valor por defecto en get")
+
+def main():
+    """Función principal de prueba."""
+    print("🚀 Iniciando prueba de Ticker")
+    print("=" * 60)
+
+    success = True
+    try:
+        test_ticker_reads_like_dict()
+    except AssertionError as e:
+        print(f"❌ Prueba fallida: {e}")
+        success = False
+
+    print("=" * 60)
+    print("✅ Prueba de Ticker completada" if success else "❌ Algunas pruebas fallaron")
+    return success
+
+if __name__ == "__main__":
+    exit(0 if main() else 1)
@@ -46,7 +46,11 @@ async def test_websocket_connection():
                     if data.get('type') == 'pong':
                         print("   ✅ Pong recibido - conexión activa")
                     
-                    elif data.get('type') in ['initial_data', 'data_response', 'price_update']:
+                    elif data.get('type') == 'price_delta':
+                        changed = data.get('changed', [])
+                        print(f"   🔁 Delta seq {data.get('prev_seq')} → {data.get('seq')}: {len(changed)} símbolos cambiados")
+                    
+                    elif data.get('type') in ['initial_data', 'data_response', 'price_update', 'snapshot']:
                         crypto_data = data.get('data', [])
                         print(f"   📊 Datos de {len(crypto_data)} criptomonedas recibidos")
                         
@@ -0,0 +1,102 @@
+import json
+from typing import Dict, Iterator, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se serializa con json
+    orjson = None
+
+
+class Ticker:
+    """Ticker normalizado de un exchange para un símbolo.
+
+    Sustituye al diccionario de 7-8 claves que se creaba por exchange y
+    símbolo en cada ciclo: con __slots__ ocupa una fracción de la memoria y
+    no repite las claves en cada fila. Admite lectura como diccionario
+    (ticker['price'], ticker.get('volume_24h'), items()...), así que el resto
+    del pipeline y los datos que llegan como JSON por el feed se tratan igual.
+
+    Un ticker no se modifica una vez publicado (los snapshots lo comparten):
+    cada consulta crea uno nuevo y la caché de último valor conocido crea la
+    copia marcada como stale.
+    """
+
+    __slots__ = ('exchange', 'symbol', 'price', 'change_24h', 'change_24h_percent',
+                 'volume_24h', 'timestamp', 'stale')
+    FIELDS = __slots__
+    FIELD_SET = frozenset(FIELDS)
+
+    def __init__(self, exchange: str, symbol: str, price: float, change_24h: float,
+                 change_24h_percent: float, volume_24h: float, timestamp: int, stale: bool = False):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.price = price
+        self.change_24h = change_24h
+        self.change_24h_percent = change_24h_percent
+        self.volume_24h = volume_24h
+        self.timestamp = timestamp
+        self.stale = stale
+
+    # Lectura tipo diccionario: como en el dict al que sustituye, una clave
+    # que no es un campo lanza KeyError (y get devuelve el valor por defecto)
+    def __getitem__(self, key: str):
+        if key in self.FIELD_SET:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.FIELD_SET else default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELD_SET
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def keys(self):
+        return self.FIELDS
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.FIELDS]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (Ticker, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Ticker({self.exchange}, {self.symbol}, {self.price}, stale={self.stale})"
+
+    def to_dict(self) -> Dict:
+        return {
+            'exchange': self.exchange,
+            'symbol': self.symbol,
+            'price': self.price,
+            'change_24h': self.change_24h,
+            'change_24h_percent': self.change_24h_percent,
+            'volume_24h': self.volume_24h,
+            'timestamp': self.timestamp,
+            'stale': self.stale
+        }
+
+    def stale_copy(self) -> 'Ticker':
+        """Copia marcada como stale (último valor conocido de un exchange que no respondió)."""
+        return Ticker(self.exchange, self.symbol, self.price, self.change_24h, self.change_24h_percent,
+                      self.volume_24h, self.timestamp, True)
+
+
+def json_default(value) -> Optional[Dict]:
+    """Hook `default` de json.dumps para serializar tickers como objetos JSON."""
+    if isinstance(value, Ticker):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """Serializar a JSON (bytes) aceptando tickers; con orjson si está instalado."""
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default)
+    return json.dumps(value, default=json_default).encode()
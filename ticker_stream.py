@@ -0,0 +1,94 @@
+import json
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el módulo json estándar
+    orjson = None
+
+# Objetos JSON planos (sin objetos anidados) con campo "symbol": cada ticker de
+# Binance y KuCoin lo es, mientras que los envoltorios ({"code":..,"data":{..}}) no.
+TICKER_OBJECT = re.compile(rb'\{[^{}]*?"symbol"\s*:\s*"([^"]*)"[^{}]*\}')
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def json_loads(data: bytes):
+    """Decodificar JSON con orjson si está instalado."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class TickerStreamParser:
+    """Parser incremental de respuestas "all tickers" de los exchanges.
+
+    Recibe el cuerpo de la respuesta por trozos, localiza cada ticker (objeto
+    plano con campo "symbol") y solo decodifica los de los pares aceptados por
+    `accept`; el resto se descarta sin crear objetos Python. En memoria solo
+    queda el trozo actual más el ticker incompleto que cruza su final.
+    """
+
+    def __init__(self, accept: Callable[[str], bool]):
+        self.accept = accept
+        self.buffer = b''
+        self.items: List[Dict] = []
+        self.stats = {
+            'bytes': 0,
+            'objects': 0,
+            'decoded': 0,
+            'peak_buffer_bytes': 0,
+            'parse_ms': 0.0
+        }
+
+    def feed(self, chunk: bytes):
+        """Procesar un trozo del cuerpo de la respuesta."""
+        started = time.perf_counter()
+        buffer = self.buffer + chunk if self.buffer else chunk
+        stats = self.stats
+        stats['bytes'] += len(chunk)
+        stats['peak_buffer_bytes'] = max(stats['peak_buffer_bytes'], len(buffer))
+
+        end = 0
+        accept = self.accept
+        for match in TICKER_OBJECT.finditer(buffer):
+            end = match.end()
+            stats['objects'] += 1
+            if not accept(match.group(1).decode()):
+                continue
+            try:
+                self.items.append(json_loads(match.group()))
+                stats['decoded'] += 1
+            except ValueError:
+                continue
+
+        # Conservar solo el posible ticker incompleto del final del trozo
+        tail = buffer.rfind(b'{', end)
+        self.buffer = buffer[tail:] if tail != -1 else b''
+        stats['parse_ms'] += (time.perf_counter() - started) * 1000
+
+    def close(self) -> List[Dict]:
+        """Terminar el parseo y devolver los tickers decodificados."""
+        self.buffer = b''
+        return self.items
+
+
+async def read_tickers(response, accept: Callable[[str], bool],
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple:
+    """Leer una respuesta aiohttp en streaming y devolver (tickers, estadísticas)."""
+    parser = TickerStreamParser(accept)
+    async for chunk in response.content.iter_chunked(chunk_size):
+        parser.feed(chunk)
+    return parser.close(), parser.stats
+
+
+def parse_tickers_bytes(body: bytes, accept: Callable[[str], bool],
+                        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE) -> tuple:
+    """Variante síncrona sobre un cuerpo ya leído (benchmarks y repeticiones)."""
+    parser = TickerStreamParser(accept)
+    chunk_size = chunk_size or len(body) or 1
+    for offset in range(0, len(body), chunk_size):
+        parser.feed(body[offset:offset + chunk_size])
+    return parser.close(), parser.stats
@@ -0,0 +1,211 @@
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él se usa el cálculo por símbolo
+    np = None
+
+# Sufijo del par contra dólar por defecto (los adaptadores de exchange declaran el suyo)
+QUOTE_SUFFIXES = {
+    'binance': 'USDT',
+    'coinbase': '-USD',
+    'kucoin': '-USDT'
+}
+
+
+class SymbolIndex:
+    """Mapa símbolo <-> posición de columna y par del exchange -> símbolo base.
+
+    Sustituye el `symbol.replace(...)` más la búsqueda lineal en target_symbols
+    por una consulta O(1) a un diccionario precalculado. Con `track_all` se
+    aceptan y añaden al índice todos los pares USDT que publique el exchange.
+    """
+
+    def __init__(self, symbols: Iterable[str], pair_for: Callable[[str, str], str],
+                 track_all: bool = False, quote_suffixes: Optional[Dict[str, str]] = None):
+        self.pair_for = pair_for
+        self.track_all = track_all
+        self.quote_suffixes = quote_suffixes or QUOTE_SUFFIXES
+        self.symbols: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.pairs: Dict[str, Dict[str, str]] = {exchange: {} for exchange in self.quote_suffixes}
+        for symbol in symbols:
+            self.add(symbol)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.positions
+
+    def add(self, symbol: str) -> int:
+        """Añadir un símbolo (si no existe) y devolver su posición."""
+        position = self.positions.get(symbol)
+        if position is None:
+            position = len(self.symbols)
+            self.symbols.append(symbol)
+            self.positions[symbol] = position
+            for exchange, pairs in self.pairs.items():
+                pairs[self.pair_for(symbol, exchange)] = symbol
+        return position
+
+    def base_symbol(self, exchange: str, pair: str) -> Optional[str]:
+        """Símbolo base de un par del exchange, o None si no se sigue."""
+        symbol = self.pairs[exchange].get(pair)
+        if symbol is None and self.track_all:
+            suffix = self.quote_suffixes[exchange]
+            if pair.endswith(suffix) and len(pair) > len(suffix):
+                symbol = pair[:-len(suffix)]
+                self.add(symbol)
+        return symbol
+
+
+def summarize_prices(tickers: Iterable[Dict]) -> Dict:
+    """Promedio, VWAP, spread y número de fuentes de los tickers de un símbolo."""
+    prices = []
+    weighted = 0.0
+    volume_total = 0.0
+    for ticker in tickers:
+        price = ticker['price']
+        volume = ticker.get('volume_24h', 0)
+        prices.append(price)
+        weighted += price * volume
+        volume_total += volume
+    average = sum(prices) / len(prices)
+    return {
+        'average_price': average,
+        'vwap_price': weighted / volume_total if volume_total > 0 else average,
+        'spread_percent': (max(prices) - min(prices)) / average * 100 if average else 0.0,
+        'price_sources': len(prices)
+    }
+
+
+class VectorAggregationEngine:
+    """Agregación por columnas de los datos de todos los exchanges.
+
+    Los tickers se vuelcan a matrices exchange x símbolo y el promedio, el
+    spread entre exchanges y el precio ponderado por volumen (VWAP) se calculan
+    como operaciones vectorizadas (numpy si está instalado).
+
+    Las filas agregadas se actualizan en el sitio: cada ciclo reescribe los
+    campos del diccionario de cada símbolo (y de su mapa de exchanges) en
+    lugar de construir la estructura completa de nuevo.
+    """
+
+    def __init__(self, symbol_index: SymbolIndex, exchanges: Iterable[str]):
+        self.symbol_index = symbol_index
+        self.exchanges = list(exchanges)
+        self.capacity = 0
+        self.columns = None
+        # símbolo -> fila agregada; el diccionario devuelto por aggregate()
+        self.rows: Dict[str, Dict] = {}
+
+    def update_row(self, symbol: str, tickers: Iterable[tuple]) -> Dict:
+        """Fila agregada de un símbolo (reutilizada) con los tickers (exchange, ticker) del ciclo."""
+        row = self.rows.get(symbol)
+        if row is None:
+            row = self.rows[symbol] = {'symbol': symbol, 'exchanges': {}}
+        exchanges = row['exchanges']
+        exchanges.clear()
+        exchanges.update(tickers)
+        return row
+
+    def drop_missing(self, present: List[str]):
+        """Eliminar las filas de los símbolos que no tienen datos en este ciclo."""
+        if len(self.rows) > len(present):
+            keep = set(present)
+            for symbol in [symbol for symbol in self.rows if symbol not in keep]:
+                del self.rows[symbol]
+
+    def ensure_capacity(self, size: int):
+        """Reservar columnas para `size` símbolos (se reutilizan entre ciclos)."""
+        if size <= self.capacity and self.columns is not None:
+            return
+        self.capacity = max(size, self.capacity * 2, 32)
+        shape = (len(self.exchanges), self.capacity)
+        self.columns = {
+            'price': np.zeros(shape),
+            'volume': np.zeros(shape),
+            'present': np.zeros(shape, dtype=bool)
+        }
+
+    def aggregate(self, exchange_data: Dict[str, Dict], timestamp: Optional[int] = None) -> Dict:
+        """Combinar los datos normalizados de cada exchange en el formato agregado."""
+        timestamp = timestamp or int(time.time())
+        if np is None:
+            return self.aggregate_python(exchange_data, timestamp)
+
+        size = len(self.symbol_index)
+        self.ensure_capacity(size)
+        price = self.columns['price']
+        volume = self.columns['volume']
+        present = self.columns['present']
+        price.fill(0)
+        volume.fill(0)
+        present.fill(False)
+
+        positions = self.symbol_index.positions
+        for row, exchange in enumerate(self.exchanges):
+            for symbol, ticker in exchange_data.get(exchange, {}).items():
+                column = positions[symbol]
+                price[row, column] = ticker['price']
+                volume[row, column] = ticker.get('volume_24h', 0)
+                present[row, column] = True
+
+        price = price[:, :size]
+        volume = volume[:, :size]
+        present = present[:, :size]
+
+        counts = present.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            averages = price.sum(axis=0) / counts
+            highs = np.where(present, price, -np.inf).max(axis=0)
+            lows = np.where(present, price, np.inf).min(axis=0)
+            spreads = (highs - lows) / averages * 100
+            spreads = np.where(np.isfinite(spreads), spreads, 0.0)
+            volume_totals = volume.sum(axis=0)
+            vwaps = np.where(volume_totals > 0, (price * volume).sum(axis=0) / volume_totals, averages)
+
+        # Conversión a listas de Python una sola vez para construir la salida
+        averages = averages.tolist()
+        vwaps = vwaps.tolist()
+        spreads = spreads.tolist()
+        counts_list = counts.tolist()
+        present_rows = present.tolist()
+
+        symbols = self.symbol_index.symbols
+        present_symbols = []
+        for column in np.flatnonzero(counts).tolist():
+            symbol = symbols[column]
+            present_symbols.append(symbol)
+            row = self.update_row(symbol, (
+                (exchange, exchange_data[exchange][symbol])
+                for index, exchange in enumerate(self.exchanges) if present_rows[index][column]
+            ))
+            row['average_price'] = averages[column]
+            row['vwap_price'] = vwaps[column]
+            row['spread_percent'] = spreads[column]
+            row['price_sources'] = counts_list[column]
+            row['timestamp'] = timestamp
+        self.drop_missing(present_symbols)
+        return self.rows
+
+    def aggregate_python(self, exchange_data: Dict[str, Dict], timestamp: int) -> Dict:
+        """Misma agregación sin numpy, recorriendo solo los símbolos con datos."""
+        symbols_seen = {}
+        for exchange in self.exchanges:
+            for symbol, ticker in exchange_data.get(exchange, {}).items():
+                symbols_seen.setdefault(symbol, []).append((exchange, ticker))
+
+        present_symbols = []
+        for symbol in self.symbol_index.symbols:
+            tickers = symbols_seen.get(symbol)
+            if not tickers:
+                continue
+            row = self.update_row(symbol, tickers)
+            row.update(summarize_prices(row['exchanges'].values()))
+            row['timestamp'] = timestamp
+            present_symbols.append(symbol)
+        self.drop_missing(present_symbols)
+        return self.rows
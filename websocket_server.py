@@ -4,179 +4,399 @@ import logging
 import time
 import sys
 import os
-from typing import Dict, Set
+from collections import deque
+from typing import Dict, List, Optional, Set
 import websockets
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
 from websockets.server import serve
 
 # Agregar el directorio padre al path para importaciones
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+from alert_engine import alert_engine
 from crypto_aggregator import crypto_aggregator
+from http_api import start_http_api
+from metrics import (BROADCAST_SECONDS, CONTENT_TYPE, WS_CONNECTIONS, WS_MESSAGES_SENT, WS_QUEUE_DEPTH,
+                     WS_SLOW_CONSUMER_EVENTS, render_metrics)
+from snapshot_bus import DEFAULT_FEED_PATH, follow_shared_aggregation, run_shared_aggregation
+from price_snapshot import format_data_for_frontend, get_crypto_name
+from subscriptions import Subscription
+from wire_format import DICTIONARY, available_encodings, available_subprotocols, encoding_for_subprotocol
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Políticas ante un cliente lento cuya cola de envío está llena
+SLOW_CONSUMER_POLICIES = ('drop', 'coalesce', 'disconnect')
+# Libros consolidados a los que puede suscribirse una conexión
+MAX_BOOK_SUBSCRIPTIONS = 50
+# Margen de la cola sobre send_queue_size para los envíos no descartables
+# (snapshot inicial, libros, alertas, difusiones): cabe un libro por símbolo suscrito
+MAX_PENDING_MESSAGES = MAX_BOOK_SUBSCRIPTIONS + 32
+
+class ClientState:
+    """Estado por conexión: suscripción, cola de envío acotada y tarea escritora.
+    
+    La cola guarda snapshots (no mensajes ya calculados): el delta se calcula
+    al enviar, respecto a lo último entregado, así que descartar o fusionar
+    snapshots intermedios nunca rompe la secuencia del cliente.
+    """
+    
+    def __init__(self, websocket, manager: 'WebSocketManager'):
+        self.websocket = websocket
+        self.manager = manager
+        self.subscription = Subscription()
+        # Base del próximo delta de este cliente (depende de su filtro y ritmo)
+        self.last_snapshot = None
+        self.last_sent_at = 0.0
+        # Codificación negociada (ver wire_format) y entradas del diccionario
+        # de símbolos/exchanges que ya tiene el cliente (solo 'packed')
+        self.encoding = encoding_for_subprotocol(getattr(websocket, 'subprotocol', None))
+        self.known_dictionary = (0, 0)
+        # Propietario cuyas alertas recibe esta conexión (mensaje 'alert_subscribe')
+        self.alert_owner = None
+        # Símbolos cuyo libro consolidado recibe (mensaje 'book_subscribe')
+        self.book_symbols: Set[str] = set()
+        # Elementos: ('update', snapshot), (tipo_mensaje, snapshot), ('book', símbolo)
+        # o str ya serializado
+        self.queue = deque()
+        self.wakeup = asyncio.Event()
+        self.writer_task = asyncio.create_task(self.run_writer())
+    
+    def enqueue(self, item, droppable: bool = True):
+        """Encolar un envío aplicando la política de cliente lento.
+        
+        Un elemento descartable nunca supera `send_queue_size`: si no hay una
+        actualización pendiente que fusionar o descartar, se descarta el
+        entrante. Los no descartables (snapshot inicial, libros, alertas,
+        difusiones) tienen un margen extra; quien lo agota se desconecta.
+        """
+        manager = self.manager
+        if manager.clients.get(self.websocket) is not self:
+            # Conexión ya retirada (p. ej. desconectada por lenta)
+            return
+        is_update = isinstance(item, tuple) and item[0] == 'update'
+        if isinstance(item, tuple) and item[0] == 'book' and item in self.queue:
+            # El libro se lee al enviar: basta con que esté pendiente una vez
+            return
+        if droppable and manager.slow_consumer_policy == 'coalesce' and is_update:
+            # Solo importa el snapshot más reciente: sustituir el que esté pendiente
+            for index, queued in enumerate(self.queue):
+                if isinstance(queued, tuple) and queued[0] == 'update':
+                    self.queue[index] = item
+                    manager.stats['coalesced_messages'] += 1
+                    return
+        
+        limit = manager.send_queue_size if droppable else manager.send_queue_size + MAX_PENDING_MESSAGES
+        if len(self.queue) >= limit:
+            if manager.slow_consumer_policy == 'disconnect' or not droppable:
+                manager.stats['slow_disconnects'] += 1
+                logger.warning("Cliente lento desconectado: cola de envío llena")
+                manager.disconnect(self.websocket, 1013, 'slow consumer')
+                return
+            evicted = False
+            if manager.slow_consumer_policy == 'drop':
+                # Descartar la actualización intermedia más antigua
+                for queued in self.queue:
+                    if isinstance(queued, tuple) and queued[0] == 'update':
+                        self.queue.remove(queued)
+                        evicted = True
+                        break
+            manager.stats['dropped_messages'] += 1
+            if not evicted:
+                # Nada que descartar en la cola: se pierde el entrante
+                return
+        
+        self.queue.append(item)
+        self.wakeup.set()
+    
+    def render(self, item) -> List:
+        """Convertir un elemento de la cola en los mensajes a enviar (ninguno si no hay cambios)."""
+        if isinstance(item, str):
+            return [item]
+        if item[0] == 'book':
+            # Libro consolidado más reciente del símbolo (JSON en todas las codificaciones)
+            message = crypto_aggregator.depth.book_message(item[1])
+            return [message] if message else []
+        message_type, snapshot = item
+        encoding = self.encoding
+        if message_type != 'update':
+            message = snapshot.message(message_type, self.subscription, encoding)
+        elif self.last_snapshot is None or not self.manager.delta_updates:
+            message = snapshot.message('price_update', self.subscription, encoding)
+        else:
+            message = snapshot.delta_message(self.last_snapshot, self.subscription, encoding)
+        if message is None:
+            return []
+        self.last_snapshot = snapshot
+        if encoding == 'packed':
+            # Antes de la trama, las entradas del diccionario que el cliente aún no tiene
+            dictionary_frame = DICTIONARY.frame_since(self.known_dictionary)
+            if dictionary_frame is not None:
+                self.known_dictionary = DICTIONARY.size
+                return [dictionary_frame, message]
+        return [message]
+    
+    async def run_writer(self):
+        """Enviar en orden los elementos de la cola de este cliente."""
+        try:
+            while True:
+                if not self.queue:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                for message in self.render(self.queue.popleft()):
+                    await self.websocket.send(message)
+                    WS_MESSAGES_SENT.inc()
+        except websockets.exceptions.ConnectionClosed:
+            self.manager.remove_connection(self.websocket)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error enviando mensaje a WebSocket: {e}")
+            self.manager.remove_connection(self.websocket)
+
 class WebSocketManager:
     """Gestor de conexiones WebSocket para transmisión de datos en tiempo real."""
     
-    def __init__(self):
+    def __init__(self, send_queue_size: int = 8, slow_consumer_policy: str = 'coalesce'):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Política de cliente lento desconocida: {slow_consumer_policy}")
         self.connections: Set[websockets.WebSocketServerProtocol] = set()
+        self.clients: Dict[websockets.WebSocketServerProtocol, ClientState] = {}
+        # Índice símbolo -> clientes suscritos; los que no filtran símbolos van aparte
+        self.symbol_index: Dict[str, Set[websockets.WebSocketServerProtocol]] = {}
+        self.wildcard_clients: Set[websockets.WebSocketServerProtocol] = set()
+        # Clientes que se saltaron una actualización por su max_rate
+        self.pending_clients: Set[websockets.WebSocketServerProtocol] = set()
+        # Propietario de reglas de alerta -> conexiones que reciben sus alertas
+        self.alert_owners: Dict[str, Set[websockets.WebSocketServerProtocol]] = {}
+        # Símbolo -> conexiones suscritas a su libro consolidado
+        self.book_index: Dict[str, Set[websockets.WebSocketServerProtocol]] = {}
         self.is_running = False
+        # Último snapshot difundido: base de los deltas y de los datos iniciales
+        self.last_snapshot = None
+        self.delta_updates = True
+        self.send_queue_size = send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.stats = {
+            'dropped_messages': 0,
+            'coalesced_messages': 0,
+            'slow_disconnects': 0,
+            'last_broadcast_seconds': 0.0
+        }
         
     async def register(self, websocket):
         """Registrar una nueva conexión WebSocket."""
         self.connections.add(websocket)
+        client = ClientState(websocket, self)
+        self.clients[websocket] = client
+        self.wildcard_clients.add(websocket)
+        crypto_aggregator.report_clients('websocket', len(self.connections))
         logger.info(f"Nueva conexión WebSocket registrada. Total: {len(self.connections)}")
         
         # Enviar datos iniciales al cliente recién conectado
-        try:
-            initial_data = crypto_aggregator.get_latest_data()
-            if initial_data:
-                await websocket.send(json.dumps({
-                    'type': 'initial_data',
-                    'data': self.format_data_for_frontend(initial_data),
-                    'timestamp': int(time.time())
-                }))
-        except Exception as e:
-            logger.error(f"Error enviando datos iniciales: {e}")
+        snapshot = self.current_snapshot()
+        if snapshot.data:
+            client.enqueue(('initial_data', snapshot), droppable=False)
     
     async def unregister(self, websocket):
         """Desregistrar una conexión WebSocket."""
-        self.connections.discard(websocket)
+        self.remove_connection(websocket)
         logger.info(f"Conexión WebSocket desregistrada. Total: {len(self.connections)}")
     
-    async def broadcast(self, message: dict):
-        """Enviar un mensaje a todas las conexiones activas."""
+    def remove_connection(self, websocket):
+        """Olvidar una conexión cerrada (idempotente)."""
+        self.connections.discard(websocket)
+        self.remove_client(websocket)
+        crypto_aggregator.report_clients('websocket', len(self.connections))
+    
+    def disconnect(self, websocket, code: int, reason: str):
+        """Cerrar una conexión desde el servidor sin bloquear la difusión."""
+        self.remove_connection(websocket)
+        asyncio.create_task(websocket.close(code, reason))
+    
+    def remove_client(self, websocket):
+        """Eliminar el estado y las entradas de índice de una conexión."""
+        client = self.clients.pop(websocket, None)
+        if client:
+            self.unindex(client)
+            self.set_alert_owner(client, None)
+            self.set_book_symbols(client, set())
+            if client.writer_task is not asyncio.current_task():
+                client.writer_task.cancel()
+        self.pending_clients.discard(websocket)
+    
+    def unindex(self, client: ClientState):
+        symbols = client.subscription.symbols
+        if symbols is None:
+            self.wildcard_clients.discard(client.websocket)
+            return
+        for symbol in symbols:
+            subscribers = self.symbol_index.get(symbol)
+            if subscribers:
+                subscribers.discard(client.websocket)
+                if not subscribers:
+                    del self.symbol_index[symbol]
+    
+    def set_subscription(self, websocket, subscription: Subscription) -> ClientState:
+        """Sustituir la suscripción de un cliente y reindexarlo."""
+        client = self.clients[websocket]
+        self.unindex(client)
+        client.subscription = subscription
+        if subscription.symbols is None:
+            self.wildcard_clients.add(websocket)
+        else:
+            for symbol in subscription.symbols:
+                self.symbol_index.setdefault(symbol, set()).add(websocket)
+        return client
+    
+    def set_alert_owner(self, client: ClientState, owner: Optional[str]):
+        """Asociar la conexión a un propietario de reglas de alerta (None para desasociar)."""
+        if client.alert_owner is not None:
+            websockets_of_owner = self.alert_owners.get(client.alert_owner)
+            if websockets_of_owner:
+                websockets_of_owner.discard(client.websocket)
+                if not websockets_of_owner:
+                    del self.alert_owners[client.alert_owner]
+        client.alert_owner = owner
+        if owner is not None:
+            self.alert_owners.setdefault(owner, set()).add(client.websocket)
+    
+    def set_book_symbols(self, client: ClientState, symbols: Set[str]):
+        """Sustituir los símbolos cuyo libro consolidado recibe una conexión."""
+        for symbol in client.book_symbols - symbols:
+            subscribers = self.book_index.get(symbol)
+            if subscribers:
+                subscribers.discard(client.websocket)
+                if not subscribers:
+                    del self.book_index[symbol]
+        for symbol in symbols - client.book_symbols:
+            self.book_index.setdefault(symbol, set()).add(client.websocket)
+            # Estado actual del libro como punto de partida
+            if crypto_aggregator.depth.book_message(symbol):
+                client.enqueue(('book', symbol), droppable=False)
+        client.book_symbols = symbols
+    
+    def publish_books(self, batch: Dict):
+        """Callback del bus de profundidad: encolar los libros que cambiaron para sus suscriptores."""
+        for symbol in batch['books']:
+            for websocket in self.book_index.get(symbol, ()):
+                client = self.clients.get(websocket)
+                if client:
+                    client.enqueue(('book', symbol), droppable=False)
+    
+    def push_alert(self, event: Dict):
+        """Enviar una alerta disparada a las conexiones de su propietario."""
+        websockets_of_owner = self.alert_owners.get(event['owner'])
+        if not websockets_of_owner:
+            return
+        message_str = json.dumps({'type': 'alert', 'alert': event, 'timestamp': int(time.time())})
+        for websocket in list(websockets_of_owner):
+            client = self.clients.get(websocket)
+            if client:
+                client.enqueue(message_str, droppable=False)
+    
+    async def send_snapshot(self, websocket, message_type: str):
+        """Enviar el snapshot actual completo, filtrado por la suscripción del cliente."""
+        client = self.clients[websocket]
+        client.enqueue((message_type, self.current_snapshot()), droppable=False)
+        client.last_sent_at = time.monotonic()
+    
+    async def broadcast(self, message):
+        """Enviar un mensaje (dict o JSON ya serializado) a todas las conexiones activas."""
         if not self.connections:
             return
         
-        message_str = json.dumps(message)
-        disconnected = set()
+        message_str = message if isinstance(message, str) else json.dumps(message)
+        for client in list(self.clients.values()):
+            client.enqueue(message_str, droppable=False)
+    
+    def get_fanout_metrics(self) -> Dict:
+        """Métricas de la difusión: profundidad de colas, descartes y duración."""
+        depths = [len(client.queue) for client in self.clients.values()]
+        return {
+            'connections': len(self.connections),
+            'queue_depth_max': max(depths, default=0),
+            'queue_depth_avg': sum(depths) / len(depths) if depths else 0,
+            **self.stats
+        }
+    
+    def current_snapshot(self):
+        """Snapshot coherente con la secuencia de deltas ya difundida."""
+        return self.last_snapshot or crypto_aggregator.get_snapshot()
+    
+    async def publish_snapshot(self, snapshot):
+        """Difundir un snapshot nuevo a los clientes afectados por sus cambios.
+        
+        Cada cliente recibe un delta respecto al último snapshot que se le
+        entregó, filtrado por su suscripción. Los mensajes se cachean en el
+        snapshot, así que clientes con el mismo filtro comparten los bytes.
+        Aquí solo se encola: los envíos los hacen las tareas escritoras de
+        cada conexión en paralelo, y un cliente lento no retrasa a los demás.
+        """
+        previous = self.last_snapshot
+        self.last_snapshot = snapshot
         
-        for websocket in self.connections.copy():
-            try:
-                await websocket.send(message_str)
-            except websockets.exceptions.ConnectionClosed:
-                disconnected.add(websocket)
-            except Exception as e:
-                logger.error(f"Error enviando mensaje a WebSocket: {e}")
-                disconnected.add(websocket)
+        if previous is None or not self.delta_updates:
+            candidates = set(self.clients)
+        else:
+            candidates = self.wildcard_clients | self.pending_clients
+            for symbol in snapshot.changed_symbols(previous):
+                candidates |= self.symbol_index.get(symbol, set())
         
-        # Limpiar conexiones desconectadas
-        for websocket in disconnected:
-            self.connections.discard(websocket)
+        started = time.perf_counter()
+        now = time.monotonic()
+        for websocket in candidates:
+            client = self.clients.get(websocket)
+            if client is None:
+                continue
+            if now - client.last_sent_at < client.subscription.min_interval:
+                self.pending_clients.add(websocket)
+                continue
+            self.pending_clients.discard(websocket)
+            client.last_sent_at = now
+            # El delta se calcula en la tarea escritora, respecto a lo último entregado
+            client.enqueue(('update', snapshot))
         
-        if disconnected:
-            logger.info(f"Limpiadas {len(disconnected)} conexiones desconectadas")
+        self.stats['last_broadcast_seconds'] = time.perf_counter() - started
+        BROADCAST_SECONDS.observe(self.stats['last_broadcast_seconds'])
     
     def format_data_for_frontend(self, crypto_data: Dict) -> list:
         """Formatear datos de criptomonedas para el frontend."""
-        formatted_data = []
-        
-        for symbol, symbol_data in crypto_data.items():
-            # Usar el precio de Binance como principal, o el promedio si no está disponible
-            primary_price = symbol_data['average_price']
-            primary_change_24h = 0
-            primary_change_24h_percent = 0
-            
-            # Priorizar Binance para datos principales
-            if 'binance' in symbol_data['exchanges']:
-                binance_data = symbol_data['exchanges']['binance']
-                primary_price = binance_data['price']
-                primary_change_24h = binance_data['change_24h']
-                primary_change_24h_percent = binance_data['change_24h_percent']
-            elif 'kucoin' in symbol_data['exchanges']:
-                kucoin_data = symbol_data['exchanges']['kucoin']
-                primary_price = kucoin_data['price']
-                primary_change_24h = kucoin_data['change_24h']
-                primary_change_24h_percent = kucoin_data['change_24h_percent']
-            elif 'coinbase' in symbol_data['exchanges']:
-                coinbase_data = symbol_data['exchanges']['coinbase']
-                primary_price = coinbase_data['price']
-                primary_change_24h = coinbase_data['change_24h']
-                primary_change_24h_percent = coinbase_data['change_24h_percent']
-            
-            formatted_data.append({
-                'symbol': symbol,
-                'name': self.get_crypto_name(symbol),
-                'price': primary_price,
-                'change_24h': primary_change_24h,
-                'change_24h_percent': primary_change_24h_percent,
-                'exchanges': symbol_data['exchanges'],
-                'price_sources': symbol_data['price_sources'],
-                'timestamp': symbol_data['timestamp']
-            })
-        
-        # Ordenar por precio (aproximación de capitalización de mercado)
-        formatted_data.sort(key=lambda x: x['price'], reverse=True)
-        return formatted_data
+        return format_data_for_frontend(crypto_data)
     
     def get_crypto_name(self, symbol: str) -> str:
         """Obtener el nombre completo de la criptomoneda."""
-        names = {
-            'BTC': 'Bitcoin',
-            'ETH': 'Ethereum',
-            'BNB': 'BNB',
-            'XRP': 'XRP',
-            'ADA': 'Cardano',
-            'SOL': 'Solana',
-            'DOGE': 'Dogecoin',
-            'DOT': 'Polkadot',
-            'MATIC': 'Polygon',
-            'LTC': 'Litecoin',
-            'SHIB': 'Shiba Inu',
-            'TRX': 'TRON',
-            'AVAX': 'Avalanche',
-            'UNI': 'Uniswap',
-            'ATOM': 'Cosmos',
-            'LINK': 'Chainlink',
-            'XMR': 'Monero',
-            'ETC': 'Ethereum Classic',
-            'BCH': 'Bitcoin Cash',
-            'NEAR': 'NEAR Protocol',
-            'APT': 'Aptos',
-            'QNT': 'Quant',
-            'ICP': 'Internet Computer',
-            'FIL': 'Filecoin',
-            'VET': 'VeChain',
-            'HBAR': 'Hedera',
-            'ALGO': 'Algorand',
-            'MANA': 'Decentraland',
-            'SAND': 'The Sandbox',
-            'AXS': 'Axie Infinity'
-        }
-        return names.get(symbol, symbol)
+        return get_crypto_name(symbol)
     
     async def start_data_streaming(self):
         """Iniciar el streaming de datos en tiempo real."""
         self.is_running = True
         logger.info("Iniciando streaming de datos WebSocket...")
         
-        while self.is_running:
-            try:
-                # Obtener datos actualizados
-                await crypto_aggregator.aggregate_data()
-                latest_data = crypto_aggregator.get_latest_data()
-                
-                if latest_data and self.connections:
-                    # Formatear y enviar datos a todos los clientes
-                    formatted_data = self.format_data_for_frontend(latest_data)
-                    message = {
-                        'type': 'price_update',
-                        'data': formatted_data,
-                        'timestamp': int(time.time())
-                    }
+        # Los datos llegan del bucle de agregación compartido, no se consulta a los exchanges aquí
+        snapshots = crypto_aggregator.bus.subscribe_queue()
+        
+        try:
+            while self.is_running:
+                try:
+                    snapshot = await snapshots.get()
                     
-                    await self.broadcast(message)
-                    logger.info(f"Datos enviados a {len(self.connections)} conexiones")
-                
-                # Esperar 10 segundos antes de la siguiente actualización
-                await asyncio.sleep(10)
-                
-            except Exception as e:
-                logger.error(f"Error en streaming de datos: {e}")
-                await asyncio.sleep(5)  # Esperar menos tiempo en caso de error
+                    if snapshot.data:
+                        # El mensaje se serializa una vez por snapshot y se reutiliza para todos
+                        await self.publish_snapshot(snapshot)
+                        if self.connections:
+                            logger.info(
+                                f"Snapshot {snapshot.version} encolado para {len(self.connections)} conexiones "
+                                f"en {self.stats['last_broadcast_seconds'] * 1000:.1f} ms"
+                            )
+                    
+                except Exception as e:
+                    logger.error(f"Error en streaming de datos: {e}")
+        finally:
+            crypto_aggregator.bus.unsubscribe(snapshots.callback)
     
     def stop_streaming(self):
         """Detener el streaming de datos."""
@@ -186,6 +406,67 @@ class WebSocketManager:
 # Instancia global del gestor WebSocket
 ws_manager = WebSocketManager()
 
+# Las métricas de conexiones y colas se leen del gestor al exportarlas
+WS_CONNECTIONS.set_function(lambda: len(ws_manager.connections))
+WS_QUEUE_DEPTH.set_function(lambda: {
+    'max': ws_manager.get_fanout_metrics()['queue_depth_max'],
+    'total': sum(len(client.queue) for client in ws_manager.clients.values())
+})
+WS_SLOW_CONSUMER_EVENTS.set_function(lambda: {
+    'dropped': ws_manager.stats['dropped_messages'],
+    'coalesced': ws_manager.stats['coalesced_messages'],
+    'disconnected': ws_manager.stats['slow_disconnects']
+})
+
+async def process_request(path, request_headers):
+    """Servir /metrics por HTTP en el mismo puerto; el resto continúa el handshake WebSocket."""
+    if path.split('?', 1)[0] == '/metrics':
+        return 200, [('Content-Type', CONTENT_TYPE)], render_metrics()
+    return None
+
+async def handle_alert_message(websocket, data: Dict):
+    """Mensajes de alertas: alert_subscribe, alert_create, alert_delete y alert_list.
+    
+    El propietario va ligado a la conexión y lo fija el servidor: alert_subscribe
+    con 'token' (firmado, ver AlertEngine.owner_token) acredita a su propietario;
+    sin token se crea uno anónimo y se devuelve su token para reutilizarlo. El
+    'owner' que envíe el cliente se ignora. Las reglas que crea la conexión son
+    de su propietario y las alertas disparadas le llegan como {'type': 'alert', ...}.
+    """
+    client = ws_manager.clients[websocket]
+    message_type = data['type']
+    owner = client.alert_owner
+    try:
+        if message_type == 'alert_subscribe':
+            if data.get('token'):
+                owner = alert_engine.verify_token(data['token'])
+                if owner is None:
+                    raise ValueError("Token de alertas no válido")
+            elif owner is None:
+                owner = alert_engine.new_owner()
+            ws_manager.set_alert_owner(client, owner)
+            response = {'type': 'alerts', 'token': alert_engine.owner_token(owner),
+                        'rules': alert_engine.list_rules(owner), 'events': alert_engine.list_events(owner)}
+        elif owner is None:
+            raise ValueError("Conexión sin propietario de alertas (enviar antes alert_subscribe)")
+        elif message_type == 'alert_create':
+            rule = alert_engine.add_rule(owner, data.get('symbol', ''), data.get('kind', 'price'),
+                                         data.get('direction', 'above'), data['threshold'],
+                                         window=data.get('window'), once=data.get('once', True))
+            response = {'type': 'alert_created', 'rule': rule}
+        elif message_type == 'alert_delete':
+            response = {'type': 'alert_deleted', 'id': data.get('id'),
+                        'deleted': alert_engine.delete_rule(owner, int(data.get('id', 0)))}
+        elif message_type == 'alert_list':
+            response = {'type': 'alerts', 'rules': alert_engine.list_rules(owner),
+                        'events': alert_engine.list_events(owner, int(data.get('limit', 50)))}
+        else:
+            raise ValueError(f"Mensaje de alertas desconocido: {message_type}")
+    except (KeyError, TypeError, ValueError) as e:
+        response = {'type': 'error', 'error': f"Alerta no válida: {e}"}
+    response['timestamp'] = int(time.time())
+    await websocket.send(json.dumps(response))
+
 async def websocket_handler(websocket, path):
     """Manejador principal de conexiones WebSocket."""
     await ws_manager.register(websocket)
@@ -202,15 +483,77 @@ async def websocket_handler(websocket, path):
                         'type': 'pong',
                         'timestamp': int(time.time())
                     }))
-                elif data.get('type') == 'request_data':
-                    # Cliente solicita datos actuales
-                    current_data = crypto_aggregator.get_latest_data()
-                    if current_data:
+                elif data.get('type') == 'hello':
+                    # Negociar la codificación de los mensajes de datos
+                    encoding = data.get('encoding', 'json')
+                    if encoding not in available_encodings():
                         await websocket.send(json.dumps({
-                            'type': 'data_response',
-                            'data': ws_manager.format_data_for_frontend(current_data),
+                            'type': 'error',
+                            'error': f"Codificación no soportada: {encoding}",
+                            'encodings': available_encodings(),
                             'timestamp': int(time.time())
                         }))
+                        continue
+                    ws_manager.clients[websocket].encoding = encoding
+                    await websocket.send(json.dumps({
+                        'type': 'hello',
+                        'encoding': encoding,
+                        'encodings': available_encodings(),
+                        'timestamp': int(time.time())
+                    }))
+                    # Nueva base en la codificación elegida
+                    if ws_manager.current_snapshot().data:
+                        await ws_manager.send_snapshot(websocket, 'snapshot')
+                elif data.get('type') in ('book_subscribe', 'book_unsubscribe'):
+                    # Libros consolidados top-N de los símbolos indicados
+                    client = ws_manager.clients[websocket]
+                    symbols = {str(symbol).upper() for symbol in data.get('symbols') or ()}
+                    if data['type'] == 'book_subscribe':
+                        symbols |= client.book_symbols
+                    else:
+                        symbols = client.book_symbols - symbols if symbols else set()
+                    if len(symbols) > MAX_BOOK_SUBSCRIPTIONS:
+                        await websocket.send(json.dumps({
+                            'type': 'error',
+                            'error': f"Máximo {MAX_BOOK_SUBSCRIPTIONS} libros por conexión",
+                            'timestamp': int(time.time())
+                        }))
+                        continue
+                    await websocket.send(json.dumps({
+                        'type': 'book_subscribed',
+                        'symbols': sorted(symbols),
+                        'depth': crypto_aggregator.depth.depth,
+                        'timestamp': int(time.time())
+                    }))
+                    ws_manager.set_book_symbols(client, symbols)
+                elif str(data.get('type', '')).startswith('alert_'):
+                    await handle_alert_message(websocket, data)
+                elif data.get('type') == 'request_data':
+                    # Cliente solicita datos actuales
+                    if ws_manager.current_snapshot().data:
+                        await ws_manager.send_snapshot(websocket, 'data_response')
+                elif data.get('type') == 'resync':
+                    # El cliente detectó un hueco en la secuencia de deltas
+                    if ws_manager.current_snapshot().data:
+                        await ws_manager.send_snapshot(websocket, 'snapshot')
+                elif data.get('type') in ('subscribe', 'unsubscribe'):
+                    # Filtro por símbolos, exchanges, campos y ritmo máximo
+                    client = ws_manager.clients[websocket]
+                    if data['type'] == 'subscribe':
+                        subscription = Subscription.from_message(data)
+                    elif data.get('symbols'):
+                        subscription = client.subscription.without_symbols(data['symbols'])
+                    else:
+                        subscription = Subscription()
+                    ws_manager.set_subscription(websocket, subscription)
+                    await websocket.send(json.dumps({
+                        'type': 'subscribed',
+                        'subscription': subscription.describe(),
+                        'timestamp': int(time.time())
+                    }))
+                    # Nueva base para los deltas con el filtro actualizado
+                    if ws_manager.current_snapshot().data:
+                        await ws_manager.send_snapshot(websocket, 'snapshot')
                         
             except json.JSONDecodeError:
                 logger.warning("Mensaje WebSocket inválido recibido")
@@ -224,19 +567,80 @@ async def websocket_handler(websocket, path):
     finally:
         await ws_manager.unregister(websocket)
 
-async def start_websocket_server(host='0.0.0.0', port=8765):
-    """Iniciar el servidor WebSocket."""
-    logger.info(f"Iniciando servidor WebSocket en {host}:{port}")
+def compression_options(deflate: bool = True, window_bits: Optional[int] = None,
+                        mem_level: Optional[int] = None) -> Dict:
+    """Argumentos de serve() para permessage-deflate.
+    
+    Sin ajustes se usa la configuración por defecto de websockets; con
+    window_bits/mem_level más bajos cada conexión reserva menos memoria para
+    el compresor (a costa de algo de ratio), lo que compensa con miles de clientes.
+    """
+    if not deflate:
+        return {'compression': None}
+    if window_bits is None and mem_level is None:
+        return {'compression': 'deflate'}
+    compress_settings = {'memLevel': mem_level} if mem_level is not None else None
+    return {
+        'compression': None,
+        'extensions': [ServerPerMessageDeflateFactory(
+            server_max_window_bits=window_bits,
+            client_max_window_bits=window_bits,
+            compress_settings=compress_settings
+        )]
+    }
+
+async def start_websocket_server(host='0.0.0.0', port=8765, exchange_stream=True,
+                                 reuse_port=False, follow_only=False, feed_path=DEFAULT_FEED_PATH,
+                                 api_port: Optional[int] = 8766, deflate: bool = True,
+                                 deflate_window_bits: Optional[int] = None,
+                                 deflate_mem_level: Optional[int] = None, depth_stream: bool = True):
+    """Iniciar el servidor WebSocket (y la API REST en api_port, salvo que sea None).
+    
+    Con reuse_port varios procesos pueden escuchar en el mismo puerto (SO_REUSEPORT)
+    y con follow_only el proceso solo consume el feed de snapshots, sin agregar.
+    Los clientes eligen la codificación con un subprotocolo o un mensaje 'hello'
+    (ver wire_format); deflate y deflate_* ajustan permessage-deflate. Con
+    depth_stream el proceso líder ingiere los libros de órdenes de los exchanges.
+    """
+    logger.info(f"Iniciando servidor WebSocket en {host}:{port} (pid {os.getpid()})")
     
     # Inicializar el agregador de datos
-    await crypto_aggregator.init_session()
+    if not follow_only:
+        await crypto_aggregator.init_session()
     
     # Iniciar el servidor WebSocket
-    server = await serve(websocket_handler, host, port)
+    server = await serve(websocket_handler, host, port, reuse_port=reuse_port,
+                         process_request=process_request, subprotocols=available_subprotocols(),
+                         **compression_options(deflate, deflate_window_bits, deflate_mem_level))
+    # Sin conexiones todavía: el agregador puede sondear a la cadencia de reposo
+    crypto_aggregator.report_clients('websocket', 0)
+    # La API REST comparte el loop y el snapshot con el servidor WebSocket
+    api_runner = None
+    if api_port is not None:
+        api_runner = await start_http_api(host, api_port, reuse_port=reuse_port)
+    
+    # Las reglas de alerta se evalúan con cada snapshot publicado en este proceso
+    try:
+        alert_engine.start(crypto_aggregator.bus, on_alert=ws_manager.push_alert)
+    except Exception as e:
+        logger.error(f"Error iniciando el motor de alertas: {e}")
+    
+    # Libros consolidados (propios o recibidos del líder por el feed)
+    crypto_aggregator.depth.bus.subscribe(ws_manager.publish_books)
     
     # Iniciar el streaming de datos en segundo plano
     streaming_task = asyncio.create_task(ws_manager.start_data_streaming())
     
+    if follow_only:
+        aggregation_task = asyncio.create_task(follow_shared_aggregation(crypto_aggregator, feed_path))
+    else:
+        # Bucle de agregación compartido con el resto de procesos (p. ej. la API Flask).
+        # Con exchange_stream, el líder además mantiene el stream push de Binance.
+        aggregation_task = asyncio.create_task(
+            run_shared_aggregation(crypto_aggregator, 10, feed_path, exchange_stream=exchange_stream,
+                                   depth_stream=depth_stream)
+        )
+    
     logger.info("Servidor WebSocket iniciado exitosamente")
     
     try:
@@ -247,7 +651,15 @@ async def start_websocket_server(host='0.0.0.0', port=8765):
     finally:
         ws_manager.stop_streaming()
         streaming_task.cancel()
+        aggregation_task.cancel()
+        crypto_aggregator.bus.unsubscribe(alert_engine.on_snapshot)
+        crypto_aggregator.depth.bus.unsubscribe(ws_manager.publish_books)
+        alert_engine.close()
+        if api_runner:
+            await api_runner.cleanup()
         await crypto_aggregator.close_session()
+        # Escribir los ciclos pendientes del histórico antes de salir
+        await asyncio.get_running_loop().run_in_executor(None, crypto_aggregator.history_store.close)
         server.close()
         await server.wait_closed()
 
@@ -0,0 +1,247 @@
+"""
+Codificaciones del feed WebSocket de CriptoView.
+
+- 'json': mensajes de texto JSON (por defecto).
+- 'msgpack': los mismos mensajes en MessagePack (si el paquete msgpack está instalado).
+- 'packed': tramas binarias por columnas con los campos de precio de cada fila
+  como float64 y los símbolos/exchanges como identificadores numéricos de un
+  diccionario que se envía una sola vez (y por incrementos si crece).
+
+El cliente elige la codificación con el subprotocolo WebSocket
+(criptoview.json / criptoview.msgpack / criptoview.packed) o con un mensaje
+{'type': 'hello', 'encoding': ...}. Los mensajes de control (pong,
+subscribed, hello...) siguen siendo texto JSON en todas las codificaciones.
+
+Trama 'packed' (little-endian):
+    cabecera   FRAME_HEADER: b'CV', versión, tipo, seq, prev_seq, timestamp,
+               nº de filas, nº de exchanges, nº de símbolos eliminados
+    u16[e]     id de cada exchange (orden de las columnas por exchange)
+    u32[n]     id de símbolo de cada fila
+    f64[n] x 4 price, change_24h, change_24h_percent, spread_percent
+    u8[n] x 2  price_sources, price_flags (bits de PRICE_FLAGS)
+    f64[n] x e precio de cada exchange (NaN si no cotiza)
+    u32[r]     ids de los símbolos eliminados (solo en deltas)
+Trama de diccionario (tipo KIND_DICTIONARY): DICTIONARY_HEADER con el primer
+id y el número de símbolos y de exchanges nuevos, seguido de sus nombres en
+UTF-8 separados por '\\n' (primero los símbolos y después los exchanges).
+"""
+
+import math
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from ticker_record import json_default
+
+try:
+    import msgpack
+except ImportError:  # msgpack es opcional: sin él no se ofrece esa codificación
+    msgpack = None
+
+SUBPROTOCOLS = {
+    'criptoview.json': 'json',
+    'criptoview.msgpack': 'msgpack',
+    'criptoview.packed': 'packed'
+}
+
+MAGIC = b'CV'
+VERSION = 1
+FRAME_HEADER = struct.Struct('<2sBBIIIIBI')
+DICTIONARY_HEADER = struct.Struct('<2sBBIIHH')
+
+# Tipos de trama 'packed'
+MESSAGE_KINDS = {
+    'initial_data': 1,
+    'price_update': 2,
+    'data_response': 3,
+    'snapshot': 4,
+    'price_delta': 5
+}
+KIND_DICTIONARY = 6
+
+PRICE_COLUMNS = ('price', 'change_24h', 'change_24h_percent', 'spread_percent')
+PRICE_FLAGS = ('wide_spread', 'outlier', 'single_source', 'stale')
+
+# array() usa el orden de bytes nativo: se normaliza a little-endian
+BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def available_encodings() -> List[str]:
+    return [encoding for encoding in SUBPROTOCOLS.values() if encoding != 'msgpack' or msgpack is not None]
+
+
+def available_subprotocols() -> List[str]:
+    """Subprotocolos que ofrece el servidor, del preferido al menos preferido."""
+    encodings = available_encodings()
+    preferred = sorted(SUBPROTOCOLS, key=lambda name: ('packed', 'msgpack', 'json').index(SUBPROTOCOLS[name]))
+    return [name for name in preferred if SUBPROTOCOLS[name] in encodings]
+
+
+def encoding_for_subprotocol(subprotocol: Optional[str]) -> str:
+    return SUBPROTOCOLS.get(subprotocol, 'json')
+
+
+def to_bytes(values: array) -> bytes:
+    if BIG_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class SymbolDictionary:
+    """Ids de símbolos y exchanges para las tramas 'packed'; solo crece.
+
+    Los ids son globales al proceso, así que todos los clientes comparten las
+    tramas ya codificadas; cada cliente solo guarda cuántas entradas conoce.
+    """
+
+    def __init__(self):
+        self.symbols: List[str] = []
+        self.symbol_ids: Dict[str, int] = {}
+        self.exchanges: List[str] = []
+        self.exchange_ids: Dict[str, int] = {}
+        self._frames: Dict[Tuple[int, int], bytes] = {}
+
+    def symbol_id(self, symbol: str) -> int:
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return symbol_id
+
+    def exchange_id(self, exchange: str) -> int:
+        exchange_id = self.exchange_ids.get(exchange)
+        if exchange_id is None:
+            exchange_id = self.exchange_ids[exchange] = len(self.exchanges)
+            self.exchanges.append(exchange)
+        return exchange_id
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return len(self.symbols), len(self.exchanges)
+
+    def frame_since(self, known: Tuple[int, int]) -> Optional[bytes]:
+        """Trama con las entradas que un cliente aún no conoce (None si conoce todas)."""
+        symbol_start, exchange_start = known
+        if (symbol_start, exchange_start) == self.size:
+            return None
+        key = (symbol_start, exchange_start) + self.size
+        if key not in self._frames:
+            symbols = self.symbols[symbol_start:]
+            exchanges = self.exchanges[exchange_start:]
+            self._frames[key] = DICTIONARY_HEADER.pack(
+                MAGIC, VERSION, KIND_DICTIONARY, symbol_start, len(symbols), exchange_start, len(exchanges)
+            ) + '\n'.join(symbols + exchanges).encode()
+        return self._frames[key]
+
+
+# Diccionario compartido por todas las conexiones del proceso
+DICTIONARY = SymbolDictionary()
+
+
+def flags_mask(flags: List[str]) -> int:
+    mask = 0
+    for bit, flag in enumerate(PRICE_FLAGS):
+        if flag in flags:
+            mask |= 1 << bit
+    return mask
+
+
+def pack_rows(message_type: str, seq: int, prev_seq: int, timestamp: int, rows: List[Dict],
+              removed: List[str] = (), dictionary: SymbolDictionary = DICTIONARY) -> bytes:
+    """Codificar filas formateadas (o proyectadas) como trama 'packed'."""
+    exchanges = sorted({exchange for row in rows for exchange in row.get('exchanges', ())})
+    nan = math.nan
+    symbol_ids = array('I', [dictionary.symbol_id(row['symbol']) for row in rows])
+    columns = [array('d', [row.get(column, nan) for row in rows]) for column in PRICE_COLUMNS]
+    sources = array('B', [min(row.get('price_sources', 0), 255) for row in rows])
+    flags = array('B', [flags_mask(row.get('price_flags', ())) for row in rows])
+    exchange_prices = []
+    for exchange in exchanges:
+        prices = []
+        for row in rows:
+            ticker = row.get('exchanges', {}).get(exchange)
+            prices.append(ticker['price'] if ticker is not None else nan)
+        exchange_prices.append(array('d', prices))
+
+    parts = [
+        FRAME_HEADER.pack(MAGIC, VERSION, MESSAGE_KINDS[message_type], seq, prev_seq, timestamp,
+                          len(rows), len(exchanges), len(removed)),
+        to_bytes(array('H', [dictionary.exchange_id(exchange) for exchange in exchanges])),
+        to_bytes(symbol_ids)
+    ]
+    parts.extend(to_bytes(column) for column in columns)
+    parts.append(sources.tobytes())
+    parts.append(flags.tobytes())
+    parts.extend(to_bytes(prices) for prices in exchange_prices)
+    parts.append(to_bytes(array('I', [dictionary.symbol_id(symbol) for symbol in removed])))
+    return b''.join(parts)
+
+
+def pack_msgpack(payload: Dict) -> bytes:
+    return msgpack.packb(payload, default=json_default, use_bin_type=True)
+
+
+class PackedDecoder:
+    """Decodificador de referencia de las tramas 'packed' (para clientes y pruebas)."""
+
+    def __init__(self):
+        self.symbols: List[str] = []
+        self.exchanges: List[str] = []
+
+    def read(self, fmt: str, data: bytes, offset: int, count: int) -> Tuple[array, int]:
+        values = array(fmt)
+        size = values.itemsize * count
+        values.frombytes(data[offset:offset + size])
+        if BIG_ENDIAN and values.itemsize > 1:
+            values.byteswap()
+        return values, offset + size
+
+    def decode(self, data: bytes) -> Optional[Dict]:
+        """Decodificar una trama; las de diccionario devuelven None."""
+        if data[2:4] == bytes((VERSION, KIND_DICTIONARY)):
+            _, _, _, symbol_start, symbols, exchange_start, exchanges = DICTIONARY_HEADER.unpack_from(data)
+            names = data[DICTIONARY_HEADER.size:].decode().split('\n') if symbols + exchanges else []
+            del self.symbols[symbol_start:]
+            self.symbols.extend(names[:symbols])
+            del self.exchanges[exchange_start:]
+            self.exchanges.extend(names[symbols:])
+            return None
+
+        _, _, kind, seq, prev_seq, timestamp, count, exchange_count, removed_count = FRAME_HEADER.unpack_from(data)
+        offset = FRAME_HEADER.size
+        exchange_ids, offset = self.read('H', data, offset, exchange_count)
+        symbol_ids, offset = self.read('I', data, offset, count)
+        columns = {}
+        for column in PRICE_COLUMNS:
+            columns[column], offset = self.read('d', data, offset, count)
+        sources, offset = self.read('B', data, offset, count)
+        flags, offset = self.read('B', data, offset, count)
+        exchange_prices = {}
+        for exchange_id in exchange_ids:
+            exchange_prices[self.exchanges[exchange_id]], offset = self.read('d', data, offset, count)
+        removed, offset = self.read('I', data, offset, removed_count)
+
+        rows = []
+        for index, symbol_id in enumerate(symbol_ids):
+            row = {'symbol': self.symbols[symbol_id]}
+            for column in PRICE_COLUMNS:
+                row[column] = columns[column][index]
+            row['price_sources'] = sources[index]
+            row['price_flags'] = [flag for bit, flag in enumerate(PRICE_FLAGS) if flags[index] & (1 << bit)]
+            row['exchanges'] = {
+                exchange: {'price': prices[index]}
+                for exchange, prices in exchange_prices.items() if not math.isnan(prices[index])
+            }
+            rows.append(row)
+
+        message_type = next(name for name, code in MESSAGE_KINDS.items() if code == kind)
+        return {
+            'type': message_type,
+            'seq': seq,
+            'prev_seq': prev_seq,
+            'timestamp': timestamp,
+            'rows': rows,
+            'removed': [self.symbols[symbol_id] for symbol_id in removed]
+        }